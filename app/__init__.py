@@ -0,0 +1,5 @@
+# Read .env before any module looks at its settings. This only reads a file;
+# clients and connections are created lazily in the app lifespan.
+from dotenv import load_dotenv
+
+load_dotenv()
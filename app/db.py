@@ -1,14 +1,66 @@
 # app/db.py
-import motor.motor_asyncio
 import os
-from dotenv import load_dotenv
 
-load_dotenv() 
+DB_NAME = os.getenv("MONGO_DB_NAME", "krishimitra")
 
-MONGO_URL = os.getenv("MONGO_URL")
+_client = None
+_generation = 0
 
-if not MONGO_URL:
-    raise Exception("MONGO_URL environment variable not set")
 
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
-db = client.krishimitra
+def get_client():
+    """
+    Create the Motor client on first use, i.e. inside the worker process after any fork,
+    instead of at import time.
+    """
+    global _client
+    if _client is None:
+        import motor.motor_asyncio
+        from app.services.metrics import MongoCommandTimer
+
+        mongo_url = os.getenv("MONGO_URL")
+        if not mongo_url:
+            raise Exception("MONGO_URL environment variable not set")
+        _client = motor.motor_asyncio.AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandTimer()])
+    return _client
+
+
+def close_client():
+    global _client, _generation
+    if _client is not None:
+        _client.close()
+        _client = None
+        _generation += 1
+
+
+class LazyCollection:
+    """Stands in for a Motor collection and resolves it on first attribute access."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collection = None
+        self._generation = -1
+
+    def __getattr__(self, attr):
+        if self._collection is None or self._generation != _generation:
+            self._collection = get_client()[DB_NAME][self.name]
+            self._generation = _generation
+        return getattr(self._collection, attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+class LazyDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> LazyCollection:
+        if name not in self._collections:
+            self._collections[name] = LazyCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, attr):
+        return getattr(get_client()[DB_NAME], attr)
+
+
+db = LazyDatabase()
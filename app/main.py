@@ -1,32 +1,134 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.routers import (
     weather, market, crop, disease, soil, farmer, assistant, auth,
-    schemes, community
+    schemes, community, dashboard, metrics, sync
 )
+from app.db import close_client
+from app.services.http_client import init_http_clients, close_http_clients
+from app.services.indexes import ensure_indexes
+from app.services.market_ingest import market_ingest_job
+from app.services.weather_snapshots import weather_precompute_job, precompute_stats
+from app.services.answer_cache import answer_cache
+from app.services.hashing import hashing_pool
+from app.services.inference import disease_batcher
+from app.routers.community import posts_search, community_collection, replies_collection
+from app.routers.farmer import farmers_collection
+from app.services.schemes_sync import SCHEMES_COLLECTION, schemes_search, schemes_sync_job, backfill_scheme_keys
+from app.services.delta_sync import backfill_versions
+from app.services.responses import CompactJSONResponse, CompactResponseMiddleware
+from app.services.events import community_events
+from app.services.llm import BACKEND as ASSISTANT_BACKEND
+from app.services.settings import feature_status, log_missing_features
+from app.services.metrics import MetricsMiddleware, loop_lag_monitor, register_cache, register_stats
+from app.services.principal_cache import principal_cache
+from app.services.soil_cache import soil_cache_stats
+from app.routers.weather import weather_cache
+from app.services.ratelimit import RateLimitMiddleware
+from app.services.resilience import UpstreamUnavailable, breaker_status, unavailable_response
 
-app = FastAPI(title="KrishiMitra", version="1.0")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def _skipped_features():
+    return ("assistant",) if ASSISTANT_BACKEND == "fake" else ()
+
+
+def _register_metrics():
+    register_cache("weather", weather_cache.stats)
+    register_cache("soil", soil_cache_stats)
+    register_cache("assistant_answers", answer_cache.stats)
+    register_cache("principals", principal_cache.stats)
+    register_stats("hashing", hashing_pool.stats)
+    register_stats("disease_inference", disease_batcher.stats)
+    register_stats("community_events", community_events.stats)
+    register_stats("weather_precompute", precompute_stats)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_missing_features(_skipped_features())
+    features = feature_status(_skipped_features())
+    await init_http_clients()
+    loop_lag_monitor.start()
+    await community_events.start()
+    disease_batcher.start()
+    if features["database"]:
+        await ensure_indexes()
+        await answer_cache.load()
+        await posts_search.start()
+        await schemes_search.start()
+        await backfill_scheme_keys()
+        await backfill_versions([SCHEMES_COLLECTION, community_collection, replies_collection, farmers_collection])
+        schemes_sync_job.start()
+        if features["market"]:
+            market_ingest_job.start()
+        if features["weather"]:
+            weather_precompute_job.start()
+    yield
+    await community_events.stop()
+    await market_ingest_job.stop()
+    await weather_precompute_job.stop()
+    await schemes_sync_job.stop()
+    await disease_batcher.stop()
+    await close_http_clients()
+    await loop_lag_monitor.stop()
+    hashing_pool.shutdown()
+    close_client()
+
+
+def create_app() -> FastAPI:
+    """
+    Build the application. Creating it opens no connections; database, HTTP clients,
+    worker pools and background jobs are started in the lifespan.
+    """
+    app = FastAPI(title="KrishiMitra", version="1.0", lifespan=lifespan, default_response_class=CompactJSONResponse)
+
+    # Innermost, so it sees the app's own responses: fields, ETags/304 and compression.
+    app.add_middleware(CompactResponseMiddleware)
+    # Inside CORS so 429/503 answers still carry CORS headers.
+    app.add_middleware(RateLimitMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Added last so it wraps everything else and times the whole request.
+    app.add_middleware(MetricsMiddleware)
+    _register_metrics()
+
+    app.include_router(auth.router, prefix="/auth", tags=["Auth"])
+    app.include_router(weather.router, prefix="/weather", tags=["Weather"])
+    app.include_router(market.router, prefix="/market", tags=["Market"])
+    app.include_router(crop.router, prefix="/crop", tags=["Crop Recommendation"])
+    app.include_router(disease.router, prefix="/disease", tags=["Disease Detection"])
+    app.include_router(soil.router, prefix="/soil", tags=["Soil Data"])
+    app.include_router(farmer.router, prefix="/farmer", tags=["Farmer Input"])
+    app.include_router(assistant.router, prefix="/assistant", tags=["AI Assistant"])
+    app.include_router(schemes.router, prefix="/schemes", tags=["Government Schemes"])
+    app.include_router(community.router, prefix="/community", tags=["Community"])
+    app.include_router(dashboard.router, prefix="/dashboard", tags=["Dashboard"])
+    app.include_router(sync.router, prefix="/sync", tags=["Sync"])
+    app.include_router(metrics.router, tags=["Metrics"])
+
+    @app.get("/")
+    def root():
+        return {"message": "KrishiMitra backend is running!"}
+
+    @app.exception_handler(UpstreamUnavailable)
+    async def upstream_unavailable(request: Request, error: UpstreamUnavailable):
+        # Circuit open or quota exhausted somewhere below a route that does not handle it.
+        response = unavailable_response(error)
+        return JSONResponse({"detail": response.detail}, status_code=response.status_code, headers=response.headers)
+
+    @app.get("/health")
+    def health():
+        """Which features are configured (unconfigured ones answer 503) and upstream circuit states."""
+        return {"status": "ok", "features": feature_status(_skipped_features()), "upstreams": breaker_status()}
+
+    return app
+
 
-app.include_router(auth.router, prefix="/auth", tags=["Auth"])
-app.include_router(weather.router, prefix="/weather", tags=["Weather"])
-app.include_router(market.router, prefix="/market", tags=["Market"])
-app.include_router(crop.router, prefix="/crop", tags=["Crop Recommendation"])
-app.include_router(disease.router, prefix="/disease", tags=["Disease Detection"])
-app.include_router(soil.router, prefix="/soil", tags=["Soil Data"])
-app.include_router(farmer.router, prefix="/farmer", tags=["Farmer Input"])
-app.include_router(assistant.router, prefix="/assistant", tags=["AI Assistant"])
-app.include_router(schemes.router, prefix="/schemes", tags=["Government Schemes"])
-app.include_router(community.router, prefix="/community", tags=["Community"])
-
-
-@app.get("/")
-def root():
-    return {"message": "KrishiMitra backend is running!"}
+app = create_app()
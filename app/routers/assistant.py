@@ -1,32 +1,59 @@
 from fastapi import APIRouter, HTTPException
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
+from app.services.answer_cache import answer_cache
+from app.services.llm import get_chat_backend, llm_slot
+from app.services.sse import sse_event, SSE_HEADERS
 
-load_dotenv()
 router = APIRouter()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in .env file")
-client = OpenAI(api_key=OPENAI_API_KEY)
 
 @router.post("/ask")
 async def ask_ai(query: str):
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are KrishiMitra, an AI assistant for farmers. Answer simply and in Hindi if farmer asks in Hindi."},
-                {"role": "user", "content": query}
-            ],
-            temperature=0.6,
-            max_tokens=200
-        )
-
-        answer = response.choices[0].message.content
-        return {"query": query, "answer": answer}
+        cached = await answer_cache.lookup(query)
+        if cached is not None:
+            return {"query": query, "answer": cached, "cached": True}
 
+        async with llm_slot():
+            answer = await get_chat_backend().complete(query)
+        await answer_cache.store(query, answer)
+        return {"query": query, "answer": answer, "cached": False}
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/ask/stream")
+async def ask_ai_stream(query: str):
+    """Stream the answer as server-sent events: one `data` event per token, then `done`."""
+
+    async def events():
+        answer = []
+        try:
+            cached = await answer_cache.lookup(query)
+            if cached is not None:
+                yield sse_event({"token": cached})
+                yield sse_event({"query": query, "answer": cached, "cached": True}, event="done")
+                return
+
+            async with llm_slot():
+                async for token in get_chat_backend().stream(query):
+                    answer.append(token)
+                    yield sse_event({"token": token})
+            await answer_cache.store(query, "".join(answer))
+            yield sse_event({"query": query, "answer": "".join(answer), "cached": False}, event="done")
+        except HTTPException as e:
+            yield sse_event({"detail": e.detail}, event="error")
+        except Exception as e:
+            yield sse_event({"detail": str(e)}, event="error")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/cache/stats")
+async def answer_cache_stats():
+    """Hit rate, lookup latency and upstream calls saved by the answer cache."""
+    return answer_cache.stats()
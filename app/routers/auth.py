@@ -1,22 +1,27 @@
 from fastapi import APIRouter, HTTPException, Depends, Header, status
-from passlib.context import CryptContext
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 from app.db import db
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from pydantic import BaseModel, EmailStr
+from app.services.hashing import hashing_pool, hash_password, check_password
+from app.services.principal_cache import principal_cache
 import os
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 SECRET_KEY = os.getenv("JWT_SECRET", "supersecretkey")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+ADMIN_ROLE = "admin"
 
 users_collection = db["users"]
 
+# Fields handlers read from the current user; the password hash is never loaded.
+# `role` (e.g. "field_agent", "admin") is only ever set in the database, never at signup.
+PRINCIPAL_PROJECTION = {"name": 1, "email": 1, "phone": 1, "language": 1, "role": 1}
+
 
 class UserSignup(BaseModel):
     name: str
@@ -34,11 +39,11 @@ class Token(BaseModel):
     token_type: str
 
 
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
+async def get_password_hash(password: str):
+    return await hashing_pool.run(hash_password, password)
 
-def verify_password(password: str, hashed_password: str):
-    return pwd_context.verify(password, hashed_password)
+async def verify_password(password: str, hashed_password: str):
+    return await hashing_pool.run(check_password, password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: int = ACCESS_TOKEN_EXPIRE_MINUTES):
     to_encode = data.copy()
@@ -52,20 +57,45 @@ async def get_current_user(token: str):
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
+        user = principal_cache.get(user_id)
+        if user is not None:
+            return user
+        user = await users_collection.find_one({"_id": ObjectId(user_id)}, PRINCIPAL_PROJECTION)
         if not user:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
         user["_id"] = str(user["_id"])
+        principal_cache.set(user_id, user, payload.get("exp"))
         return user
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+def invalidate_user(user_id: str):
+    """
+    Call after any write that updates or deletes a user document, so this worker stops
+    using the old principal at once. The API itself never changes users (roles are set in
+    the database); other workers, and changes made outside the API, are bounded by the
+    cache TTL: PRINCIPAL_CACHE_ROLE_TTL (10 s) for admins and field agents,
+    PRINCIPAL_CACHE_TTL (60 s) for everyone else.
+    """
+    principal_cache.invalidate(str(user_id))
+
 async def get_current_user_from_token(authorization: str = Header(...)):
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
     token = authorization.split(" ")[1]
     return await get_current_user(token)
 
+def require_role(*roles: str):
+    """Dependency admitting only authenticated users whose `role` is one of `roles`."""
+    async def current_user_with_role(user=Depends(get_current_user_from_token)):
+        if user.get("role") not in roles:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Your account may not do this")
+        return user
+    return current_user_with_role
+
+# Operational endpoints: job triggers that spend upstream quota, and metrics.
+require_admin = require_role(ADMIN_ROLE)
+
 @router.post("/signup", status_code=201)
 async def signup(user: UserSignup):
     """Register a new farmer"""
@@ -74,18 +104,33 @@ async def signup(user: UserSignup):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     user_dict = user.dict()
-    user_dict["password"] = get_password_hash(user.password)
+    user_dict["password"] = await get_password_hash(user.password)
     user_dict["created_at"] = datetime.utcnow()
 
-    result = await users_collection.insert_one(user_dict)
+    try:
+        result = await users_collection.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     return {"message": "User created successfully", "id": str(result.inserted_id)}
 
 @router.post("/login", response_model=Token)
 async def login(credentials: UserLogin):
     """Login farmer and return JWT token"""
     user = await users_collection.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user["password"]):
+    if not user or not await verify_password(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     token = create_access_token({"sub": str(user["_id"])})
     return {"access_token": token, "token_type": "bearer"}
+
+
+@router.get("/hashing/stats")
+async def hashing_stats():
+    """Password hashing pool utilisation and queue depth"""
+    return hashing_pool.stats()
+
+
+@router.get("/principals/stats")
+async def principal_cache_stats():
+    """Hit and miss counters of the authenticated-user cache"""
+    return principal_cache.stats()
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Path
+from fastapi import APIRouter, Depends, HTTPException, Body, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
@@ -6,19 +7,30 @@ from bson import ObjectId
 
 from app.db import db
 from app.routers.auth import get_current_user_from_token
-from app.services.crud import insert_document, find_documents
+from app.services.crud import (
+    insert_document, iter_documents, keyset_page, convert_objectid, stream_ndjson, wants_ndjson
+)
+from app.services.delta_sync import current_version, stamp
+from app.services.events import community_events, CLOSED
+from app.services.responses import not_modified
+from app.services.search import SearchIndex
+from app.services.sse import sse_event, SSE_HEADERS
 
 router = APIRouter()
 community_collection = db["community_posts"]
+replies_collection = db["community_replies"]
 
-def convert_objectid(obj):
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    if isinstance(obj, list):
-        return [convert_objectid(o) for o in obj]
-    if isinstance(obj, dict):
-        return {k: convert_objectid(v) for k, v in obj.items()}
-    return obj
+# Feed documents never carry reply bodies; those are paged from community_replies.
+FEED_PROJECTION = {"replies": 0}
+HEARTBEAT_SECONDS = 15
+
+# Posts are searched on title and content; reply text counts towards its post.
+posts_search = SearchIndex(
+    community_collection,
+    ["title", "content"],
+    related=(replies_collection, "post_id", "message"),
+    projection=FEED_PROJECTION,
+)
 
 
 class CommunityPost(BaseModel):
@@ -56,16 +68,47 @@ async def create_post(
         "title": data.title,
         "content": data.content,
         "created_at": datetime.utcnow(),
-        "replies": []
+        "reply_count": 0,
+        **await stamp(community_collection.name)
     }
     post_id = await insert_document(community_collection, post)
+    posts_search.index_document(post)
+    await community_events.publish({"type": "post", "post": convert_objectid(post)})
     return {"message": "Post created", "id": str(post_id)}
 
-@router.get("/all", summary="Get All Posts", description="Get the 100 most recent community posts")
-async def get_posts():
-    """Get all community posts"""
-    posts = await find_documents(community_collection, {}, limit=100)
-    return [convert_objectid(post) for post in posts]
+@router.get(
+    "/all",
+    summary="Get Posts",
+    description="Newest community posts first, paginated with `cursor`. "
+                "Send `Accept: application/x-ndjson` to stream every post instead. "
+                "Answers 304 to `If-None-Match` while no post has changed; `/sync/posts` returns only the changes."
+)
+async def get_posts(
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page")
+):
+    """Get a page of community posts without their replies"""
+    unchanged = not_modified(request, response, await current_version(community_collection.name))
+    if unchanged is not None:
+        return unchanged
+    if wants_ndjson(request):
+        return stream_ndjson(iter_documents(
+            community_collection, {}, FEED_PROJECTION, sort=[("created_at", -1), ("_id", -1)]
+        ))
+    posts, next_cursor = await keyset_page(
+        community_collection, {}, limit, cursor, descending=True, projection=FEED_PROJECTION
+    )
+    return {"posts": posts, "next_cursor": next_cursor}
+
+@router.get("/search", summary="Search Posts", description="Ranked full-text search over post titles, content and replies")
+async def search_posts(
+    q: str = Query(..., min_length=2, description="Search text, Hindi or English"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000)
+):
+    return await posts_search.search(q, limit, offset)
 
 @router.post("/reply/{post_id}", summary="Reply to a Post", description="Authenticated user replies to a community post")
 async def reply_post(
@@ -79,19 +122,60 @@ async def reply_post(
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid post ID")
 
-    post = await community_collection.find_one({"_id": post_obj_id})
-    if not post:
+    result = await community_collection.update_one(
+        {"_id": post_obj_id}, {"$inc": {"reply_count": 1}, "$set": await stamp(community_collection.name)}
+    )
+    if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Post not found")
 
     new_reply = {
+        "post_id": post_obj_id,
         "user_id": str(user["_id"]),
         "name": user.get("name"),
         "message": reply.message,
-        "created_at": datetime.utcnow()
+        "created_at": datetime.utcnow(),
+        **await stamp(replies_collection.name)
     }
 
-    await community_collection.update_one(
-        {"_id": post_obj_id},
-        {"$push": {"replies": new_reply}}
-    )
+    await insert_document(replies_collection, new_reply)
+    posts_search.index_related(post_obj_id, reply.message)
+    await community_events.publish({"type": "reply", "post_id": post_id, "reply": convert_objectid(new_reply)})
     return {"message": "Reply added"}
+
+
+@router.get("/{post_id}/replies", summary="Get Replies", description="Replies to a post, oldest first, paginated with `cursor`")
+async def get_replies(
+    post_id: str = Path(..., description="ID of the post"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page")
+):
+    try:
+        post_obj_id = ObjectId(post_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid post ID")
+
+    replies, next_cursor = await keyset_page(
+        replies_collection, {"post_id": post_obj_id}, limit, cursor, descending=False
+    )
+    return {"replies": replies, "next_cursor": next_cursor}
+
+
+@router.get("/stream", summary="Live Feed", description="Server-sent events for new posts and replies")
+async def stream_feed():
+    subscriber = community_events.subscribe()
+
+    async def events():
+        try:
+            while True:
+                event = await subscriber.next(timeout=HEARTBEAT_SECONDS)
+                if event is CLOSED:
+                    yield sse_event({"detail": "Subscriber too slow, reconnect"}, event="closed")
+                    return
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_event(event, event=event["type"])
+        finally:
+            community_events.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -1,15 +1,116 @@
-from fastapi import APIRouter
+import asyncio
+import json
+import logging
+import math
+import os
+import httpx
+from fastapi import APIRouter, HTTPException, Query, Request
+from app.routers.soil import fetch_soil_properties
+from app.services import crop_model
+from app.services.crud import stream_ndjson, wants_ndjson
+from app.services.resilience import UpstreamUnavailable
+from app.services.soil_cache import get_soil_properties
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_PLOTS = int(os.getenv("CROP_MAX_BATCH_PLOTS", "100000"))
+# How long a recommendation waits for SoilGrids before ranking without pH and clay.
+SOIL_TIMEOUT = float(os.getenv("CROP_SOIL_TIMEOUT", "2"))
+
+
+def _optional_float(value):
+    return math.nan if value is None else float(value)
+
+
+def parse_plots(body: bytes, ndjson: bool):
+    """Decode a JSON array or NDJSON body into column lists, rejecting malformed rows with 422."""
+    try:
+        if ndjson:
+            plots = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            plots = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid JSON: {e}")
+    if not isinstance(plots, list):
+        raise HTTPException(status_code=422, detail="Expected a JSON array of plots")
+    if len(plots) > MAX_BATCH_PLOTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_PLOTS} plots per request")
+
+    columns = {"id": [], "soil_type": [], "season": [], "rainfall": [], "ph": [], "clay_percent": []}
+    for row, plot in enumerate(plots):
+        try:
+            columns["id"].append(plot.get("id", row))
+            columns["soil_type"].append(plot["soil_type"])
+            columns["season"].append(plot["season"])
+            columns["rainfall"].append(float(plot["rainfall"]))
+            columns["ph"].append(_optional_float(plot.get("ph")))
+            columns["clay_percent"].append(_optional_float(plot.get("clay_percent")))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=f"Plot {row}: invalid or missing field {e}")
+    return columns
+
+
+def recommend_plots(columns: dict, top_k: int):
+    indices, scores = crop_model.recommend(
+        columns["soil_type"], columns["season"], columns["rainfall"],
+        columns["ph"], columns["clay_percent"], top_k=top_k,
+    )
+    results = []
+    for plot_id, crop_indices, crop_scores in zip(columns["id"], indices.tolist(), scores.tolist()):
+        ranking = crop_model.ranked(crop_indices, crop_scores)
+        results.append({"id": plot_id, "recommended_crop": ranking[0]["crop"], "ranked": ranking})
+    return results
+
 
 @router.post("/recommend")
-async def recommend_crop(soil_type: str, rainfall: float, season: str):
+async def recommend_crop(soil_type: str, rainfall: float, season: str,
+                         ph: float | None = None, clay_percent: float | None = None,
+                         lat: float | None = None, lon: float | None = None,
+                         top_k: int = Query(3, ge=1, le=len(crop_model.CROPS))):
     """
-    Mock AI Crop Recommendation (replace with ML model later).
+    Rank crops by suitability for soil type, season and seasonal rainfall (mm).
+    pH and clay % refine the ranking; pass them directly, or pass lat/lon to take them
+    from the cached SoilGrids data for that location.
     """
-    if soil_type == "loamy" and season == "kharif":
-        return {"recommended_crop": "Rice"}
-    elif soil_type == "clay" and season == "rabi":
-        return {"recommended_crop": "Wheat"}
-    else:
-        return {"recommended_crop": "Maize"}
+    if lat is not None and lon is not None and (ph is None or clay_percent is None):
+        try:
+            soil = await asyncio.wait_for(get_soil_properties(lat, lon, fetch_soil_properties), SOIL_TIMEOUT)
+            soil_ph, soil_clay = crop_model.soil_features(soil)
+        except (asyncio.TimeoutError, UpstreamUnavailable, HTTPException, httpx.HTTPError) as e:
+            # Soil data only refines the ranking; unknown pH and clay are scored as NaN.
+            logger.warning("Soil data unavailable for crop recommendation at %s,%s: %r", lat, lon, e)
+            soil_ph, soil_clay = None, None
+        ph = soil_ph if ph is None else ph
+        clay_percent = soil_clay if clay_percent is None else clay_percent
+
+    indices, scores = crop_model.recommend(
+        [soil_type], [season], [rainfall], [_optional_float(ph)], [_optional_float(clay_percent)], top_k=top_k
+    )
+    ranking = crop_model.ranked(indices[0], scores[0])
+    return {"recommended_crop": ranking[0]["crop"], "ranked": ranking}
+
+
+@router.post("/recommend/batch")
+async def recommend_crops_batch(request: Request, top_k: int = Query(3, ge=1, le=len(crop_model.CROPS))):
+    """
+    Rank crops for many plots in one vectorized pass.
+    Body: a JSON array, or NDJSON (Content-Type: application/x-ndjson), of
+    {id?, soil_type, season, rainfall, ph?, clay_percent?}. Send Accept: application/x-ndjson
+    to receive results as NDJSON.
+    """
+    ndjson = "application/x-ndjson" in request.headers.get("content-type", "")
+    body = await request.body()
+
+    def run():
+        return recommend_plots(parse_plots(body, ndjson), top_k)
+
+    results = await asyncio.to_thread(run)
+
+    if wants_ndjson(request):
+        async def rows():
+            for result in results:
+                yield result
+
+        return stream_ndjson(rows(), transform=lambda result: result)
+    return {"count": len(results), "results": results}
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pymongo import DESCENDING
+from app.routers.auth import get_current_user_from_token
+from app.routers.farmer import farmers_collection
+from app.routers.market import get_market_price
+from app.routers.soil import fetch_soil_properties
+from app.routers.weather import get_weather, normalize_city, weather_cache
+from app.services.crud import find_documents
+from app.services.schemes_sync import SCHEMES_COLLECTION, SYNC_INTERVAL
+from app.services.soil_cache import get_soil_properties
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Per-section deadlines in seconds. A section that misses its deadline is reported as
+# missing; weather and soil lookups keep running in the background and fill their caches,
+# so the next dashboard load gets them.
+TIMEOUTS = {
+    "weather": float(os.getenv("DASHBOARD_WEATHER_TIMEOUT", "2")),
+    "soil": float(os.getenv("DASHBOARD_SOIL_TIMEOUT", "2")),
+    "market": float(os.getenv("DASHBOARD_MARKET_TIMEOUT", "2")),
+    "schemes": float(os.getenv("DASHBOARD_SCHEMES_TIMEOUT", "1")),
+}
+MAX_CROPS = int(os.getenv("DASHBOARD_MAX_CROPS", "5"))
+SCHEMES_LIMIT = int(os.getenv("DASHBOARD_SCHEMES_LIMIT", "5"))
+MARKET_STALE_DAYS = int(os.getenv("DASHBOARD_MARKET_STALE_DAYS", "7"))
+
+
+class MissingInput(Exception):
+    """The profile lacks what a section needs (e.g. no city for weather)."""
+
+
+def _first(profile: dict, *fields):
+    for field in fields:
+        if profile.get(field) not in (None, ""):
+            return profile[field]
+    return None
+
+
+def profile_crops(profile: dict):
+    crops = _first(profile, "crops", "crop") or []
+    if isinstance(crops, str):
+        crops = crops.split(",")
+    return [c.strip() for c in crops if isinstance(c, str) and c.strip()][:MAX_CROPS]
+
+
+async def weather_section(city):
+    if not city:
+        raise MissingInput("no city in profile")
+    data = await get_weather(city)
+    age = weather_cache.age(normalize_city(city))
+    return data, age is not None and age > weather_cache.ttl
+
+
+async def soil_section(lat, lon):
+    if lat is None or lon is None:
+        raise MissingInput("no coordinates in profile")
+    properties = await get_soil_properties(float(lat), float(lon), fetch_soil_properties)
+    return {"latitude": lat, "longitude": lon, "soil_properties": properties}, False
+
+
+async def market_section(crops):
+    if not crops:
+        raise MissingInput("no crops in profile")
+    prices = await asyncio.gather(*[get_market_price(crop) for crop in crops], return_exceptions=True)
+    cutoff = datetime.utcnow() - timedelta(days=MARKET_STALE_DAYS)
+    data, stale = [], False
+    for crop, price in zip(crops, prices):
+        if isinstance(price, Exception) or "price" not in price:
+            data.append({"crop": crop, "price": None})
+            stale = True
+            continue
+        if price["date"] and datetime.strptime(price["date"], "%d/%m/%Y") < cutoff:
+            stale = True
+        data.append(price)
+    return data, stale
+
+
+async def schemes_section():
+    schemes = await find_documents(
+        SCHEMES_COLLECTION, {}, limit=SCHEMES_LIMIT, sort=[("last_synced", DESCENDING)]
+    )
+    synced = [s["last_synced"] for s in schemes if isinstance(s.get("last_synced"), datetime)]
+    stale = bool(synced) and datetime.utcnow() - max(synced) > timedelta(seconds=2 * SYNC_INTERVAL)
+    return schemes, stale
+
+
+async def run_section(name: str, coroutine):
+    """Await one section under its deadline; never raises."""
+    started = time.perf_counter()
+    section = {"status": "ok", "data": None}
+    try:
+        section["data"], stale = await asyncio.wait_for(coroutine, TIMEOUTS[name])
+        if stale:
+            section["status"] = "stale"
+    except MissingInput as e:
+        section.update(status="missing", error=str(e))
+    except asyncio.TimeoutError:
+        section.update(status="missing", error=f"timed out after {TIMEOUTS[name]}s")
+    except HTTPException as e:
+        section.update(status="missing", error=e.detail)
+    except Exception as e:
+        logger.warning("Dashboard section %s failed: %r", name, e)
+        section.update(status="missing", error="upstream error")
+    section["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return name, section
+
+
+@router.get("")
+async def get_dashboard(
+    user=Depends(get_current_user_from_token),
+    city: str | None = Query(None, description="Override the profile city"),
+    lat: float | None = Query(None, description="Override the profile latitude"),
+    lon: float | None = Query(None, description="Override the profile longitude"),
+    crops: str | None = Query(None, description="Override the profile crops, comma-separated"),
+):
+    """
+    Everything the app's home screen needs in one round-trip: farmer profile, weather,
+    soil, market prices for the farmer's crops and recent schemes.
+    Sources are queried concurrently, each with its own deadline; every section reports
+    status "ok", "stale" or "missing", and a slow source only empties its own section.
+    """
+    profile = await farmers_collection.find_one({"user_id": user["_id"]})
+    if profile is None and not (city or crops or (lat is not None and lon is not None)):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    profile = profile or {}
+    if "_id" in profile:
+        profile["_id"] = str(profile["_id"])
+
+    sections = dict(await asyncio.gather(
+        run_section("weather", weather_section(city or _first(profile, "city", "location", "district"))),
+        run_section("soil", soil_section(
+            lat if lat is not None else _first(profile, "lat", "latitude"),
+            lon if lon is not None else _first(profile, "lon", "longitude"),
+        )),
+        run_section("market", market_section(profile_crops({"crops": crops} if crops else profile))),
+        run_section("schemes", schemes_section()),
+    ))
+    return {
+        "profile": profile or None,
+        "sections": sections,
+        "complete": all(section["status"] == "ok" for section in sections.values()),
+    }
@@ -1,10 +1,30 @@
-from fastapi import APIRouter, UploadFile
+from fastapi import APIRouter, HTTPException, UploadFile
+from app.services.disease_model import TREATMENTS
+from app.services.inference import disease_batcher, read_upload
+from app.services.settings import require_key
 
 router = APIRouter()
 
 @router.post("/detect")
 async def detect_disease(file: UploadFile):
     """
-    Mock plant disease detection (replace with ML image model later).
+    Detect plant disease from a leaf photo.
+    Images are decoded and classified in batches on a CPU process pool.
+    Answers 503 until a trained model is configured with DISEASE_MODEL_PATH.
     """
-    return {"disease": "Leaf Rust", "treatment": "Use fungicide XYZ"}
+    require_key("disease")
+    data = await read_upload(file)
+    prediction = await disease_batcher.submit(data)
+    if "error" in prediction:
+        raise HTTPException(status_code=400, detail=prediction["error"])
+    return {
+        "disease": prediction["disease"],
+        "confidence": prediction["confidence"],
+        "treatment": TREATMENTS.get(prediction["disease"], "Consult your local agriculture officer")
+    }
+
+
+@router.get("/stats")
+async def inference_stats():
+    """Batching and queue statistics of the inference pipeline"""
+    return disease_batcher.stats()
@@ -1,6 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.routers.auth import get_current_user_from_token
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from app.routers.auth import ADMIN_ROLE, get_current_user_from_token, require_role
 from app.db import db
+from app.services import farmer_import
+from app.services.delta_sync import record_deletion, stamp
+from app.services.responses import not_modified
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter()
 farmers_collection = db["farmers"]
@@ -9,21 +13,48 @@ farmers_collection = db["farmers"]
 @router.post("/create")
 async def create_farmer_profile(profile: dict, user=Depends(get_current_user_from_token)):
     """Create farmer profile for logged-in user"""
-    existing = await farmers_collection.find_one({"user_id": user["_id"]})
-    if existing:
-        raise HTTPException(status_code=400, detail="Profile already exists")
-
     profile["user_id"] = user["_id"]
-    result = await farmers_collection.insert_one(profile)
+    profile.update(await stamp(farmers_collection.name))
+    try:
+        result = await farmers_collection.insert_one(profile)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Profile already exists")
     return {"message": "Farmer profile created", "id": str(result.inserted_id)}
 
 
+@router.post("/import")
+async def import_farmer_profiles(request: Request, user=Depends(require_role(*farmer_import.IMPORT_ROLES))):
+    """
+    Create or update many farmer profiles from one upload, keyed on user_id. Field agents
+    may create profiles and update the ones they imported; admins may update any profile.
+    Body: CSV with a header row (Content-Type: text/csv; crops separated by ";") or
+    NDJSON (Content-Type: application/x-ndjson), one profile per row. The upload is
+    streamed, so files of up to a million rows are fine; invalid rows are skipped and
+    listed in the report with their row number.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "text/csv" in content_type:
+        fmt = farmer_import.CSV
+    elif "application/x-ndjson" in content_type:
+        fmt = farmer_import.NDJSON
+    else:
+        raise HTTPException(status_code=415, detail="Upload text/csv or application/x-ndjson")
+    return await farmer_import.import_profiles(
+        farmers_collection, request.stream(), fmt, imported_by=user["_id"],
+        may_manage_any=user.get("role") == ADMIN_ROLE,
+    )
+
+
 @router.get("/me")
-async def get_my_profile(user=Depends(get_current_user_from_token)):
-    """Fetch logged-in farmer profile"""
+async def get_my_profile(request: Request, response: Response, user=Depends(get_current_user_from_token)):
+    """Fetch logged-in farmer profile; answers 304 to `If-None-Match` while it is unchanged"""
     profile = await farmers_collection.find_one({"user_id": user["_id"]})
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
+    if "version" in profile:
+        unchanged = not_modified(request, response, profile["_id"], profile["version"])
+        if unchanged is not None:
+            return unchanged
     profile["_id"] = str(profile["_id"])
     return profile
 
@@ -31,8 +62,12 @@ async def get_my_profile(user=Depends(get_current_user_from_token)):
 @router.put("/update")
 async def update_farmer_profile(update_data: dict, user=Depends(get_current_user_from_token)):
     """Update logged-in farmer profile"""
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    # Only match when something changes, so an identical update keeps the profile's version.
     result = await farmers_collection.update_one(
-        {"user_id": user["_id"]}, {"$set": update_data}
+        {"user_id": user["_id"], "$or": [{field: {"$ne": value}} for field, value in update_data.items()]},
+        {"$set": {**update_data, **await stamp(farmers_collection.name)}}
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Profile not found or no changes made")
@@ -42,7 +77,8 @@ async def update_farmer_profile(update_data: dict, user=Depends(get_current_user
 @router.delete("/delete")
 async def delete_farmer_profile(user=Depends(get_current_user_from_token)):
     """Delete logged-in farmer profile"""
-    result = await farmers_collection.delete_one({"user_id": user["_id"]})
-    if result.deleted_count == 0:
+    deleted = await farmers_collection.find_one_and_delete({"user_id": user["_id"]}, {"_id": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Profile not found")
+    await record_deletion(farmers_collection.name, str(deleted["_id"]), owner=user["_id"])
     return {"message": "Profile deleted successfully"}
@@ -1,49 +1,89 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 import httpx
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from pymongo import DESCENDING
+from app.routers.auth import require_admin
+from app.services.resilience import UpstreamUnavailable, unavailable_response
+from app.services.settings import require_key
+from app.services.market_ingest import (
+    MARKET_COLLECTION, fetch_price_page, upsert_price_records, market_ingest_job
+)
 
 router = APIRouter()
 
-API_KEY = os.getenv("MARKET_API_KEY")
-if not API_KEY:
-    raise Exception("MARKET_API_KEY is not set in environment variables")
 
+def format_price(doc: dict):
+    arrival_date = doc.get("arrival_date")
+    return {
+        "crop": doc.get("commodity_name"),
+        "market": doc.get("market"),
+        "state": doc.get("state"),
+        "price": doc.get("modal_price"),
+        "unit": "quintal",
+        "date": arrival_date.strftime("%d/%m/%Y") if arrival_date else None
+    }
 
-RESOURCE_ID = "9ef84268-d588-465a-a308-a864a43d0070"
 
-@router.get("/market-price/{crop_name}")
-async def get_market_price(crop_name: str):
-    url = (
-        f"https://api.data.gov.in/resource/{RESOURCE_ID}"
-        f"?api-key={API_KEY}"
-        f"&format=json"
-        f"&filters[commodity]={crop_name.lower()}"
-        f"&limit=1"
-        f"&offset=0"
+async def latest_price(commodity: str):
+    return await MARKET_COLLECTION.find_one(
+        {"commodity": commodity}, sort=[("arrival_date", DESCENDING)]
     )
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
 
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Failed to fetch data from market API")
+@router.get("/market-price/{crop_name}")
+async def get_market_price(crop_name: str):
+    """
+    Latest mandi price for a crop, served from the local price store.
+    Crops not ingested yet are fetched live once and stored.
+    """
+    commodity = crop_name.lower()
+    crop_data = await latest_price(commodity)
 
-    data = response.json()
+    if crop_data is None:
+        try:
+            data = await fetch_price_page(require_key("market"), offset=0, limit=100, commodity=commodity)
+        except UpstreamUnavailable as e:
+            raise unavailable_response(e)
+        except httpx.HTTPError:
+            raise HTTPException(status_code=500, detail="Failed to fetch data from market API")
+        await upsert_price_records(data.get("records") or [])
+        crop_data = await latest_price(commodity)
 
-    records = data.get("records")
-    if not records:
+    if crop_data is None:
         return {"message": f"No price data found for '{crop_name}'"}
 
-    crop_data = records[0]
+    return format_price(crop_data)
 
-    return {
-        "crop": crop_data.get("commodity"),
-        "market": crop_data.get("market"),
-        "state": crop_data.get("state"),
-        "price": crop_data.get("modal_price"),
-        "unit": "quintal",
-        "date": crop_data.get("arrival_date")
-    }
+
+@router.get("/prices")
+async def get_market_prices(
+    crops: str = Query(..., description="Comma-separated crop names, e.g. wheat,rice"),
+    state: str | None = Query(None, description="Restrict to one state"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Latest price per crop and market for several crops, optionally within a state."""
+    match = {"commodity": {"$in": [c.strip().lower() for c in crops.split(",") if c.strip()]}}
+    if state:
+        match["state"] = state
+
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"arrival_date": -1}},
+        {"$group": {"_id": {"commodity": "$commodity", "market": "$market"}, "latest": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$latest"}},
+        {"$sort": {"commodity": 1, "arrival_date": -1}},
+        {"$limit": limit},
+    ]
+    docs = await MARKET_COLLECTION.aggregate(pipeline).to_list(length=limit)
+    return {"prices": [format_price(doc) for doc in docs]}
+
+
+@router.post("/ingest", status_code=202)
+async def trigger_market_ingest(user=Depends(require_admin)):
+    """Start a full re-ingestion of the data.gov.in price dataset in the background (admins only)."""
+    started = market_ingest_job.trigger()
+    return {"started": started, "status": market_ingest_job.status()}
+
+
+@router.get("/ingest/status")
+async def market_ingest_status():
+    return market_ingest_job.status()
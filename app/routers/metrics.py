@@ -0,0 +1,30 @@
+import hmac
+import os
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import PlainTextResponse
+from app.routers.auth import get_current_user_from_token, require_admin
+from app.services.metrics import CONTENT_TYPE, REGISTRY, profiler
+
+router = APIRouter()
+
+# Static bearer token for Prometheus scrapers, which cannot renew a login token.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+async def metrics_reader(authorization: str = Header(...)):
+    """Admins, or a scraper sending `Authorization: Bearer <METRICS_TOKEN>`."""
+    if METRICS_TOKEN and hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        return None
+    return await require_admin(await get_current_user_from_token(authorization))
+
+
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics(reader=Depends(metrics_reader)):
+    """Prometheus text exposition of request, upstream, MongoDB, cache and event-loop metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@router.get("/metrics/profiles")
+def slow_request_profiles(user=Depends(require_admin)):
+    """Slowest sampled requests with where they spent their time (enable with PROFILE_SAMPLE_RATE); admins only"""
+    return profiler.report()
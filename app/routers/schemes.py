@@ -1,12 +1,16 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Query, Request, Response
 from pydantic import BaseModel, HttpUrl
-from typing import List, Dict
+from typing import List, Dict, Optional
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 from app.db import db
-from app.services.crud import find_documents
-from app.services.schemes_sync import sync_schemes
+from app.services.crud import bulk_write, find_documents, iter_documents, stream_ndjson, wants_ndjson
+from app.services.delta_sync import current_version, stamp, stamps
+from app.services.responses import not_modified
+from app.services.schemes_sync import schemes_search, schemes_sync_job, scheme_key
 
+# Mounted under /schemes by app.main.
 router = APIRouter(
-    prefix="/schemes",
     tags=["Government Schemes"],
     responses={404: {"description": "Not found"}},
 )
@@ -32,13 +36,29 @@ class SchemeModel(BaseModel):
             }
         }
 
+
+class StoredSchemeModel(SchemeModel):
+    """A stored scheme; schemes synced from the portal carry a source_url instead of these details."""
+    department: Optional[str] = None
+    eligibility: Optional[str] = None
+    link: Optional[str] = None
+    source_url: Optional[str] = None
+
+
 @router.get(
     "/all",
     summary="Get All Government Schemes",
-    description="Fetches a list of government schemes stored in the database. Returns up to 100 entries.",
-    response_model=Dict[str, List[SchemeModel]]
+    description="Fetches a list of government schemes stored in the database. Returns up to 100 entries. "
+                "Send `Accept: application/x-ndjson` to stream every scheme instead. "
+                "Answers 304 to `If-None-Match` while no scheme has changed; `/sync/schemes` returns only the changes.",
+    response_model=Dict[str, List[StoredSchemeModel]]
 )
-async def get_all_schemes():
+async def get_all_schemes(request: Request, response: Response):
+    unchanged = not_modified(request, response, await current_version(SCHEMES_COLLECTION.name))
+    if unchanged is not None:
+        return unchanged
+    if wants_ndjson(request):
+        return stream_ndjson(iter_documents(SCHEMES_COLLECTION))
     schemes = await find_documents(SCHEMES_COLLECTION, {}, limit=100)
     return {"schemes": schemes}
 
@@ -50,23 +70,55 @@ async def get_all_schemes():
     response_model=Dict[str, str]
 )
 async def add_scheme_manually(scheme: SchemeModel = Body(...)):
-    await SCHEMES_COLLECTION.insert_one(scheme.dict())
+    doc = scheme.dict()
+    doc["link"] = str(doc["link"])
+    doc["scheme_key"] = scheme_key(doc["title"])
+    doc.update(await stamp(SCHEMES_COLLECTION.name))
+    try:
+        await SCHEMES_COLLECTION.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="A scheme with this title already exists")
+    schemes_search.index_document(doc)
     return {"message": "Scheme added successfully"}
 
 
+@router.get(
+    "/search",
+    summary="Search Government Schemes",
+    description="Ranked full-text search over scheme titles, descriptions and eligibility, in Hindi or English."
+)
+async def search_schemes(
+    q: str = Query(..., min_length=2),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000)
+):
+    return await schemes_search.search(q, limit, offset)
+
+
 @router.post(
     "/sync",
     summary="Sync Schemes from Government Portal",
-    description="Manually triggers syncing of the latest schemes from the government portal (mocked for demo).",
+    description="Runs the scheduled portal sync immediately instead of waiting for the next run.",
     response_description="Sync status and details"
 )
 async def sync_government_schemes():
     try:
-        result = await sync_schemes()
+        result = await schemes_sync_job.run_once()
         return {"status": "success", "details": result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get(
+    "/sync/status",
+    summary="Scheme Sync Status",
+    description="Schedule and statistics of the background portal sync."
+)
+async def scheme_sync_status():
+    return schemes_sync_job.status()
+
 @router.post(
     "/demo/populate",
     summary="Populate Dummy Schemes (Demo Only)",
@@ -96,5 +148,12 @@ async def populate_dummy_schemes():
             "link": "https://www.digitalindia.gov.in/"
         }
     ]
-    await SCHEMES_COLLECTION.insert_many(demo_data)
+    operations = []
+    for doc, version in zip(demo_data, await stamps(SCHEMES_COLLECTION.name, len(demo_data))):
+        doc["scheme_key"] = scheme_key(doc["title"])
+        doc.update(version)
+        operations.append(UpdateOne({"scheme_key": doc["scheme_key"]}, {"$setOnInsert": doc}, upsert=True))
+    result = await bulk_write(SCHEMES_COLLECTION, operations)
+    for index, scheme_id in result["upserted_ids"].items():
+        schemes_search.index_document({**demo_data[index], "_id": scheme_id})
     return {"message": "Dummy schemes inserted successfully"}
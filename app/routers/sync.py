@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from app.routers.auth import get_current_user_from_token
+from app.routers.community import FEED_PROJECTION, community_collection, replies_collection
+from app.routers.farmer import farmers_collection
+from app.services import delta_sync
+from app.services.responses import select_fields, take_requested_fields
+from app.services.schemes_sync import SCHEMES_COLLECTION
+
+router = APIRouter()
+
+SOURCES = {
+    source.name: source for source in (
+        delta_sync.SyncSource("schemes", SCHEMES_COLLECTION),
+        delta_sync.SyncSource("posts", community_collection, projection=FEED_PROJECTION),
+        delta_sync.SyncSource("replies", replies_collection),
+        delta_sync.SyncSource("profile", farmers_collection, owner_field="user_id"),
+    )
+}
+SHARED_SOURCES = [name for name, source in SOURCES.items() if source.owner_field is None]
+
+
+async def sync_page(name: str, since: str | None, limit: int, owner: str | None = None):
+    # `fields` selects inside each changed document, not the change entries around them.
+    tree = take_requested_fields()
+    page = await delta_sync.changes_page(SOURCES[name], since, limit, owner)
+    if tree:
+        for change in page["changes"]:
+            if "doc" in change:
+                change["doc"] = select_fields(change["doc"], tree)
+    return {"collection": name, **page}
+
+
+@router.get(
+    "/profile",
+    summary="Sync My Profile",
+    description="Changes to the caller's farmer profile since `since`; see `/sync/{collection}`."
+)
+async def sync_profile(
+    since: str | None = Query(None, description="`next_token` from the previous page"),
+    limit: int = Query(delta_sync.PAGE_SIZE, ge=1, le=delta_sync.MAX_PAGE_SIZE),
+    user=Depends(get_current_user_from_token)
+):
+    return await sync_page("profile", since, limit, owner=user["_id"])
+
+
+@router.get(
+    "/{collection}",
+    summary="Sync a Collection",
+    description="Documents created, updated or deleted since the `since` token, oldest change first. "
+                "Omit `since` for a full sync. Keep calling with `next_token` while `has_more` is true, "
+                "and store `next_token` after each page so an interrupted sync resumes there. "
+                "`reset: true` means the local copy must be replaced by this sync."
+)
+async def sync_collection(
+    collection: str = Path(..., description=", ".join(SHARED_SOURCES)),
+    since: str | None = Query(None, description="`next_token` from the previous page"),
+    limit: int = Query(delta_sync.PAGE_SIZE, ge=1, le=delta_sync.MAX_PAGE_SIZE)
+):
+    if collection not in SHARED_SOURCES:
+        raise HTTPException(status_code=404, detail=f"Unknown collection; choose from {', '.join(SHARED_SOURCES)}")
+    return await sync_page(collection, since, limit)
@@ -1,36 +1,63 @@
-from fastapi import APIRouter, HTTPException
-import httpx
+from fastapi import APIRouter, Depends, HTTPException
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from app.routers.auth import require_admin
+from app.services.cache import TTLCache
+from app.services.resilience import is_upstream_failure
+from app.services.weather_snapshots import (
+    city_key, fetch_current, normalize_city, read_snapshot, to_conditions, weather_precompute_job
+)
 
 router = APIRouter()
 
-API_KEY = os.getenv("OPENWEATHER_API_KEY")
+# Current conditions are served from cache for WEATHER_CACHE_TTL seconds, then
+# returned stale for up to WEATHER_STALE_TTL more seconds while refreshed in the background.
+# While OpenWeatherMap is failing, older entries are still served as the last known value.
+weather_cache = TTLCache(
+    ttl=float(os.getenv("WEATHER_CACHE_TTL", "600")),
+    stale_ttl=float(os.getenv("WEATHER_STALE_TTL", "1800")),
+    maxsize=int(os.getenv("WEATHER_CACHE_ENTRIES", "5000")),
+    fallback_if=is_upstream_failure,
+)
+
+
+async def fetch_weather(city: str):
+    return to_conditions(await fetch_current({"q": city}))
+
+
+async def use_snapshot(key: str):
+    """Seed the cache from the precomputed snapshot when it is newer than the cached entry."""
+    age = weather_cache.age(key)
+    if age is not None and age < weather_cache.ttl:
+        return
+    snapshot = await read_snapshot(city_key(key))
+    if snapshot is not None and (age is None or snapshot[1] < age):
+        weather_cache.set(key, snapshot[0], age=snapshot[1])
 
-if not API_KEY:
-    raise Exception("Missing OpenWeatherMap API Key")
 
 @router.get("/weather/{city}")
 async def get_weather(city: str):
     """
     Fetch current weather for a city using OpenWeatherMap API.
+    Cities farmers are registered in are precomputed in the background.
     Example: /weather/London
     """
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={API_KEY}&units=metric"
-
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-
-    if response.status_code != 200:
-        raise HTTPException(status_code=response.status_code, detail="City not found or API error")
-
-    data = response.json()
-    return {
-        "city": city,
-        "temperature": data["main"]["temp"],
-        "description": data["weather"][0]["description"],
-        "humidity": data["main"]["humidity"],
-        "wind_speed": data["wind"]["speed"]
-    }
+    key = normalize_city(city)
+    await use_snapshot(key)
+    conditions = await weather_cache.get_or_fetch(key, lambda: fetch_weather(key))
+    return {"city": city, **conditions}
+
+
+@router.post("/precompute/run", summary="Refresh weather snapshots now")
+async def run_weather_precompute(user=Depends(require_admin)):
+    try:
+        return {"status": "success", "details": await weather_precompute_job.run_once()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/precompute/status", summary="Weather precompute status")
+async def weather_precompute_status():
+    """Schedule and statistics of the background precompute, including calls saved."""
+    return weather_precompute_job.status()
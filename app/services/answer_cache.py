@@ -0,0 +1,170 @@
+"""
+Cache of assistant answers keyed on what a query asks.
+
+A query is normalized (case, Unicode forms, punctuation, whitespace) and looked up
+exactly. Failing that, it matches a cached query with exactly the same content words,
+i.e. the same words in any order once FILLER_WORDS are dropped. There is no fuzzy
+matching: "urea for wheat" and "urea for paddy", or "irrigate" and "not irrigate",
+differ in a single content word but are different questions.
+
+Answers are persisted in assistant_answers with a TTL index, and the most recent ones are
+kept in memory, each until the same CACHE_TTL_SECONDS expiry.
+"""
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo import DESCENDING
+from app.db import db
+from app.services.text import normalize_text
+
+ANSWERS_COLLECTION = db["assistant_answers"]
+
+MEMORY_ENTRIES = int(os.getenv("ASSISTANT_CACHE_ENTRIES", "20000"))
+CACHE_TTL_SECONDS = int(os.getenv("ASSISTANT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Words that do not change what is being asked. Every other word (crop names, quantities,
+# negations such as "not" or "नहीं", question words) must be the same for two queries to
+# share an answer.
+FILLER_WORDS = frozenset("""
+a an the is are am was were be been do does did i me my we our you your it its this that
+these those to of in on at for from by and or so if as about please kindly tell know
+can could would should will shall may might must use used apply give get need want
+have has had some any there here
+क्या है हैं था थे का की के को में से पर और या मैं मुझे मेरे मेरी मेरा हम हमें हमारे आप कृपया
+बताएं बताइए बताओ सा सी लिए तो भी ही
+kya hai hain ka ki ke ko mein se par aur ya main mujhe mere meri mera hum aap kripya
+batao bataiye liye toh bhi
+""".split())
+
+
+def content_key(text: str) -> str:
+    """The content words of a normalized query, deduplicated and sorted."""
+    return " ".join(sorted({word for word in text.split() if word not in FILLER_WORDS}))
+
+
+class AnswerIndex:
+    """Bounded in-process index of answers by normalized query and by content_key()."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._by_content: dict = {}
+
+    def add(self, key: str, answer: str, expires_at: float):
+        if key in self._entries:
+            self.remove(key)
+        content = content_key(key)
+        self._entries[key] = (content, answer, expires_at)
+        self._by_content.setdefault(content, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self.remove(next(iter(self._entries)))
+
+    def remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_content.get(entry[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_content[entry[0]]
+
+    def _live(self, key: str):
+        """The entry's answer, or None after evicting it when it has expired."""
+        _, answer, expires_at = self._entries[key]
+        if time.time() >= expires_at:
+            self.remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def exact(self, key: str):
+        return self._live(key) if key in self._entries else None
+
+    def same_content(self, key: str):
+        """Answer of a live cached query with the same content words as `key`, or None."""
+        for candidate in list(self._by_content.get(content_key(key), ())):
+            answer = self._live(candidate)
+            if answer is not None:
+                return answer
+        return None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _expires_at(created_at: datetime) -> float:
+    age = (datetime.utcnow() - created_at).total_seconds()
+    return time.time() - age + CACHE_TTL_SECONDS
+
+
+class AnswerCache:
+    def __init__(self, maxsize: int = MEMORY_ENTRIES):
+        self.index = AnswerIndex(maxsize)
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+
+    async def load(self):
+        """Warm the in-process index with the most recent persisted answers that have not expired."""
+        cursor = ANSWERS_COLLECTION.find(
+            {"created_at": {"$gt": datetime.utcnow() - timedelta(seconds=CACHE_TTL_SECONDS)}},
+            {"answer": 1, "created_at": 1},
+        ).sort("created_at", DESCENDING)
+        async for doc in cursor.limit(self.index.maxsize):
+            self.index.add(doc["_id"], doc["answer"], _expires_at(doc["created_at"]))
+
+    async def lookup(self, query: str):
+        started = time.perf_counter()
+        try:
+            key = normalize_text(query)
+            answer = self.index.exact(key)
+            if answer is None:
+                # The TTL monitor deletes expired documents only once a minute.
+                doc = await ANSWERS_COLLECTION.find_one(
+                    {"_id": key, "created_at": {"$gt": datetime.utcnow() - timedelta(seconds=CACHE_TTL_SECONDS)}},
+                    {"answer": 1, "created_at": 1},
+                )
+                if doc:
+                    answer = doc["answer"]
+                    self.index.add(key, answer, _expires_at(doc["created_at"]))
+            if answer is not None:
+                self.exact_hits += 1
+                return answer
+            answer = self.index.same_content(key)
+            if answer is not None:
+                self.near_hits += 1
+                return answer
+            self.misses += 1
+            return None
+        finally:
+            self.lookup_seconds += time.perf_counter() - started
+
+    async def store(self, query: str, answer: str):
+        key = normalize_text(query)
+        self.index.add(key, answer, time.time() + CACHE_TTL_SECONDS)
+        await ANSWERS_COLLECTION.replace_one(
+            {"_id": key},
+            {"query": query, "answer": answer, "created_at": datetime.utcnow()},
+            upsert=True,
+        )
+
+    def stats(self):
+        lookups = self.exact_hits + self.near_hits + self.misses
+        hits = self.exact_hits + self.near_hits
+        return {
+            "entries": len(self.index),
+            "ttl_seconds": CACHE_TTL_SECONDS,
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "avg_lookup_ms": round(1000 * self.lookup_seconds / lookups, 3) if lookups else 0.0,
+            "upstream_calls_saved": hits,
+        }
+
+
+answer_cache = AnswerCache()
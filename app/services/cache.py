@@ -0,0 +1,154 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded in-process mapping that evicts the least recently used key."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def peek(self, key, default=None):
+        """Read without touching recency or hit counters."""
+        return self._data.get(key, default)
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+def _consume_result(task: asyncio.Task):
+    # Mark the exception as retrieved when every waiter went away before the task finished.
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one in-flight coroutine."""
+
+    def __init__(self):
+        self._inflight: dict = {}
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None))
+            task.add_done_callback(_consume_result)
+        # Shield so a cancelled caller does not cancel the fetch shared with other callers.
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._inflight)
+
+
+class TTLCache:
+    """
+    Bounded cache with a freshness window and stale-while-revalidate.
+    Fresh entries are returned directly; stale ones are returned immediately while a
+    background refresh runs; expired or missing entries are fetched once per key.
+    When `fallback_if(error)` is true for a failed fetch, an expired entry is returned as
+    the last known good value instead of the error.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float = 0, maxsize: int = 1024, fallback_if=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.fallback_if = fallback_if
+        self._entries = LRUCache(maxsize)
+        self._inflight = SingleFlight()
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    async def _fetch_and_store(self, key, fetch):
+        value = await fetch()
+        self._entries.set(key, (value, time.monotonic()))
+        return value
+
+    def _refresh_in_background(self, key, fetch):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.ensure_future(self._inflight.do(key, lambda: self._fetch_and_store(key, fetch)))
+        task.add_done_callback(lambda t: self._refreshing.discard(key))
+        task.add_done_callback(_consume_result)
+
+    async def get_or_fetch(self, key, fetch):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age < self.ttl:
+                self.hits += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._refresh_in_background(key, fetch)
+                return value
+        self.misses += 1
+        try:
+            return await self._inflight.do(key, lambda: self._fetch_and_store(key, fetch))
+        except Exception as e:
+            if entry is None or self.fallback_if is None or not self.fallback_if(e):
+                raise
+            self.fallbacks += 1
+            return entry[0]
+
+    def age(self, key):
+        """Seconds since `key` was stored, or None when it is not cached."""
+        entry = self._entries.peek(key)
+        return None if entry is None else time.monotonic() - entry[1]
+
+    def set(self, key, value, age: float = 0.0):
+        """Store a value fetched elsewhere; `age` is how many seconds old it already is."""
+        self._entries.set(key, (value, time.monotonic() - age))
+
+    def invalidate(self, key):
+        self._entries.pop(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self._entries.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "fallbacks": self.fallbacks,
+            "inflight": len(self._inflight),
+        }
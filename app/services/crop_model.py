@@ -0,0 +1,157 @@
+"""
+Array-backed crop suitability model.
+
+Each factor is a precomputed (crops x categories) table of 0..1 suitability scores. A batch
+of plots is scored with a handful of NumPy gathers, so 100k plots cost about as much
+Python as one.
+"""
+import numpy as np
+
+CROPS = ["Rice", "Wheat", "Maize", "Cotton", "Sugarcane", "Chickpea", "Mustard", "Bajra", "Groundnut", "Soybean"]
+
+SOIL_TYPES = ["loamy", "clay", "sandy", "silt", "black", "red", "alluvial", "laterite"]
+SEASONS = ["kharif", "rabi", "zaid"]
+# Upper edges (mm of seasonal rainfall) of the rainfall bands.
+RAINFALL_EDGES = np.array([400, 800, 1200, 1600], dtype=np.float32)
+# Clay percentage edges separating light, medium and heavy textures.
+CLAY_EDGES = np.array([15, 35], dtype=np.float32)
+
+# Unknown categories fall into an extra neutral column.
+NEUTRAL = 0.5
+
+#                    loamy clay sandy silt black red alluvial laterite
+SOIL = np.array([
+    [1.0, 0.9, 0.2, 0.8, 0.6, 0.4, 1.0, 0.5],   # Rice
+    [0.9, 1.0, 0.3, 0.8, 0.8, 0.4, 1.0, 0.3],   # Wheat
+    [1.0, 0.5, 0.6, 0.8, 0.7, 0.7, 0.9, 0.5],   # Maize
+    [0.6, 0.6, 0.4, 0.5, 1.0, 0.6, 0.7, 0.3],   # Cotton
+    [0.9, 0.7, 0.3, 0.7, 0.9, 0.5, 1.0, 0.4],   # Sugarcane
+    [0.8, 0.6, 0.5, 0.6, 0.9, 0.6, 0.7, 0.4],   # Chickpea
+    [0.9, 0.5, 0.6, 0.8, 0.6, 0.5, 1.0, 0.3],   # Mustard
+    [0.6, 0.3, 1.0, 0.5, 0.5, 0.8, 0.6, 0.6],   # Bajra
+    [0.7, 0.3, 1.0, 0.6, 0.6, 0.9, 0.7, 0.6],   # Groundnut
+    [0.8, 0.6, 0.4, 0.7, 1.0, 0.6, 0.7, 0.4],   # Soybean
+], dtype=np.float32)
+
+#                   kharif rabi zaid
+SEASON = np.array([
+    [1.0, 0.1, 0.6],   # Rice
+    [0.0, 1.0, 0.1],   # Wheat
+    [0.9, 0.6, 0.8],   # Maize
+    [1.0, 0.0, 0.3],   # Cotton
+    [0.8, 0.6, 0.8],   # Sugarcane
+    [0.0, 1.0, 0.1],   # Chickpea
+    [0.0, 1.0, 0.0],   # Mustard
+    [1.0, 0.0, 0.7],   # Bajra
+    [1.0, 0.3, 0.8],   # Groundnut
+    [1.0, 0.0, 0.2],   # Soybean
+], dtype=np.float32)
+
+#                  <400 400-800 800-1200 1200-1600 >1600 mm
+RAINFALL = np.array([
+    [0.0, 0.3, 0.7, 1.0, 1.0],   # Rice
+    [0.7, 1.0, 0.8, 0.4, 0.2],   # Wheat
+    [0.4, 1.0, 1.0, 0.6, 0.3],   # Maize
+    [0.4, 1.0, 0.9, 0.5, 0.2],   # Cotton
+    [0.1, 0.5, 1.0, 1.0, 0.8],   # Sugarcane
+    [1.0, 0.9, 0.5, 0.2, 0.1],   # Chickpea
+    [1.0, 0.8, 0.5, 0.2, 0.1],   # Mustard
+    [1.0, 0.8, 0.4, 0.2, 0.1],   # Bajra
+    [0.6, 1.0, 0.8, 0.4, 0.2],   # Groundnut
+    [0.3, 0.9, 1.0, 0.6, 0.3],   # Soybean
+], dtype=np.float32)
+
+#                 light medium heavy
+TEXTURE = np.array([
+    [0.2, 0.8, 1.0],   # Rice
+    [0.4, 1.0, 0.8],   # Wheat
+    [0.7, 1.0, 0.6],   # Maize
+    [0.4, 0.8, 1.0],   # Cotton
+    [0.4, 1.0, 0.8],   # Sugarcane
+    [0.6, 1.0, 0.7],   # Chickpea
+    [0.7, 1.0, 0.5],   # Mustard
+    [1.0, 0.7, 0.3],   # Bajra
+    [1.0, 0.8, 0.3],   # Groundnut
+    [0.5, 1.0, 0.8],   # Soybean
+], dtype=np.float32)
+
+# Optimal pH range per crop; suitability falls off linearly by PH_FALLOFF per unit outside it.
+PH_RANGE = np.array([
+    [5.5, 7.0], [6.0, 7.5], [5.5, 7.5], [6.0, 8.0], [6.0, 7.5],
+    [6.0, 8.0], [6.0, 7.5], [6.5, 8.0], [6.0, 7.0], [6.0, 7.5],
+], dtype=np.float32)
+PH_FALLOFF = 0.5
+
+WEIGHTS = {"soil": 0.25, "season": 0.35, "rainfall": 0.25, "ph": 0.1, "texture": 0.05}
+
+
+def _with_neutral(table):
+    return np.hstack([table, np.full((table.shape[0], 1), NEUTRAL, dtype=np.float32)])
+
+
+# Transposed so a gather yields (plots x crops) directly.
+_SOIL_T = _with_neutral(SOIL).T
+_SEASON_T = _with_neutral(SEASON).T
+_RAINFALL_T = RAINFALL.T
+_TEXTURE_T = TEXTURE.T
+_SOIL_INDEX = {name: i for i, name in enumerate(SOIL_TYPES)}
+_SEASON_INDEX = {name: i for i, name in enumerate(SEASONS)}
+
+
+def encode(values, index: dict) -> np.ndarray:
+    """Map category names to table columns; unknown names map to the neutral column."""
+    unknown = len(index)
+    return np.fromiter((index.get(str(v).strip().lower(), unknown) for v in values), dtype=np.int32, count=len(values))
+
+
+def soil_features(soil_properties: dict):
+    """Topsoil (pH, clay %) from the /soil/soil response; SoilGrids reports pH x10 and clay in g/kg."""
+    def topsoil(name):
+        depths = soil_properties.get(name) or []
+        return depths[0]["mean"] / 10 if depths else None
+
+    return topsoil("phh2o"), topsoil("clay")
+
+
+def score(soil_types, seasons, rainfall, ph=None, clay_percent=None) -> np.ndarray:
+    """Return a (plots x crops) suitability matrix. ph and clay_percent may contain NaN for unknown."""
+    n = len(soil_types)
+    rainfall = np.asarray(rainfall, dtype=np.float32)
+    ph = np.full(n, np.nan, dtype=np.float32) if ph is None else np.asarray(ph, dtype=np.float32)
+    clay = np.full(n, np.nan, dtype=np.float32) if clay_percent is None else np.asarray(clay_percent, dtype=np.float32)
+
+    total = (
+        WEIGHTS["soil"] * _SOIL_T[encode(soil_types, _SOIL_INDEX)]
+        + WEIGHTS["season"] * _SEASON_T[encode(seasons, _SEASON_INDEX)]
+        + WEIGHTS["rainfall"] * _RAINFALL_T[np.searchsorted(RAINFALL_EDGES, rainfall)]
+    )
+    weight = np.full((n, 1), WEIGHTS["soil"] + WEIGHTS["season"] + WEIGHTS["rainfall"], dtype=np.float32)
+
+    has_ph = ~np.isnan(ph)
+    if has_ph.any():
+        distance = np.maximum(PH_RANGE[:, 0] - ph[:, None], 0) + np.maximum(ph[:, None] - PH_RANGE[:, 1], 0)
+        ph_score = np.clip(1 - PH_FALLOFF * distance, 0, 1)
+        total += np.where(has_ph[:, None], WEIGHTS["ph"] * ph_score, 0)
+        weight += np.where(has_ph[:, None], WEIGHTS["ph"], 0)
+
+    has_clay = ~np.isnan(clay)
+    if has_clay.any():
+        texture_score = _TEXTURE_T[np.searchsorted(CLAY_EDGES, np.nan_to_num(clay))]
+        total += np.where(has_clay[:, None], WEIGHTS["texture"] * texture_score, 0)
+        weight += np.where(has_clay[:, None], WEIGHTS["texture"], 0)
+
+    return total / weight
+
+
+def recommend(soil_types, seasons, rainfall, ph=None, clay_percent=None, top_k: int = 3):
+    """Return (crop_indices, scores), each plots x top_k, best first."""
+    scores = score(soil_types, seasons, rainfall, ph, clay_percent)
+    top_k = min(top_k, len(CROPS))
+    top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def ranked(indices_row, scores_row):
+    return [{"crop": CROPS[i], "score": round(float(s), 3)} for i, s in zip(indices_row, scores_row)]
@@ -1,23 +1,173 @@
+import base64
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
 from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pymongo import ASCENDING, DESCENDING
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+DEFAULT_BATCH_SIZE = int(os.getenv("CRUD_BATCH_SIZE", "500"))
+
+# Callables invoked as hook(operation, collection_name, seconds) after every call below.
+_query_hooks = []
+
+
+def add_query_hook(hook):
+    _query_hooks.append(hook)
+
+
+def _log_slow_query(operation, collection_name, seconds):
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Slow %s on %s took %.1f ms", operation, collection_name, seconds * 1000)
+
+
+add_query_hook(_log_slow_query)
+
+
+def _report(operation: str, collection, seconds: float):
+    for hook in _query_hooks:
+        hook(operation, collection.name, seconds)
+
+
+@asynccontextmanager
+async def timed(operation: str, collection):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _report(operation, collection, time.perf_counter() - started)
+
+
+def convert_objectid(obj):
+    """Recursively turn ObjectIds into strings, returning new containers."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, list):
+        return [convert_objectid(o) for o in obj]
+    if isinstance(obj, dict):
+        return {k: convert_objectid(v) for k, v in obj.items()}
+    return obj
 
 def normalize_id(doc):
     if not doc:
         return doc
-    doc["_id"] = str(doc["_id"])
-    return doc
+    return {**doc, "_id": str(doc["_id"])} if "_id" in doc else doc
 
 async def insert_document(collection, data: dict):
-    result = await collection.insert_one(data)
+    async with timed("insert_one", collection):
+        result = await collection.insert_one(data)
     return str(result.inserted_id)
 
-async def find_documents(collection, query={}, limit=10):
-    cursor = collection.find(query).limit(limit)
-    docs = [normalize_id(doc) async for doc in cursor]
-    return docs
+async def iter_documents(collection, query=None, projection=None, sort=None, limit: int = 0,
+                         batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Stream matching documents one batch at a time without materializing the result set.
+    The timing covers only the batch fetches, not the time the caller spends between them.
+    """
+    cursor = collection.find(query or {}, projection).batch_size(batch_size)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    fetching = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            batch = await cursor.to_list(length=batch_size)
+            fetching += time.perf_counter() - started
+            for doc in batch:
+                yield doc
+            # to_list only returns a short batch once the cursor is exhausted.
+            if len(batch) < batch_size:
+                break
+    finally:
+        _report("find", collection, fetching)
+
+async def find_documents(collection, query=None, limit=10, projection=None, sort=None):
+    return [normalize_id(doc) async for doc in iter_documents(collection, query, projection, sort, limit)]
 
-async def find_one(collection, query):
-    doc = await collection.find_one(query)
+async def find_one(collection, query, projection=None):
+    async with timed("find_one", collection):
+        doc = await collection.find_one(query, projection)
     return normalize_id(doc)
 
 async def update_document(collection, query, update):
-    await collection.update_one(query, {"$set": update})
+    async with timed("update_one", collection):
+        await collection.update_one(query, {"$set": update})
+
+async def bulk_write(collection, operations: list, ordered: bool = False):
+    """Run a bulk_write (unordered by default) and summarize the result."""
+    if not operations:
+        return {"inserted": 0, "upserted": 0, "modified": 0, "deleted": 0, "upserted_ids": {}}
+    async with timed("bulk_write", collection):
+        result = await collection.bulk_write(operations, ordered=ordered)
+    return {
+        "inserted": result.inserted_count,
+        "upserted": result.upserted_count,
+        "modified": result.modified_count,
+        "deleted": result.deleted_count,
+        "upserted_ids": result.upserted_ids,
+    }
+
+
+def encode_cursor(created_at, doc_id) -> str:
+    """Opaque keyset cursor for the (created_at, _id) position of a document."""
+    raw = f"{created_at.isoformat()}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, doc_id = raw.split("|", 1)
+    return datetime.fromisoformat(created_at), ObjectId(doc_id)
+
+def keyset_filter(cursor: str | None, descending: bool = True):
+    """Query clause selecting documents after `cursor` in (created_at, _id) order."""
+    if not cursor:
+        return {}
+    created_at, doc_id = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    return {"$or": [
+        {"created_at": {op: created_at}},
+        {"created_at": created_at, "_id": {op: doc_id}}
+    ]}
+
+async def keyset_page(collection, query: dict, limit: int, cursor: str | None = None,
+                      descending: bool = True, projection=None):
+    """One page in (created_at, _id) order plus the cursor for the next page (None on the last page)."""
+    try:
+        after = keyset_filter(cursor, descending)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    direction = DESCENDING if descending else ASCENDING
+    sort = [("created_at", direction), ("_id", direction)]
+    docs = [doc async for doc in iter_documents(collection, {**query, **after}, projection, sort, limit + 1)]
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1]["created_at"], docs[-1]["_id"])
+    return [convert_objectid(doc) for doc in docs], next_cursor
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def wants_ndjson(request) -> bool:
+    return "application/x-ndjson" in request.headers.get("accept", "")
+
+def stream_ndjson(documents, transform=convert_objectid):
+    """StreamingResponse writing one JSON document per line as the async iterable yields them."""
+
+    async def lines():
+        async for doc in documents:
+            yield json.dumps(transform(doc), ensure_ascii=False, default=_json_default) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
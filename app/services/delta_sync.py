@@ -0,0 +1,165 @@
+"""
+Change tracking for offline-first clients.
+
+Every write to a synced collection stamps the document with `version`, taken from a
+per-collection counter in sync_counters that only ever increases, and `version_at`.
+Deletes leave a tombstone in sync_tombstones carrying the next version. A client keeps
+one opaque token per collection. changes_page() returns the upserts and deletes after
+it in version order, one bounded page at a time, with a token for each page, so a sync
+cut off mid-way resumes from the last page it received.
+
+A version is taken just before its write is applied. A page therefore only includes
+changes stamped at least SETTLE_SECONDS ago, so a slower write with a lower version
+cannot land behind a token already handed out. Tombstones expire after TOMBSTONE_TTL
+seconds, and older tokens get a full resync (`reset`).
+"""
+import base64
+import os
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from app.db import db
+from app.services.crud import bulk_write, convert_objectid, iter_documents
+
+SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", "2"))
+TOMBSTONE_TTL = int(os.getenv("SYNC_TOMBSTONE_TTL", str(30 * 24 * 3600)))
+PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "200"))
+MAX_PAGE_SIZE = int(os.getenv("SYNC_MAX_PAGE_SIZE", "1000"))
+
+COUNTERS_COLLECTION = db["sync_counters"]
+TOMBSTONES_COLLECTION = db["sync_tombstones"]
+
+# Documents stamped before change tracking existed sort before every real change.
+BACKFILL_STAMP_TIME = datetime(1970, 1, 1)
+
+
+async def reserve_versions(collection_name: str, count: int = 1) -> int:
+    """Reserve `count` consecutive versions and return the first."""
+    counter = await COUNTERS_COLLECTION.find_one_and_update(
+        {"_id": collection_name}, {"$inc": {"value": count}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return counter["value"] - count + 1
+
+
+async def current_version(collection_name: str) -> int:
+    """Highest version handed out for the collection; it changes on every tracked write."""
+    counter = await COUNTERS_COLLECTION.find_one({"_id": collection_name})
+    return counter["value"] if counter else 0
+
+
+async def stamp(collection_name: str) -> dict:
+    """Fields to $set on a single tracked write."""
+    return {"version": await reserve_versions(collection_name), "version_at": datetime.utcnow()}
+
+
+async def stamps(collection_name: str, count: int) -> list:
+    """Fields to $set on each of `count` tracked writes made together."""
+    if not count:
+        return []
+    first = await reserve_versions(collection_name, count)
+    now = datetime.utcnow()
+    return [{"version": first + i, "version_at": now} for i in range(count)]
+
+
+async def record_deletion(collection_name: str, doc_id, owner: str | None = None):
+    """Leave a tombstone for a deleted document; `owner` scopes it to one user's sync."""
+    tombstone = {
+        "collection": collection_name,
+        "doc_id": doc_id,
+        "deleted_at": datetime.utcnow(),
+        **await stamp(collection_name),
+    }
+    if owner is not None:
+        tombstone["owner"] = owner
+    await TOMBSTONES_COLLECTION.insert_one(tombstone)
+
+
+class SyncSource:
+    """A collection clients can sync, and which of its documents a caller may see."""
+
+    def __init__(self, name: str, collection, projection=None, owner_field: str | None = None):
+        self.name = name
+        self.collection = collection
+        self.projection = projection
+        # Per-user sources only return documents whose owner_field is the caller.
+        self.owner_field = owner_field
+
+
+def encode_token(collection_name: str, version: int, issued: datetime) -> str:
+    raw = f"{collection_name}|{version}|{int(issued.timestamp())}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_token(token: str, collection_name: str):
+    """(version, issued) of a token for this collection; 400 for anything else."""
+    try:
+        name, version, issued = base64.urlsafe_b64decode(token.encode()).decode().split("|")
+        version, issued = int(version), datetime.fromtimestamp(int(issued))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    if name != collection_name:
+        raise HTTPException(status_code=400, detail=f"Sync token is not for {collection_name}")
+    return version, issued
+
+
+async def changes_page(source: SyncSource, token: str | None, limit: int = PAGE_SIZE, owner: str | None = None):
+    """
+    One page of changes after `token`, oldest first:
+    {"changes": [{"op": "upsert", "id", "version", "doc"} | {"op": "delete", "id", "version"}],
+     "next_token", "has_more", "reset"}.
+    """
+    now = datetime.utcnow()
+    since, reset = 0, token is None
+    if token:
+        since, issued = decode_token(token, source.collection.name)
+        if issued < now - timedelta(seconds=TOMBSTONE_TTL):
+            # Deletions that old may already be forgotten: start over with everything.
+            since, reset = 0, True
+    horizon = now - timedelta(seconds=SETTLE_SECONDS)
+
+    query = {"version": {"$gt": since}}
+    tombstone_query = {"collection": source.collection.name, "version": {"$gt": since}}
+    if source.owner_field:
+        query[source.owner_field] = owner
+        tombstone_query["owner"] = owner
+    sort = [("version", ASCENDING)]
+    docs = [doc async for doc in iter_documents(source.collection, query, source.projection, sort, limit + 1)]
+    tombstones = [doc async for doc in iter_documents(
+        TOMBSTONES_COLLECTION, tombstone_query, {"doc_id": 1, "version": 1, "version_at": 1}, sort, limit + 1
+    )] if since else []
+
+    merged = sorted(
+        [("upsert", doc) for doc in docs] + [("delete", doc) for doc in tombstones],
+        key=lambda entry: entry[1]["version"],
+    )
+    changes, last = [], since
+    settling = False
+    for op, doc in merged[:limit]:
+        if doc.get("version_at", BACKFILL_STAMP_TIME) > horizon:
+            settling = True
+            break
+        last = doc["version"]
+        if op == "delete":
+            changes.append({"op": "delete", "id": convert_objectid(doc["doc_id"]), "version": last})
+        else:
+            changes.append({"op": "upsert", "id": str(doc["_id"]), "version": last, "doc": convert_objectid(doc)})
+    return {
+        "changes": changes,
+        "next_token": encode_token(source.collection.name, last, now),
+        "has_more": not settling and len(merged) > limit,
+        "reset": reset,
+    }
+
+
+async def backfill_versions(collections: list):
+    """Stamp documents written before change tracking (or by untracked paths) so full syncs include them."""
+    for collection in collections:
+        ids = [doc["_id"] async for doc in iter_documents(collection, {"version": {"$exists": False}}, {"_id": 1})]
+        if not ids:
+            continue
+        first = await reserve_versions(collection.name, len(ids))
+        await bulk_write(collection, [
+            UpdateOne({"_id": doc_id, "version": {"$exists": False}},
+                      {"$set": {"version": first + i, "version_at": BACKFILL_STAMP_TIME}})
+            for i, doc_id in enumerate(ids)
+        ])
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+from app.db import db
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.getenv("COMMUNITY_EVENTS_QUEUE_SIZE", "100"))
+# "memory" fans out within this process; "mongo" tails change streams so every
+# uvicorn worker sees every write (requires a replica set).
+BACKEND = os.getenv("COMMUNITY_EVENTS_BACKEND", "memory")
+
+CLOSED = object()
+
+
+class Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    async def next(self, timeout: float):
+        """Next event, None on timeout, or CLOSED once the hub dropped this subscriber."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """In-process broadcast hub; a subscriber whose queue fills up is dropped, never waited on."""
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.backend = None
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def _drop(self, subscriber: Subscriber):
+        self.unsubscribe(subscriber)
+        self.dropped += 1
+        subscriber.closed = True
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(CLOSED)
+
+    def deliver(self, event: dict):
+        """Fan an event out to local subscribers."""
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    async def publish(self, event: dict):
+        await self.backend.publish(event)
+
+    async def start(self, backend=None):
+        self.backend = backend or (MongoChangeStreamBackend(self) if BACKEND == "mongo" else InProcessBackend(self))
+        await self.backend.start()
+
+    async def stop(self):
+        if self.backend is not None:
+            await self.backend.stop()
+        for subscriber in list(self.subscribers):
+            self._drop(subscriber)
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "subscribers": len(self.subscribers),
+            "delivered": self.delivered,
+            "dropped_subscribers": self.dropped,
+        }
+
+
+class InProcessBackend:
+    def __init__(self, hub: EventHub):
+        self.hub = hub
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: dict):
+        self.hub.deliver(event)
+
+
+class MongoChangeStreamBackend:
+    """Turns inserts into community_posts and community_replies into events for every worker."""
+
+    def __init__(self, hub: EventHub):
+        self.hub = hub
+        self._tasks = []
+
+    async def start(self):
+        self._tasks = [
+            asyncio.ensure_future(self._watch("community_posts", "post")),
+            asyncio.ensure_future(self._watch("community_replies", "reply")),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def publish(self, event: dict):
+        # The write itself shows up on the change stream; nothing to send here.
+        pass
+
+    async def _watch(self, collection_name: str, event_type: str):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while True:
+            try:
+                async with db[collection_name].watch(pipeline) as stream:
+                    async for change in stream:
+                        doc = change["fullDocument"]
+                        if event_type == "reply":
+                            self.hub.deliver({"type": "reply", "post_id": str(doc.get("post_id")), "reply": doc})
+                        else:
+                            self.hub.deliver({"type": "post", "post": doc})
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change stream on %s failed, retrying", collection_name)
+                await asyncio.sleep(5)
+
+
+community_events = EventHub()
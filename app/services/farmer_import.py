@@ -0,0 +1,316 @@
+"""
+Streaming bulk import of farmer profiles.
+
+A CSV (header row first) or NDJSON upload is read chunk by chunk, split into records,
+validated against FarmerProfile in a worker thread and written as unordered bulk_write
+upserts keyed on user_id. At most one batch is being parsed and one being written at a
+time, so memory stays flat whatever the file size. Rows that fail validation or the write
+are reported by data row number (1-based, not counting the CSV header) and the rest of
+the file is still imported.
+
+Only users with a role in IMPORT_ROLES may import. Admins may create or update any
+profile; other importers (field agents) may create profiles and update those they
+imported themselves, never a registered user's own profile or another importer's.
+"""
+import asyncio
+import csv
+import json
+import os
+from datetime import datetime
+from fastapi import HTTPException
+from bson import ObjectId
+from pydantic import BaseModel, Field, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.db import db
+from app.services.crud import bulk_write, iter_documents
+from app.services.delta_sync import stamps
+
+BATCH_SIZE = int(os.getenv("FARMER_IMPORT_BATCH_SIZE", "1000"))
+MAX_ROWS = int(os.getenv("FARMER_IMPORT_MAX_ROWS", "1000000"))
+MAX_RECORD_BYTES = int(os.getenv("FARMER_IMPORT_MAX_RECORD_BYTES", "65536"))
+MAX_REPORTED_ERRORS = int(os.getenv("FARMER_IMPORT_MAX_REPORTED_ERRORS", "1000"))
+IMPORT_ROLES = tuple(role.strip() for role in os.getenv("FARMER_IMPORT_ROLES", "admin,field_agent").split(","))
+
+USERS_COLLECTION = db["users"]
+
+CSV, NDJSON = "csv", "ndjson"
+# CSV cells holding lists, e.g. crops "wheat;mustard".
+CSV_LIST_SEPARATOR = ";"
+CSV_LIST_FIELDS = {"crops"}
+
+
+class FarmerProfile(BaseModel):
+    user_id: str = Field(..., min_length=1, max_length=64)
+    name: str = Field(..., min_length=1, max_length=200)
+    phone: str | None = Field(None, max_length=20)
+    language: str = "hi"
+    village: str | None = None
+    district: str | None = None
+    state: str | None = None
+    city: str | None = None
+    lat: float | None = Field(None, ge=-90, le=90)
+    lon: float | None = Field(None, ge=-180, le=180)
+    land_acres: float | None = Field(None, ge=0)
+    soil_type: str | None = None
+    crops: list[str] = []
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "user_id": "KM-UP-000123",
+                "name": "Ramesh Kumar",
+                "phone": "9876543210",
+                "village": "Bhaupur",
+                "district": "Kanpur Nagar",
+                "state": "Uttar Pradesh",
+                "lat": 26.45,
+                "lon": 80.33,
+                "land_acres": 2.5,
+                "soil_type": "alluvial",
+                "crops": ["wheat", "mustard"],
+            }
+        }
+
+
+async def iter_records(chunks, fmt: str):
+    """
+    Yield the text of every non-blank record in the byte stream. CSV records may span
+    lines inside quoted cells; they are joined until their quotes balance.
+    """
+    pending = b""
+    record = b""
+    first = True
+
+    def complete(line: bytes):
+        nonlocal record, first
+        record = record + b"\n" + line if record else line
+        if len(record) > MAX_RECORD_BYTES:
+            raise HTTPException(status_code=413, detail=f"A record exceeds {MAX_RECORD_BYTES} bytes")
+        if fmt == CSV and record.count(b'"') % 2:
+            return None
+        text, record = record, b""
+        if not text.strip():
+            return None
+        encoding, first = "utf-8-sig" if first else "utf-8", False
+        return text.decode(encoding, errors="replace")
+
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        if len(pending) > MAX_RECORD_BYTES:
+            raise HTTPException(status_code=413, detail=f"A record exceeds {MAX_RECORD_BYTES} bytes")
+        for line in lines:
+            text = complete(line.rstrip(b"\r"))
+            if text is not None:
+                yield text
+    if pending:
+        text = complete(pending.rstrip(b"\r"))
+        if text is not None:
+            yield text
+    if record:
+        raise HTTPException(status_code=422, detail="The last record has an unterminated quoted cell")
+
+
+def _csv_row(header: list, text: str) -> dict:
+    cells = next(csv.reader([text]))
+    if len(cells) > len(header):
+        raise ValueError(f"{len(cells)} cells but the header has {len(header)} columns")
+    row = {}
+    for name, cell in zip(header, cells):
+        cell = cell.strip()
+        if not cell:
+            continue
+        row[name] = [item.strip() for item in cell.split(CSV_LIST_SEPARATOR) if item.strip()] \
+            if name in CSV_LIST_FIELDS else cell
+    return row
+
+
+def _error(row: int, errors: list, user_id=None) -> dict:
+    entry = {"row": row, "errors": errors}
+    if user_id is not None:
+        entry["user_id"] = user_id
+    return entry
+
+
+def prepare_batch(records: list, fmt: str, header: list | None, imported_by: str):
+    """
+    Validate one batch of (row, text) records. Returns ((filter, update) of each upsert,
+    (row, user_id) of each upsert, row errors). When a user_id repeats within the batch the last row wins and
+    the earlier one is reported as superseded, the same as across batches.
+    """
+    now = datetime.utcnow()
+    errors = []
+    latest = {}
+    for row, text in records:
+        try:
+            raw = _csv_row(header, text) if fmt == CSV else json.loads(text)
+            if not isinstance(raw, dict):
+                raise ValueError("expected a JSON object")
+        except (ValueError, csv.Error) as e:
+            errors.append(_error(row, [{"field": None, "message": f"Unreadable row: {e}"}]))
+            continue
+        try:
+            profile = FarmerProfile(**raw)
+        except ValidationError as e:
+            errors.append(_error(row, [
+                {"field": ".".join(str(part) for part in err["loc"]), "message": err["msg"]} for err in e.errors()
+            ], raw.get("user_id")))
+            continue
+        if profile.user_id in latest:
+            earlier = latest.pop(profile.user_id)[0]
+            errors.append(_error(earlier, [{"field": "user_id", "message": f"Superseded by row {row}"}],
+                                 profile.user_id))
+        latest[profile.user_id] = (row, profile, raw)
+
+    updates, rows = [], []
+    for user_id, (row, profile, raw) in latest.items():
+        # Columns missing from the row keep their stored value; defaults only apply to new profiles.
+        fields, defaults = {}, {}
+        for name, value in profile.dict(exclude_none=True).items():
+            (fields if name in raw else defaults)[name] = value
+        fields["updated_at"] = now
+        fields["imported_by"] = imported_by
+        updates.append(({"user_id": user_id}, {"$set": fields, "$setOnInsert": {**defaults, "created_at": now}}))
+        rows.append((row, user_id))
+    return updates, rows, errors
+
+
+async def restrict_to_managed(collection, updates: list, rows: list, imported_by: str):
+    """
+    Keep the upserts of profiles `imported_by` may manage: new ones and ones it imported.
+    The rest are returned as row errors. Kept filters also match on imported_by, so a
+    profile created by someone else meanwhile fails its write instead of being overwritten.
+    """
+    user_ids = [user_id for _, user_id in rows]
+    managers = {doc["user_id"]: doc.get("imported_by") async for doc in iter_documents(
+        collection, {"user_id": {"$in": user_ids}}, {"user_id": 1, "imported_by": 1}
+    )}
+    account_ids = [ObjectId(user_id) for user_id in user_ids if ObjectId.is_valid(user_id)]
+    accounts = {str(doc["_id"]) async for doc in iter_documents(
+        USERS_COLLECTION, {"_id": {"$in": account_ids}}, {"_id": 1}
+    )} if account_ids else set()
+
+    kept_updates, kept_rows, errors = [], [], []
+    for (key, update), (row, user_id) in zip(updates, rows):
+        if user_id in accounts:
+            message = "Belongs to a registered user, who manages their own profile"
+        elif managers.get(user_id, imported_by) != imported_by:
+            message = "Profile is managed by another user"
+        else:
+            kept_updates.append(({**key, "imported_by": imported_by}, update))
+            kept_rows.append((row, user_id))
+            continue
+        errors.append(_error(row, [{"field": "user_id", "message": message}], user_id))
+    return kept_updates, kept_rows, errors
+
+
+async def write_batch(collection, operations: list, rows: list):
+    """Returns (bulk_write summary, row errors); failed writes do not stop the rest of the batch."""
+    try:
+        return await bulk_write(collection, operations, ordered=False), []
+    except BulkWriteError as e:
+        details = e.details
+        summary = {"upserted": details.get("nUpserted", 0), "modified": details.get("nModified", 0)}
+        errors = []
+        for err in details.get("writeErrors", []):
+            row, user_id = rows[err["index"]]
+            errors.append(_error(row, [{"field": None, "message": err.get("errmsg", "write failed")}], user_id))
+        return summary, errors
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_errors(self, errors: list):
+        self.failed += len(errors)
+        room = MAX_REPORTED_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+    def add_write(self, written: int, summary: dict, errors: list):
+        self.add_errors(errors)
+        self.created += summary["upserted"]
+        self.updated += summary["modified"]
+        self.unchanged += written - len(errors) - summary["upserted"] - summary["modified"]
+
+    def as_dict(self, seconds: float):
+        self.errors.sort(key=lambda entry: entry["row"])
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds) if seconds else None,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def import_profiles(collection, chunks, fmt: str, imported_by: str, batch_size: int = BATCH_SIZE,
+                          may_manage_any: bool = False):
+    """
+    Import a CSV or NDJSON byte stream into `collection` on behalf of the user `imported_by`;
+    returns the report as a dict. Without `may_manage_any` only profiles that user may
+    manage are written (see restrict_to_managed).
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    report = ImportReport()
+    header = None
+    batch = []
+    writing = None
+
+    async def flush():
+        nonlocal writing, batch
+        records, batch = batch, []
+        updates, rows, errors = await asyncio.to_thread(prepare_batch, records, fmt, header, imported_by)
+        report.add_errors(errors)
+        if not may_manage_any:
+            updates, rows, denied = await restrict_to_managed(collection, updates, rows, imported_by)
+            report.add_errors(denied)
+        operations = [
+            UpdateOne(key, {**update, "$set": {**update["$set"], **version}}, upsert=True)
+            for (key, update), version in zip(updates, await stamps(collection.name, len(updates)))
+        ]
+        # Parse the next batch while this one is written, but keep batches in file order.
+        if writing is not None:
+            report.add_write(*await writing)
+        written = len(operations)
+
+        async def write():
+            summary, write_errors = await write_batch(collection, operations, rows)
+            return written, summary, write_errors
+
+        writing = asyncio.ensure_future(write())
+
+    try:
+        async for text in iter_records(chunks, fmt):
+            if fmt == CSV and header is None:
+                header = [name.strip() for name in next(csv.reader([text]))]
+                if "user_id" not in header:
+                    raise HTTPException(status_code=422, detail="The CSV header must include a user_id column")
+                continue
+            if report.rows >= MAX_ROWS:
+                raise HTTPException(status_code=413, detail=f"At most {MAX_ROWS} rows per import")
+            report.rows += 1
+            batch.append((report.rows, text))
+            if len(batch) >= batch_size:
+                await flush()
+        if batch:
+            await flush()
+        if writing is not None:
+            report.add_write(*await writing)
+            writing = None
+    finally:
+        if writing is not None and not writing.done():
+            writing.cancel()
+    return report.as_dict(loop.time() - started)
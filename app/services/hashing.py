@@ -0,0 +1,78 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# "thread" works because bcrypt releases the GIL while hashing; "process" isolates it completely.
+POOL_KIND = os.getenv("PASSWORD_HASH_POOL", "thread")
+POOL_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash requests waiting beyond this are rejected with 503 instead of piling up.
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def check_password(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+class HashingPool:
+    """Bounded worker pool for bcrypt with admission control and queue-depth metrics."""
+
+    def __init__(self, kind: str = POOL_KIND, workers: int = POOL_WORKERS, max_pending: int = MAX_PENDING):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            executor_cls = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            self._executor = executor_cls(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.busy_seconds += time.perf_counter() - started
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        return {
+            "pool": self.kind,
+            "workers": self.workers,
+            "in_flight": self.pending,
+            "queue_depth": max(0, self.pending - self.workers),
+            "peak_pending": self.peak_pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(1000 * self.busy_seconds / self.completed, 2) if self.completed else 0.0,
+        }
+
+
+hashing_pool = HashingPool()
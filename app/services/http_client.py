@@ -0,0 +1,120 @@
+import os
+import time
+import httpx
+from app.services.metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY, UPSTREAM_RESPONSES
+from app.services.resilience import ResilientTransport, get_breaker
+
+# Connection pool, timeout and resilience settings per upstream. Any value can be
+# overridden from the environment, e.g. SOIL_MAX_CONNECTIONS=50, SOIL_TIMEOUT=20,
+# WEATHER_HTTP2=1 or WEATHER_HEDGE_AFTER_MS=300.
+# quota_per_minute stays under the provider's limit (SoilGrids allows 5 calls a minute,
+# OpenWeatherMap's free plan 60); 0 disables it. hedge_after_ms 0 disables hedging.
+UPSTREAMS = {
+    "weather": {"max_connections": 100, "max_keepalive": 20, "timeout": 10.0, "connect_timeout": 5.0,
+                "retries": 2, "hedge_after_ms": 0, "quota_per_minute": 60},
+    "market": {"max_connections": 50, "max_keepalive": 10, "timeout": 20.0, "connect_timeout": 5.0,
+               "retries": 2, "hedge_after_ms": 0, "quota_per_minute": 100},
+    "soil": {"max_connections": 50, "max_keepalive": 10, "timeout": 30.0, "connect_timeout": 5.0,
+             "retries": 1, "hedge_after_ms": 0, "quota_per_minute": 5},
+    "schemes": {"max_connections": 5, "max_keepalive": 2, "timeout": 30.0, "connect_timeout": 10.0,
+                "retries": 2, "hedge_after_ms": 0, "quota_per_minute": 10},
+    # Chat completions are safe to repeat, so POSTs are retried too.
+    "openai": {"max_connections": 50, "max_keepalive": 20, "timeout": 60.0, "connect_timeout": 5.0,
+               "retries": 1, "hedge_after_ms": 0, "quota_per_minute": 500, "retry_post": True},
+}
+FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "5"))
+RESET_TIMEOUT = float(os.getenv("UPSTREAM_RESET_TIMEOUT", "30"))
+
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _setting(name: str, key: str, default, cast):
+    value = os.getenv(f"{name.upper()}_{key.upper()}")
+    return cast(value) if value is not None else default
+
+
+class TimedTransport(httpx.AsyncBaseTransport):
+    """Records latency to response headers, status codes and errors for one upstream."""
+
+    def __init__(self, upstream: str, transport: httpx.AsyncBaseTransport):
+        self.upstream = upstream
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(self.upstream, type(e).__name__)
+            raise
+        finally:
+            UPSTREAM_LATENCY.observe(time.perf_counter() - started, self.upstream)
+        UPSTREAM_RESPONSES.inc(self.upstream, str(response.status_code))
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    config = UPSTREAMS[name]
+    limits = httpx.Limits(
+        max_connections=_setting(name, "max_connections", config["max_connections"], int),
+        max_keepalive_connections=_setting(name, "max_keepalive", config["max_keepalive"], int),
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        _setting(name, "timeout", config["timeout"], float),
+        connect=_setting(name, "connect_timeout", config["connect_timeout"], float),
+    )
+    wants_http2 = _setting(name, "http2", os.getenv("HTTP_CLIENT_HTTP2", "0"), str) == "1"
+    transport = httpx.AsyncHTTPTransport(limits=limits, http2=wants_http2 and _http2_available())
+    resilient = ResilientTransport(
+        name,
+        TimedTransport(name, transport),
+        get_breaker(
+            name,
+            _setting(name, "failure_threshold", FAILURE_THRESHOLD, int),
+            _setting(name, "reset_timeout", RESET_TIMEOUT, float),
+        ),
+        retries=_setting(name, "retries", config["retries"], int),
+        hedge_after=_setting(name, "hedge_after_ms", config["hedge_after_ms"], float) / 1000,
+        quota_per_minute=_setting(name, "quota_per_minute", config["quota_per_minute"], float),
+        retry_methods=("GET", "HEAD", "POST") if config.get("retry_post") else ("GET", "HEAD"),
+    )
+    return httpx.AsyncClient(transport=resilient, timeout=timeout)
+
+
+async def init_http_clients():
+    """Create one pooled client per upstream. Called from the app lifespan."""
+    for name in UPSTREAMS:
+        if name not in _clients:
+            _clients[name] = _build_client(name)
+
+
+async def close_http_clients():
+    """Close every pooled client and release its sockets."""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """
+    Return the shared client for an upstream.
+    Falls back to creating it on first use so services also work outside the app lifespan (scripts, shells).
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build_client(name)
+    return client
@@ -0,0 +1,216 @@
+"""
+Declarative index registry for every collection, and one-off data migrations.
+
+Indexes are applied idempotently at startup. To verify that hot queries are index-backed:
+
+    python -m app.services.indexes --check          # explain() each hot query, exit 1 on a COLLSCAN
+    python -m app.services.indexes --apply --check  # create the indexes first
+
+Migrations are run once per deployment, not at every worker's startup:
+
+    python -m app.services.indexes --migrate        # move replies embedded in posts to community_replies
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import sys
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+from app.db import db
+from app.services.answer_cache import CACHE_TTL_SECONDS as ANSWER_TTL_SECONDS
+from app.services.crud import bulk_write, iter_documents
+from app.services.delta_sync import TOMBSTONE_TTL, backfill_versions
+from app.services.search import BACKEND as SEARCH_BACKEND
+from app.services.soil_cache import CACHE_TTL_SECONDS as SOIL_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def text_index(*fields: str) -> list:
+    """The text index searched by SearchIndex on `fields`, when search runs on Mongo."""
+    if SEARCH_BACKEND != "mongo":
+        return []
+    # default_language "none" disables English-only stemming so Hindi text is tokenized the same way.
+    return [IndexModel([(field, TEXT) for field in fields], default_language="none")]
+
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "farmers": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "community_posts": [
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("version", ASCENDING)]),
+        *text_index("title", "content"),
+    ],
+    "community_replies": [
+        IndexModel([("post_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("version", ASCENDING)]),
+        *text_index("message"),
+    ],
+    "gov_schemes": [
+        # Partial so manually added schemes without a key do not collide on null.
+        IndexModel(
+            [("scheme_key", ASCENDING)], unique=True, partialFilterExpression={"scheme_key": {"$exists": True}}
+        ),
+        IndexModel([("version", ASCENDING)]),
+        *text_index("title", "description", "eligibility"),
+    ],
+    "mandi_prices": [
+        IndexModel(
+            [("commodity", ASCENDING), ("state", ASCENDING), ("market", ASCENDING), ("arrival_date", DESCENDING)]
+        ),
+        IndexModel([("commodity", ASCENDING), ("arrival_date", DESCENDING)]),
+    ],
+    "soil_cache": [
+        IndexModel([("cached_at", ASCENDING)], expireAfterSeconds=SOIL_TTL_SECONDS),
+    ],
+    "assistant_answers": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=ANSWER_TTL_SECONDS),
+    ],
+    # Only used with RATE_LIMIT_BACKEND=mongo; idle buckets are full again long before this.
+    "rate_limits": [
+        IndexModel([("updated", ASCENDING)], expireAfterSeconds=3600),
+    ],
+    "sync_tombstones": [
+        IndexModel([("collection", ASCENDING), ("version", ASCENDING)]),
+        IndexModel(
+            [("owner", ASCENDING), ("collection", ASCENDING), ("version", ASCENDING)],
+            partialFilterExpression={"owner": {"$exists": True}},
+        ),
+        IndexModel([("deleted_at", ASCENDING)], expireAfterSeconds=TOMBSTONE_TTL),
+    ],
+}
+
+# (collection, filter, sort) for the queries the routers run on every request.
+HOT_QUERIES = [
+    ("users", {"email": "farmer@example.com"}, None),
+    ("farmers", {"user_id": "000000000000000000000000"}, None),
+    ("community_posts", {}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("community_replies", {"post_id": ObjectId()}, [("created_at", ASCENDING), ("_id", ASCENDING)]),
+    ("gov_schemes", {"scheme_key": {"$in": ["pm kisan"]}}, None),
+    ("mandi_prices", {"commodity": "wheat"}, [("arrival_date", DESCENDING)]),
+    ("mandi_prices", {"commodity": {"$in": ["wheat", "rice"]}, "state": "Punjab"}, None),
+    ("assistant_answers", {}, [("created_at", DESCENDING)]),
+    # Delta sync pages.
+    ("gov_schemes", {"version": {"$gt": 0}}, [("version", ASCENDING)]),
+    ("community_posts", {"version": {"$gt": 0}}, [("version", ASCENDING)]),
+    ("community_replies", {"version": {"$gt": 0}}, [("version", ASCENDING)]),
+    ("farmers", {"user_id": "000000000000000000000000", "version": {"$gt": 0}}, [("version", ASCENDING)]),
+    ("sync_tombstones", {"collection": "gov_schemes", "version": {"$gt": 0}}, [("version", ASCENDING)]),
+    ("sync_tombstones", {"collection": "farmers", "version": {"$gt": 0}, "owner": "000000000000000000000000"},
+     [("version", ASCENDING)]),
+]
+if SEARCH_BACKEND == "mongo":
+    HOT_QUERIES += [
+        ("community_posts", {"$text": {"$search": "wheat"}}, None),
+        ("community_replies", {"$text": {"$search": "wheat"}}, None),
+        ("gov_schemes", {"$text": {"$search": "kisan"}}, None),
+    ]
+
+
+async def ensure_indexes():
+    """
+    Create every registered index; existing identical indexes are left alone.
+    Raises RuntimeError when a unique index cannot be built: writes such as
+    /farmer/create rely on it to reject duplicates, so the app must not serve without it.
+    """
+    for collection_name, models in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            if any(model.document.get("unique") for model in models):
+                # e.g. existing duplicates; they have to be cleaned up before starting.
+                raise RuntimeError(f"Could not create the unique index on {collection_name}: {e}") from e
+            # A missing secondary index only slows queries; keep serving and let --check report it.
+            logger.error("Could not create indexes on %s: %s", collection_name, e)
+
+
+def embedded_reply_id(post_id: ObjectId, index: int) -> ObjectId:
+    """The same id each time the reply at `index` of a post is migrated, so a re-run cannot duplicate it."""
+    digest = hashlib.blake2b(post_id.binary + index.to_bytes(4, "big"), digest_size=8).digest()
+    # Keep the post's timestamp prefix so the ids sort like ObjectIds of that time.
+    return ObjectId(post_id.binary[:4] + digest)
+
+
+async def migrate_embedded_replies():
+    """
+    Move replies embedded in posts by older versions into community_replies.
+    Safe to re-run, or to run from several processes: replies are upserted under
+    deterministic ids, and a post's embedded replies are only removed, in the same update
+    that counts them, after all of them are written and if they did not change meanwhile.
+    """
+    posts, replies = db["community_posts"], db["community_replies"]
+    moved = 0
+    async for post in iter_documents(posts, {"replies": {"$exists": True}}, {"replies": 1}):
+        embedded = post.get("replies") or []
+        await bulk_write(replies, [
+            UpdateOne(
+                {"_id": embedded_reply_id(post["_id"], i)},
+                {"$setOnInsert": {**reply, "post_id": post["_id"]}},
+                upsert=True,
+            )
+            for i, reply in enumerate(embedded)
+        ])
+        result = await posts.update_one(
+            {"_id": post["_id"], "replies": post["replies"]},
+            {"$unset": {"replies": ""}, "$inc": {"reply_count": len(embedded)}},
+        )
+        moved += len(embedded) if result.modified_count else 0
+    # Give the moved replies versions so delta sync clients receive them.
+    await backfill_versions([replies])
+    return moved
+
+
+def _stages(plan):
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        yield from _stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def check_query_plans():
+    """Return [(collection, filter, stages)] for each hot query whose winning plan scans the collection."""
+    failures = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query).limit(20)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            stages = list(_stages((await cursor.explain())["queryPlanner"]["winningPlan"]))
+            status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        except OperationFailure as e:
+            # A $text query has no scan to fall back to; without its index it fails.
+            stages, status = [str(e)], "NO INDEX"
+        print(f"{status:9} {collection_name:18} {query} -> {' < '.join(stages)}")
+        if status != "ok":
+            failures.append((collection_name, query, stages))
+    return failures
+
+
+async def main(apply: bool, check: bool, migrate: bool):
+    if apply:
+        await ensure_indexes()
+    if migrate:
+        print(f"moved {await migrate_embedded_replies()} embedded replies to community_replies")
+    if check and await check_query_plans():
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="create the registered indexes first")
+    parser.add_argument("--check", action="store_true", help="fail if a hot query plans a collection scan")
+    parser.add_argument("--migrate", action="store_true", help="run the one-off data migrations")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.apply, args.check or not (args.apply or args.migrate), args.migrate)))
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from app.services import disease_model
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("DISEASE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+MAX_BATCH_SIZE = int(os.getenv("DISEASE_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.getenv("DISEASE_MAX_WAIT_MS", "10"))
+QUEUE_SIZE = int(os.getenv("DISEASE_QUEUE_SIZE", "256"))
+MAX_UPLOAD_BYTES = int(os.getenv("DISEASE_MAX_UPLOAD_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+async def read_upload(file, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read an UploadFile in chunks, failing with 413 as soon as it exceeds max_bytes."""
+    chunks, total = [], 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image larger than {max_bytes // 1024} KB")
+        chunks.append(chunk)
+    if not total:
+        raise HTTPException(status_code=400, detail="Empty upload")
+    return b"".join(chunks)
+
+
+class MicroBatcher:
+    """
+    Groups concurrent requests into batches of up to max_batch_size, waiting at most
+    max_wait_ms for a batch to fill, and runs them on a process pool whose workers load
+    the model once. A full queue rejects new work with 503 instead of growing.
+    """
+
+    def __init__(self, predict=disease_model.predict_batch, workers: int = WORKERS,
+                 max_batch_size: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_WAIT_MS,
+                 queue_size: int = QUEUE_SIZE):
+        self.predict = predict
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue_size = queue_size
+        self._queue = None
+        self._executor = None
+        self._task = None
+        self._slots = None
+        self._running = set()
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._slots = asyncio.Semaphore(self.workers)
+            self._task = asyncio.ensure_future(self._collect())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=disease_model.init_worker)
+        return self._executor
+
+    async def submit(self, data: bytes):
+        if self._task is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((data, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Disease detection is busy, please retry", headers={"Retry-After": "1"})
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Wait for a free worker before collecting the next batch, so batches fill up under load.
+            await self._slots.acquire()
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), self.predict, [data for data, _ in batch]
+            )
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            logger.exception("Inference batch failed")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "images": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "rejected": self.rejected,
+        }
+
+
+disease_batcher = MicroBatcher()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from app.services.http_client import get_http_client
+from app.services.settings import require_key
+
+SYSTEM_PROMPT = "You are KrishiMitra, an AI assistant for farmers. Answer simply and in Hindi if farmer asks in Hindi."
+MODEL = os.getenv("ASSISTANT_MODEL", "gpt-4o-mini")
+# "openai" talks to the real API; "fake" answers locally for tests and benchmarks.
+BACKEND = os.getenv("ASSISTANT_BACKEND", "openai")
+MAX_CONCURRENCY = int(os.getenv("ASSISTANT_MAX_CONCURRENCY", "20"))
+QUEUE_TIMEOUT = float(os.getenv("ASSISTANT_QUEUE_TIMEOUT", "10"))
+
+
+def _messages(query: str):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": query}
+    ]
+
+
+class OpenAIChatBackend:
+    def __init__(self, api_key: str, model: str = MODEL):
+        from openai import AsyncOpenAI
+
+        # Retries happen in the shared transport, under the global retry budget.
+        self.client = AsyncOpenAI(api_key=api_key, http_client=get_http_client("openai"), max_retries=0)
+        self.model = model
+
+    async def complete(self, query: str) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=_messages(query),
+            temperature=0.6,
+            max_tokens=200
+        )
+        return response.choices[0].message.content
+
+    async def stream(self, query: str):
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=_messages(query),
+            temperature=0.6,
+            max_tokens=200,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class FakeChatBackend:
+    """Local stand-in that streams a canned answer word by word with configurable latency."""
+
+    def __init__(self, first_token_delay: float = 0.05, token_delay: float = 0.01):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+
+    def _answer(self, query: str):
+        return f"KrishiMitra (offline): you asked '{query}'. Please consult your local Krishi Vigyan Kendra for details."
+
+    async def complete(self, query: str) -> str:
+        return "".join([token async for token in self.stream(query)])
+
+    async def stream(self, query: str):
+        await asyncio.sleep(self.first_token_delay)
+        for i, word in enumerate(self._answer(query).split(" ")):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
+
+
+_backend = None
+_slots = asyncio.Semaphore(MAX_CONCURRENCY)
+
+
+def set_chat_backend(backend):
+    """Swap the upstream, e.g. for a FakeChatBackend in tests."""
+    global _backend
+    _backend = backend
+
+
+def get_chat_backend():
+    global _backend
+    if _backend is None:
+        if BACKEND == "fake":
+            _backend = FakeChatBackend(
+                first_token_delay=float(os.getenv("ASSISTANT_FAKE_FIRST_TOKEN_DELAY", "0.05")),
+                token_delay=float(os.getenv("ASSISTANT_FAKE_TOKEN_DELAY", "0.01")),
+            )
+        else:
+            _backend = OpenAIChatBackend(require_key("assistant"))
+    return _backend
+
+
+@asynccontextmanager
+async def llm_slot():
+    """Hold one of ASSISTANT_MAX_CONCURRENCY upstream slots, or fail with 503 after ASSISTANT_QUEUE_TIMEOUT."""
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Assistant is busy, please try again shortly")
+    try:
+        yield
+    finally:
+        _slots.release()
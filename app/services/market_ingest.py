@@ -0,0 +1,86 @@
+import os
+from datetime import datetime
+from pymongo import UpdateOne
+from app.db import db
+from app.services.crud import bulk_write
+from app.services.http_client import get_http_client
+from app.services.scheduler import PeriodicJob
+from app.services.settings import require_key
+
+RESOURCE_ID = "9ef84268-d588-465a-a308-a864a43d0070"
+RESOURCE_URL = f"{os.getenv('MARKET_API_BASE_URL', 'https://api.data.gov.in')}/resource/{RESOURCE_ID}"
+PAGE_SIZE = int(os.getenv("MARKET_INGEST_PAGE_SIZE", "5000"))
+INGEST_INTERVAL = float(os.getenv("MARKET_INGEST_INTERVAL", str(6 * 3600)))
+
+MARKET_COLLECTION = db["mandi_prices"]
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%d/%m/%Y")
+    except (TypeError, ValueError):
+        return None
+
+
+def to_price_document(record: dict):
+    """Map a data.gov.in record to the stored shape; commodity is lower-cased for lookups."""
+    return {
+        "commodity": (record.get("commodity") or "").strip().lower(),
+        "commodity_name": record.get("commodity"),
+        "state": record.get("state"),
+        "district": record.get("district"),
+        "market": record.get("market"),
+        "variety": record.get("variety"),
+        "grade": record.get("grade"),
+        "arrival_date": _parse_date(record.get("arrival_date")),
+        "min_price": record.get("min_price"),
+        "max_price": record.get("max_price"),
+        "modal_price": record.get("modal_price"),
+    }
+
+
+async def upsert_price_records(records: list):
+    if not records:
+        return 0
+    now = datetime.utcnow()
+    operations = []
+    for record in records:
+        doc = to_price_document(record)
+        key = {k: doc[k] for k in ("commodity", "state", "market", "arrival_date", "variety", "grade")}
+        operations.append(UpdateOne(key, {"$set": {**doc, "ingested_at": now}}, upsert=True))
+    result = await bulk_write(MARKET_COLLECTION, operations)
+    return result["upserted"] + result["modified"]
+
+
+async def fetch_price_page(api_key: str, offset: int, limit: int = PAGE_SIZE, commodity: str | None = None):
+    params = {"api-key": api_key, "format": "json", "limit": limit, "offset": offset}
+    if commodity:
+        params["filters[commodity]"] = commodity
+    response = await get_http_client("market").get(RESOURCE_URL, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+async def ingest_market_prices():
+    """Page through the whole RESOURCE_ID dataset and upsert every record."""
+    api_key = require_key("market")
+    offset = 0
+    pages = 0
+    fetched = 0
+    written = 0
+    while True:
+        data = await fetch_price_page(api_key, offset)
+        records = data.get("records") or []
+        if not records:
+            break
+        written += await upsert_price_records(records)
+        fetched += len(records)
+        pages += 1
+        offset += len(records)
+        total = int(data.get("total") or 0)
+        if total and offset >= total:
+            break
+    return {"pages": pages, "records_fetched": fetched, "records_written": written}
+
+
+market_ingest_job = PeriodicJob("market_ingest", ingest_market_prices, INGEST_INTERVAL, leased=True)
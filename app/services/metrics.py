@@ -0,0 +1,431 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Counters, gauges and histograms are plain objects keyed by label values, so recording a
+sample on the hot path is a dict lookup and an addition. Numbers other modules already
+keep (cache hits, pool queues) are read at scrape time by collectors instead of being
+counted twice.
+"""
+import asyncio
+import bisect
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter as _Tally
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "krishimitra_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, name: str, collect):
+        """
+        `collect()` returns [(metric_name, kind, help, labels, value), ...] at scrape time.
+        Registering the same name again replaces the collector.
+        """
+        self._collectors[name] = collect
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+
+        # Samples of one metric must be contiguous, so group collector output by name.
+        families = {}
+        for name, collect in list(self._collectors.items()):
+            try:
+                samples = collect()
+            except Exception:
+                logger.exception("Metrics collector %s failed", name)
+                continue
+            for metric_name, kind, help_text, labels, value in samples:
+                family = families.setdefault(metric_name, [f"# HELP {metric_name} {help_text}", f"# TYPE {metric_name} {kind}"])
+                family.append(f"{metric_name}{_format_labels(labels)} {_format_value(value)}")
+        for family in families.values():
+            lines.extend(family)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels=(), registry: Registry = REGISTRY):
+        self.name = PREFIX + name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        # Mongo command listeners report from driver threads.
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _labels(self, values):
+        return dict(zip(self.labels, values))
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in list(self._values.items()):
+            yield "", self._labels(labels), value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def samples(self):
+        for labels, value in list(self._values.items()):
+            yield "", self._labels(labels), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        super().__init__(name, help_text, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum, count.
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in list(self._values.items()):
+            base = self._labels(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield "_bucket", {**base, "le": _format_value(float(bound))}, cumulative
+            yield "_sum", base, total
+            yield "_count", base, count
+
+
+# --- Metrics recorded on the hot path ---
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served, by route group", ("group",))
+
+UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds", "Time to response headers from external APIs", ("upstream",))
+UPSTREAM_RESPONSES = Counter("upstream_responses_total", "External API responses by status", ("upstream", "status"))
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "External API calls that failed without a response", ("upstream", "error"))
+
+MONGO_LATENCY = Histogram("mongo_command_duration_seconds", "MongoDB command latency", ("command", "collection"))
+MONGO_FAILURES = Counter("mongo_command_failures_total", "Failed MongoDB commands", ("command", "collection"))
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a periodic timer",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+# --- Scrape-time collectors ---
+
+_caches = {}
+_stats = {}
+
+# stats() key -> result label of the cache lookup counter
+CACHE_RESULTS = {
+    "hits": "hit", "stale_hits": "stale", "exact_hits": "hit_exact", "near_hits": "hit_near",
+    "misses": "miss", "fallbacks": "fallback",
+}
+
+
+def register_cache(name: str, stats):
+    """Export a cache's hit/miss counters and size from its `stats()` callable."""
+    _caches[name] = stats
+
+
+def register_stats(subsystem: str, stats):
+    """Export every numeric value of `stats()` as a gauge named after the subsystem and key."""
+    _stats[subsystem] = stats
+
+
+def _collect_caches():
+    samples = []
+    for name, stats in _caches.items():
+        values = stats()
+        for key, result in CACHE_RESULTS.items():
+            if key in values:
+                samples.append((PREFIX + "cache_lookups_total", "counter", "Cache lookups by result",
+                                {"cache": name, "result": result}, values[key]))
+        size = values.get("size", values.get("entries"))
+        if size is not None:
+            samples.append((PREFIX + "cache_entries", "gauge", "Entries held by the cache", {"cache": name}, size))
+    return samples
+
+
+def _collect_stats():
+    samples = []
+    for subsystem, stats in _stats.items():
+        for key, value in stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                samples.append((f"{PREFIX}{subsystem}_{key}", "gauge", f"{subsystem} {key}", {}, value))
+    return samples
+
+
+def _collect_loop_lag():
+    # Report the window maximum once, then start a new window.
+    return [(PREFIX + "event_loop_lag_max_seconds", "gauge", "Largest event-loop lag since the previous scrape",
+             {}, loop_lag_monitor.take_max())]
+
+
+REGISTRY.add_collector("caches", _collect_caches)
+REGISTRY.add_collector("stats", _collect_stats)
+REGISTRY.add_collector("loop_lag", _collect_loop_lag)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times every command the driver sends, including those not issued through crud."""
+
+    def __init__(self):
+        self._collections = {}
+
+    @staticmethod
+    def _key(event):
+        return event.request_id, event.connection_id
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._collections[self._key(event)] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event):
+        collection = self._collections.pop(self._key(event), "")
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, event.command_name, collection)
+
+    def failed(self, event):
+        collection = self._collections.pop(self._key(event), "")
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, event.command_name, collection)
+        MONGO_FAILURES.inc(event.command_name, collection)
+
+
+class LoopLagMonitor:
+    """Wakes every `interval` seconds and records how late the wake-up was."""
+
+    def __init__(self, interval: float = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))):
+        self.interval = interval
+        self._task = None
+        self._max = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def take_max(self) -> float:
+        value, self._max = self._max, 0.0
+        return value
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG.observe(lag)
+            self._max = max(self._max, lag)
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+
+# --- Sampled request profiler ---
+
+def _await_stack(coroutine):
+    """Frames of a suspended task, outermost first, following the chain of awaits."""
+    frames = []
+    while coroutine is not None:
+        frame = getattr(coroutine, "cr_frame", None) or getattr(coroutine, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coroutine = getattr(coroutine, "cr_await", None) or getattr(coroutine, "gi_yieldfrom", None)
+    return frames
+
+
+def _collapse(frames) -> str:
+    return ";".join(
+        f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}" for frame in frames
+    )
+
+
+class RequestProfiler:
+    """
+    Opt-in sampling profiler. For a `sample_rate` fraction of requests it records, every
+    `interval_ms`, where the request's task is suspended, and keeps the `keep` slowest
+    sampled requests with their collapsed stacks. CPU-bound stretches cannot be sampled
+    while they block the loop; they show up as event-loop lag instead.
+    """
+
+    def __init__(self, sample_rate: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+                 interval_ms: float = float(os.getenv("PROFILE_INTERVAL_MS", "5")),
+                 keep: int = int(os.getenv("PROFILE_KEEP", "20"))):
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.keep = keep
+        self._slowest = []
+        self._sequence = itertools.count()
+        self.sampled = 0
+
+    def begin(self):
+        """Start sampling the current task, or return None when this request is not sampled."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        task = asyncio.current_task()
+        if task is None:
+            return None
+        self.sampled += 1
+        sample = {"stacks": _Tally(), "handle": None}
+        self._schedule(task, sample)
+        return sample
+
+    def _schedule(self, task, sample):
+        sample["handle"] = asyncio.get_running_loop().call_later(self.interval, self._sample, task, sample)
+
+    def _sample(self, task, sample):
+        if task.done():
+            return
+        frames = _await_stack(task.get_coro())
+        if frames:
+            sample["stacks"][_collapse(frames)] += 1
+        self._schedule(task, sample)
+
+    def end(self, sample, method: str, route: str, seconds: float):
+        sample["handle"].cancel()
+        entry = {
+            "method": method,
+            "route": route,
+            "duration_ms": round(seconds * 1000, 2),
+            "samples": sum(sample["stacks"].values()),
+            "stacks": [{"stack": stack, "count": count} for stack, count in sample["stacks"].most_common(20)],
+        }
+        item = (seconds, next(self._sequence), entry)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, item)
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def report(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "interval_ms": self.interval * 1000,
+            "sampled_requests": self.sampled,
+            "slowest": [entry for _, _, entry in sorted(self._slowest, reverse=True)],
+        }
+
+
+profiler = RequestProfiler()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency and status counts, in-flight requests per
+    route group (first path segment) and, for sampled requests, a profile.
+    Routes are labelled by their template (/weather/weather/{city}), not the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._groups = None
+
+    def _group(self, scope) -> str:
+        if self._groups is None:
+            routes = getattr(scope.get("app"), "routes", [])
+            self._groups = {"/" + route.path.strip("/").split("/")[0] for route in routes if hasattr(route, "path")}
+        segment = "/" + scope["path"].strip("/").split("/")[0]
+        return segment if segment in self._groups else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        group = self._group(scope)
+        HTTP_IN_FLIGHT.inc(group)
+        sample = profiler.begin()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec(group)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(method, route, str(status))
+            HTTP_LATENCY.observe(elapsed, method, route)
+            if sample is not None:
+                profiler.end(sample, method, route, elapsed)
@@ -0,0 +1,65 @@
+import os
+import time
+from app.services.cache import LRUCache
+
+PRINCIPAL_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+# Principals carrying a role (admins, field agents) are re-read sooner: a revoked role
+# stops working within this many seconds in every worker.
+PRINCIPAL_ROLE_TTL = float(os.getenv("PRINCIPAL_CACHE_ROLE_TTL", "10"))
+PRINCIPAL_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_ENTRIES", "10000"))
+
+
+class PrincipalCache:
+    """
+    Authenticated users keyed by token subject.
+    An entry lives for PRINCIPAL_CACHE_TTL seconds at most (PRINCIPAL_CACHE_ROLE_TTL when it
+    has a role) and never past its token's `exp`. That is also how long a change made to a
+    user in the database (a removed account, a revoked role) takes to apply.
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_TTL, maxsize: int = PRINCIPAL_ENTRIES,
+                 role_ttl: float = PRINCIPAL_ROLE_TTL):
+        self.ttl = ttl
+        self.role_ttl = role_ttl
+        self._entries = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, subject: str):
+        entry = self._entries.get(subject)
+        if entry is not None:
+            principal, expires_at = entry
+            if time.time() < expires_at:
+                self.hits += 1
+                return dict(principal)
+            self._entries.pop(subject)
+        self.misses += 1
+        return None
+
+    def set(self, subject: str, principal: dict, token_exp: float | None = None):
+        expires_at = time.time() + (min(self.ttl, self.role_ttl) if principal.get("role") else self.ttl)
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        self._entries.set(subject, (dict(principal), expires_at))
+
+    def invalidate(self, subject: str):
+        """Drop a user's cached principal; call whenever the user document changes or is deleted."""
+        if self._entries.pop(subject) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "role_ttl_seconds": self.role_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+principal_cache = PrincipalCache()
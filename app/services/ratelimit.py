@@ -0,0 +1,212 @@
+"""
+Per-client rate limiting and priority load shedding.
+
+Each request is matched to a route group and charged to a token bucket keyed by group
+and caller (user id from a valid bearer token, otherwise client IP). Buckets live in a
+pluggable backend: "memory" keeps them in this process, "mongo" keeps them in the
+rate_limits collection so every uvicorn worker shares them.
+
+When more than MAX_IN_FLIGHT requests are being served, requests are shed by priority:
+expensive endpoints first, then anonymous traffic, and authenticated core endpoints last.
+"""
+import logging
+import math
+import os
+import time
+from datetime import datetime
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+from pymongo import ReturnDocument
+from app.db import db
+from app.services.cache import LRUCache
+from app.services.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+MEMORY_KEYS = int(os.getenv("RATE_LIMIT_MEMORY_KEYS", "100000"))
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "512"))
+
+RATE_LIMIT_COLLECTION = db["rate_limits"]
+
+CRITICAL, NORMAL, EXPENSIVE = 0, 1, 2
+PRIORITY_NAMES = {CRITICAL: "critical", NORMAL: "normal", EXPENSIVE: "expensive"}
+# Share of MAX_IN_FLIGHT above which requests of each priority are shed.
+SHED_AT = {CRITICAL: 1.0, NORMAL: 0.85, EXPENSIVE: 0.6}
+
+RATE_LIMITED = Counter("rate_limited_total", "Requests rejected by the per-client rate limit", ("group",))
+SHED = Counter("load_shed_total", "Requests shed under overload", ("group", "priority"))
+
+
+class RouteGroup:
+    """Paths sharing one rate limit (tokens per second, burst) and one shedding priority."""
+
+    def __init__(self, name: str, prefixes: tuple, rate: float, burst: int, priority: int,
+                 counts_in_flight: bool = True):
+        self.name = name
+        self.prefixes = prefixes
+        # RATE_LIMIT_<GROUP>="rate,burst" overrides the defaults.
+        override = os.getenv(f"RATE_LIMIT_{name.upper()}")
+        if override:
+            rate_text, _, burst_text = override.partition(",")
+            rate, burst = float(rate_text), int(burst_text or burst)
+        self.rate = rate
+        self.burst = burst
+        self.priority = priority
+        # Long-lived streams are rate limited on connect but not counted as in-flight work.
+        self.counts_in_flight = counts_in_flight
+
+
+EXEMPT_PREFIXES = ("/health", "/metrics", "/docs", "/openapi.json", "/redoc")
+
+# First matching group wins.
+ROUTE_GROUPS = [
+    RouteGroup("assistant", ("/assistant/ask",), 0.2, 5, EXPENSIVE),
+    RouteGroup("disease", ("/disease/detect",), 0.5, 5, EXPENSIVE),
+    RouteGroup("bulk", ("/crop/recommend/batch", "/farmer/import"), 0.1, 3, EXPENSIVE),
+    RouteGroup("login", ("/auth/login", "/auth/signup"), 0.2, 10, CRITICAL),
+    RouteGroup("streams", ("/community/stream",), 0.1, 5, NORMAL, counts_in_flight=False),
+    RouteGroup("upstream", ("/weather", "/market", "/soil", "/dashboard"), 2, 30, NORMAL),
+    RouteGroup("default", ("/",), 10, 100, NORMAL),
+]
+
+
+def match_group(path: str):
+    if path.startswith(EXEMPT_PREFIXES) or path == "/":
+        return None
+    for group in ROUTE_GROUPS:
+        if path.startswith(group.prefixes):
+            return group
+    return None
+
+
+class MemoryBackend:
+    """Token buckets in a bounded LRU; the least recently seen callers are forgotten first."""
+
+    def __init__(self, max_keys: int = MEMORY_KEYS):
+        self._buckets = LRUCache(max_keys)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1):
+        """Take `cost` tokens; returns (allowed, seconds until enough tokens are available)."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets.set(key, (tokens, now))
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+class MongoBackend:
+    """
+    Token buckets shared by every worker: one atomic find_one_and_update per request,
+    refilling and spending in a pipeline update. Idle buckets expire via a TTL index.
+    """
+
+    def __init__(self, collection=RATE_LIMIT_COLLECTION):
+        self.collection = collection
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1):
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated", now]}]}, 1000]}
+        refilled = {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]}
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return True, 0.0
+        return False, (cost - doc["tokens"]) / rate
+
+
+_backend = None
+
+
+def get_limiter_backend():
+    global _backend
+    if _backend is None:
+        _backend = MongoBackend() if BACKEND == "mongo" else MemoryBackend()
+    return _backend
+
+
+def set_limiter_backend(backend):
+    """Swap the token-bucket store, e.g. for a shared store in multi-worker deployments."""
+    global _backend
+    _backend = backend
+
+
+def _reject(status: int, detail: str, retry_after: float):
+    return JSONResponse(
+        {"detail": detail}, status_code=status, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying per-client token buckets per route group and priority load shedding."""
+
+    def __init__(self, app):
+        from app.routers.auth import ALGORITHM, SECRET_KEY
+
+        self.app = app
+        self.secret_key = SECRET_KEY
+        self.algorithm = ALGORITHM
+        self.in_flight = 0
+
+    def identify(self, scope):
+        """Return (bucket key, authenticated) for the caller."""
+        headers = dict(scope["headers"])
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if authorization.startswith("Bearer "):
+            try:
+                subject = jwt.decode(authorization[7:], self.secret_key, algorithms=[self.algorithm]).get("sub")
+            except JWTError:
+                subject = None
+            if subject:
+                return f"user:{subject}", True
+        forwarded = headers.get(b"x-forwarded-for") if TRUST_FORWARDED_FOR else None
+        if forwarded:
+            return f"ip:{forwarded.decode('latin-1').split(',')[0].strip()}", False
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}", False
+
+    async def __call__(self, scope, receive, send):
+        group = match_group(scope["path"]) if ENABLED and scope["type"] == "http" else None
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        key, authenticated = self.identify(scope)
+        priority = max(CRITICAL, group.priority - 1) if authenticated else group.priority
+        if group.counts_in_flight and self.in_flight >= MAX_IN_FLIGHT * SHED_AT[priority]:
+            SHED.inc(group.name, PRIORITY_NAMES[priority])
+            await _reject(503, "Server is busy, please retry", 1)(scope, receive, send)
+            return
+
+        try:
+            allowed, retry_after = await get_limiter_backend().take(f"{group.name}:{key}", group.rate, group.burst)
+        except Exception as e:
+            # A broken limiter store must not take the API down with it.
+            logger.warning("Rate limiter unavailable, allowing request: %r", e)
+            allowed, retry_after = True, 0.0
+        if not allowed:
+            RATE_LIMITED.inc(group.name)
+            await _reject(429, "Too many requests", retry_after)(scope, receive, send)
+            return
+
+        if not group.counts_in_flight:
+            await self.app(scope, receive, send)
+            return
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,345 @@
+"""
+Resilience for calls to external APIs.
+
+ResilientTransport wraps the transport of every pooled upstream client
+(app.services.http_client), so all call sites get, without changes:
+
+- a circuit breaker per upstream that fails fast while the upstream is down,
+- bounded retries with jittered exponential backoff, limited by one global retry budget,
+- optional hedged GETs that race a second attempt against a slow first one,
+- a per-upstream quota that keeps us under the provider's rate limit.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import httpx
+from fastapi import HTTPException
+from app.services.metrics import REGISTRY, PREFIX, Counter
+from app.services.ratelimit import get_limiter_backend
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 502, 503, 504}
+BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.1"))
+BACKOFF_CAP = float(os.getenv("UPSTREAM_BACKOFF_CAP", "2.0"))
+QUOTA_MAX_WAIT = float(os.getenv("UPSTREAM_QUOTA_MAX_WAIT", "2.0"))
+
+RETRIES = Counter("upstream_retries_total", "Retried upstream attempts", ("upstream",))
+HEDGES = Counter("upstream_hedges_total", "Hedged second attempts and which attempt won", ("upstream", "winner"))
+FAST_FAILS = Counter("upstream_fast_fails_total", "Calls rejected without reaching the upstream", ("upstream", "reason"))
+QUOTA_WAITS = Counter("upstream_quota_waits_total", "Calls delayed to stay within the upstream quota", ("upstream",))
+
+
+class UpstreamUnavailable(httpx.TransportError):
+    """The call was not sent. Subclasses httpx errors so existing handlers treat it as a failed call."""
+
+    def __init__(self, message: str, upstream: str, retry_after: float):
+        super().__init__(message)
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class QuotaExceededError(UpstreamUnavailable):
+    pass
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """True for errors meaning the upstream could not answer, as opposed to a bad request."""
+    if isinstance(error, HTTPException):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, httpx.HTTPError)
+
+
+def unavailable_response(error: UpstreamUnavailable) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"{error.upstream} is temporarily unavailable, please retry",
+        headers={"Retry-After": str(max(1, round(error.retry_after)))},
+    )
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds; then lets one probe through (half-open) and closes again
+    when it succeeds.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self._probing = False
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(f"{self.name} circuit is open", self.name, remaining)
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                raise CircuitOpenError(f"{self.name} circuit is half-open", self.name, 1.0)
+            self._probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        if self.state != self.CLOSED:
+            logger.info("Circuit for %s closed", self.name)
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            logger.warning("Circuit for %s opened after %d failures", self.name, self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.opened += 1
+
+    def release(self):
+        """The call was abandoned (e.g. cancelled) before it produced a result."""
+        self._probing = False
+
+    def status(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.opened,
+            "retry_in_seconds": round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+            if self.state == self.OPEN else 0.0,
+        }
+
+
+class RetryBudget:
+    """
+    Caps retries and hedges at `ratio` of first attempts across all upstreams, plus a
+    floor of `min_per_second` so quiet upstreams can still retry. Under a wide outage
+    this keeps retries from multiplying the load on an already failing provider.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, max_balance: float = 50.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self.balance = max_balance
+        self._updated = time.monotonic()
+        self.spent = 0
+        self.exhausted = 0
+
+    def _refill(self, amount: float):
+        self.balance = min(self.max_balance, self.balance + amount)
+
+    def record_request(self):
+        self._refill(self.ratio)
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self._refill((now - self._updated) * self.min_per_second)
+        self._updated = now
+        if self.balance >= 1:
+            self.balance -= 1
+            self.spent += 1
+            return True
+        self.exhausted += 1
+        return False
+
+
+retry_budget = RetryBudget(
+    ratio=float(os.getenv("RETRY_BUDGET_RATIO", "0.1")),
+    min_per_second=float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1")),
+)
+
+
+class UpstreamQuota:
+    """
+    Token bucket per upstream, sized below the provider's own limit, in the shared
+    limiter backend. A call waits up to `max_wait` seconds for a token and is rejected
+    after that, before the provider starts answering 429.
+    """
+
+    def __init__(self, max_wait: float = QUOTA_MAX_WAIT):
+        self.max_wait = max_wait
+
+    async def acquire(self, upstream: str, per_minute: float):
+        if not per_minute:
+            return
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            allowed, retry_after = await get_limiter_backend().take(f"quota:{upstream}", per_minute / 60, per_minute)
+            if allowed:
+                return
+            if time.monotonic() + retry_after > deadline:
+                FAST_FAILS.inc(upstream, "quota")
+                raise QuotaExceededError(f"{upstream} quota exhausted", upstream, retry_after)
+            QUOTA_WAITS.inc(upstream)
+            await asyncio.sleep(retry_after)
+
+
+upstream_quota = UpstreamQuota()
+
+breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str, failure_threshold: int = 5, reset_timeout: float = 30.0) -> CircuitBreaker:
+    if name not in breakers:
+        breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+    return breakers[name]
+
+
+def breaker_status():
+    return {name: breaker.status() for name, breaker in breakers.items()}
+
+
+def backoff(attempt: int) -> float:
+    """Full jitter: uniform between 0 and the capped exponential delay."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _retry_after(response: httpx.Response):
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(self, upstream: str, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker,
+                 retries: int = 2, hedge_after: float = 0.0, quota_per_minute: float = 0,
+                 retry_methods=("GET", "HEAD"), budget: RetryBudget = retry_budget, quota: UpstreamQuota = upstream_quota):
+        self.upstream = upstream
+        self._transport = transport
+        self.breaker = breaker
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self.quota_per_minute = quota_per_minute
+        self.retry_methods = retry_methods
+        self.budget = budget
+        self.quota = quota
+
+    async def _send(self, request):
+        """One attempt: breaker check, quota, then the wire."""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            FAST_FAILS.inc(self.upstream, "circuit_open")
+            raise
+        try:
+            await self.quota.acquire(self.upstream, self.quota_per_minute)
+            response = await self._transport.handle_async_request(request)
+        except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    @staticmethod
+    async def _discard(task):
+        if not task.done():
+            task.cancel()
+        try:
+            response = await task
+        except BaseException:
+            return
+        await response.aclose()
+
+    async def _hedged(self, request):
+        """Start a second attempt if the first has not answered within hedge_after; first success wins."""
+        tasks = [asyncio.ensure_future(self._send(request))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if done or not self.budget.try_spend():
+                return await tasks[0]
+            tasks.append(asyncio.ensure_future(self._send(request)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        HEDGES.inc(self.upstream, "first" if task is tasks[0] else "second")
+                        for other in tasks:
+                            if other is not task:
+                                await self._discard(other)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        except BaseException:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            raise
+
+    async def _attempt(self, request):
+        if self.hedge_after and request.method in ("GET", "HEAD"):
+            return await self._hedged(request)
+        return await self._send(request)
+
+    def _may_retry(self, request, attempt: int) -> bool:
+        return attempt < self.retries and request.method in self.retry_methods and self.budget.try_spend()
+
+    async def handle_async_request(self, request):
+        self.budget.record_request()
+        attempt = 0
+        while True:
+            try:
+                response = await self._attempt(request)
+            except UpstreamUnavailable:
+                raise
+            except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError):
+                if not self._may_retry(request, attempt):
+                    raise
+                delay = backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or not self._may_retry(request, attempt):
+                    return response
+                delay = backoff(attempt)
+                hinted = _retry_after(response)
+                if hinted is not None:
+                    if hinted > BACKOFF_CAP:
+                        return response
+                    delay = max(delay, hinted)
+                await response.aclose()
+            attempt += 1
+            RETRIES.inc(self.upstream)
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+
+def _collect():
+    samples = [
+        (PREFIX + "upstream_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+         {"upstream": name}, _STATE_VALUES[breaker.state])
+        for name, breaker in breakers.items()
+    ]
+    samples.append((PREFIX + "retry_budget_balance", "gauge", "Retries currently allowed by the global budget",
+                    {}, retry_budget.balance))
+    samples.append((PREFIX + "retry_budget_exhausted_total", "counter", "Retries refused by the global budget",
+                    {}, retry_budget.exhausted))
+    return samples
+
+
+REGISTRY.add_collector("resilience", _collect)
@@ -0,0 +1,318 @@
+"""
+Compact, conditional and compressed responses for clients on slow mobile links.
+
+- CompactJSONResponse is the app's default response class. It serializes with orjson
+  and keeps only the fields named in `?fields=`.
+- CompactResponseMiddleware adds a strong ETag to every 200 JSON answer to a GET, and
+  answers a matching If-None-Match with 304. It compresses JSON of at least
+  COMPRESS_MIN_BYTES, and NDJSON streams, with brotli or gzip, as negotiated by
+  Accept-Encoding.
+- not_modified() lets an endpoint tag its answer with the version of the documents it
+  reads, and answer 304 before loading or serializing them.
+
+`fields` is a comma-separated list of keys, with dots for nested keys, e.g.
+`?fields=title,link` or `?fields=soil_properties.phh2o`. It applies to the returned object
+or, when none of its keys are named, to each item of its lists, so list envelopes such as
+{"schemes": [...], "next_cursor": ...} keep their shape. `_id` and `id` are always kept.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import zlib
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+from fastapi.responses import JSONResponse, Response
+from app.services.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+# Bodies this large are compressed in a worker thread instead of on the event loop.
+COMPRESS_IN_THREAD_BYTES = int(os.getenv("COMPRESS_IN_THREAD_BYTES", str(256 * 1024)))
+ALWAYS_KEPT_FIELDS = ("_id", "id")
+
+NOT_MODIFIED = Counter("responses_not_modified_total", "Requests answered 304 Not Modified", ("source",))
+RESPONSE_BYTES = Counter("response_body_bytes_total", "JSON and NDJSON body bytes before and after encoding",
+                         ("stage",))
+
+
+def _optional_module(name: str):
+    """orjson and brotli are in requirements.txt; without them JSON uses the stdlib and only gzip is offered."""
+    try:
+        return __import__(name)
+    except ImportError:
+        logger.warning("%s is not installed; responses fall back to a slower or larger encoding", name)
+        return None
+
+
+orjson = _optional_module("orjson")
+brotli = _optional_module("brotli")
+
+# Preferred first.
+ENCODINGS = (("br",) if brotli is not None else ()) + ("gzip",)
+
+_requested_fields: ContextVar = ContextVar("requested_fields", default=None)
+
+
+def parse_fields(value: str | None):
+    """"a,b.c" -> {"a": {}, "b": {"c": {}}}, or None when no fields are requested."""
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(","):
+        node = tree
+        for part in path.strip().split("."):
+            if part:
+                node = node.setdefault(part, {})
+    return tree or None
+
+
+def _select(value, tree: dict):
+    if isinstance(value, list):
+        return [_select(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    selected = {key: _select(value[key], sub) if sub else value[key] for key, sub in tree.items() if key in value}
+    for key in ALWAYS_KEPT_FIELDS:
+        if key in value:
+            selected.setdefault(key, value[key])
+    return selected
+
+
+def select_fields(content, tree: dict):
+    if isinstance(content, dict) and not any(key in content for key in tree):
+        # A list envelope: select inside each list and keep the rest (cursors, counts) as is.
+        return {key: _select(value, tree) if isinstance(value, list) else value for key, value in content.items()}
+    return _select(content, tree)
+
+
+def take_requested_fields():
+    """For endpoints that apply `fields` themselves: returns the selection and stops the response class applying it."""
+    tree = _requested_fields.get()
+    _requested_fields.set(None)
+    return tree
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits; the standard library handles them.
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class CompactJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        tree = _requested_fields.get()
+        if tree:
+            content = select_fields(content, tree)
+        return dumps(content)
+
+
+def negotiate_encoding(accept_encoding: str):
+    """The preferred encoding the client accepts (q > 0), or None."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            accepted[name.strip()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """Compresses a stream chunk by chunk, flushing each so lines reach the client as they are sent."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(chunk) + self._brotli.flush()
+        return self._zlib.compress(chunk) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b("\x1f".join(str(part) for part in parts).encode("utf-8"), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def content_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _base_tag(tag: str) -> str:
+    """Strip the weak prefix and the content-encoding suffix added by the middleware."""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _base_tag(etag) in {_base_tag(tag) for tag in if_none_match.split(",")}
+
+
+def not_modified(request, response: Response, *version):
+    """
+    Tag the response with the version of the documents it is built from (plus the query,
+    which selects fields and pages). Returns a 304 response to send instead when the
+    client already holds this version, otherwise None.
+    """
+    etag = make_etag(request.url.path, request.url.query, request.headers.get("accept", ""), *version)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        NOT_MODIFIED.inc("version")
+        return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept-Encoding"})
+    response.headers["ETag"] = etag
+    return None
+
+
+def _header(headers: list, name: bytes):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _set_header(headers: list, name: bytes, value: str):
+    headers[:] = [(key, val) for key, val in headers if key.lower() != name]
+    headers.append((name, value.encode("latin-1")))
+
+
+def _add_vary(headers: list):
+    vary = _header(headers, b"vary")
+    if not vary:
+        _set_header(headers, b"vary", "Accept-Encoding")
+    elif "accept-encoding" not in vary.lower():
+        _set_header(headers, b"vary", f"{vary}, Accept-Encoding")
+
+
+class CompactResponseMiddleware:
+    """ASGI middleware applying `fields`, ETags with 304 answers and compression; see the module docstring."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        encoding = negotiate_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if_none_match = request_headers.get(b"if-none-match", b"").decode("latin-1") or None
+        conditional = scope["method"] in ("GET", "HEAD")
+        start = None
+        mode = None
+        chunks = []
+        compressor = None
+
+        async def finish_buffered(body: bytes):
+            headers = list(start["headers"])
+            status = start["status"]
+            if conditional and status == 200 and _header(headers, b"content-encoding") is None:
+                etag = _header(headers, b"etag")
+                if etag is None:
+                    etag = content_etag(body)
+                    _set_header(headers, b"etag", etag)
+                if etag_matches(if_none_match, etag):
+                    NOT_MODIFIED.inc("content")
+                    headers = [(k, v) for k, v in headers if k.lower() not in (b"content-type", b"content-length")]
+                    _add_vary(headers)
+                    await send({"type": "http.response.start", "status": 304, "headers": headers})
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+            if encoding and len(body) >= COMPRESS_MIN_BYTES and _header(headers, b"content-encoding") is None:
+                RESPONSE_BYTES.inc("identity", amount=len(body))
+                if len(body) >= COMPRESS_IN_THREAD_BYTES:
+                    body = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+                RESPONSE_BYTES.inc(encoding, amount=len(body))
+                _set_header(headers, b"content-encoding", encoding)
+                etag = _header(headers, b"etag")
+                if etag and etag.endswith('"'):
+                    _set_header(headers, b"etag", f'{etag[:-1]}-{encoding}"')
+            _add_vary(headers)
+            _set_header(headers, b"content-length", str(len(body)))
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        async def send_compact(message):
+            nonlocal start, mode, compressor
+            if message["type"] == "http.response.start":
+                headers = list(message["headers"])
+                content_type = (_header(headers, b"content-type") or "").lower()
+                if content_type.startswith("application/json"):
+                    mode, start = "buffer", message
+                    return
+                if content_type.startswith("application/x-ndjson") and encoding \
+                        and _header(headers, b"content-encoding") is None:
+                    mode, compressor = "stream", StreamCompressor(encoding)
+                    headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+                    _set_header(headers, b"content-encoding", encoding)
+                    _add_vary(headers)
+                    message = {**message, "headers": headers}
+                await send(message)
+                return
+            if message["type"] != "http.response.body" or mode is None:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if mode == "buffer":
+                chunks.append(body)
+                if not more:
+                    await finish_buffered(b"".join(chunks))
+                return
+            RESPONSE_BYTES.inc("identity", amount=len(body))
+            encoded = compressor.compress(body) if body else b""
+            if not more:
+                encoded += compressor.finish()
+            RESPONSE_BYTES.inc(encoding, amount=len(encoded))
+            await send({**message, "body": encoded})
+
+        token = _requested_fields.set(parse_fields(",".join(query.get("fields", []))))
+        try:
+            await self.app(scope, receive, send_compact)
+        finally:
+            _requested_fields.reset(token)
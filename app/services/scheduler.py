@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+from app.db import db
+
+logger = logging.getLogger(__name__)
+
+# A run holds its lease this long past the last heartbeat, so a crashed worker's lease lapses quickly.
+LEASE_TTL = float(os.getenv("JOB_LEASE_TTL", "90"))
+LEASE_HEARTBEAT = LEASE_TTL / 3
+
+LEASE_COLLECTION = db["job_leases"]
+
+
+class JobLease:
+    """
+    A lock document in job_leases shared by every worker, so a job runs in one process
+    at a time and its schedule fires once per interval across all of them.
+    `busy_until` is renewed while a run is in progress; `next_run_at` is the earliest
+    time any worker may start the next scheduled run.
+    """
+
+    def __init__(self, name: str, collection=LEASE_COLLECTION):
+        self.name = name
+        self.collection = collection
+
+    @property
+    def holder(self) -> str:
+        # Evaluated per call so forked workers do not share the parent's identity.
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    async def claim(self, interval: float, scheduled: bool) -> bool:
+        """Take the lease for one run; a scheduled run also needs its interval to have passed."""
+        now = datetime.utcnow()
+        query = {"_id": self.name, "busy_until": {"$lt": now}}
+        if scheduled:
+            query["next_run_at"] = {"$lte": now}
+        try:
+            # When the lease is held the filter misses and the upsert collides on _id.
+            await self.collection.update_one(query, {"$set": {
+                "holder": self.holder,
+                "started_at": now,
+                "busy_until": now + timedelta(seconds=LEASE_TTL),
+                "next_run_at": now + timedelta(seconds=interval),
+            }}, upsert=True)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def renew(self):
+        await self.collection.update_one(
+            {"_id": self.name, "holder": self.holder},
+            {"$set": {"busy_until": datetime.utcnow() + timedelta(seconds=LEASE_TTL)}},
+        )
+
+    async def release(self):
+        await self.collection.update_one(
+            {"_id": self.name, "holder": self.holder}, {"$set": {"busy_until": datetime.utcnow()}}
+        )
+
+
+class PeriodicJob:
+    """
+    Runs an async job every `interval` seconds in the background and keeps run statistics.
+    An interval of 0 disables the schedule; the job can still be triggered manually.
+    A `leased` job takes a JobLease before each run, so with several uvicorn workers it
+    runs once per interval in whichever worker gets there first.
+    """
+
+    def __init__(self, name: str, fn, interval: float, leased: bool = False):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.lease = JobLease(name) if leased else None
+        self._task = None
+        self._manual = set()
+        self._lock = asyncio.Lock()
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_started = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+
+    async def run_once(self):
+        """
+        Run the job now, waiting for an in-progress run in this process to finish first.
+        A leased job answers 409 while another worker is running it.
+        """
+        async with self._lock:
+            if self.lease is not None and not await self.lease.claim(self.interval, scheduled=False):
+                raise HTTPException(status_code=409, detail=f"{self.name} is already running in another worker")
+            return await self._run()
+
+    async def _run(self):
+        self.last_started = datetime.utcnow()
+        started = time.perf_counter()
+        heartbeat = asyncio.ensure_future(self._heartbeat()) if self.lease is not None else None
+        try:
+            self.last_result = await self.fn()
+            self.last_error = None
+            return self.last_result
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            raise
+        finally:
+            self.runs += 1
+            self.last_duration = round(time.perf_counter() - started, 3)
+            if heartbeat is not None:
+                heartbeat.cancel()
+                await self._release()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(LEASE_HEARTBEAT)
+            try:
+                await self.lease.renew()
+            except Exception as e:
+                logger.warning("Could not renew lease for job %s: %r", self.name, e)
+
+    async def _release(self):
+        try:
+            await self.lease.release()
+        except Exception as e:
+            # The lease lapses on its own after LEASE_TTL.
+            logger.warning("Could not release lease for job %s: %r", self.name, e)
+
+    def trigger(self):
+        """Start a run in the background unless one is already going."""
+        if self._lock.locked():
+            return False
+        task = asyncio.ensure_future(self._run_logged())
+        self._manual.add(task)
+        task.add_done_callback(self._manual.discard)
+        return True
+
+    async def _run_logged(self):
+        try:
+            await self.run_once()
+        except HTTPException as e:
+            logger.info("Job %s not started: %s", self.name, e.detail)
+        except Exception:
+            logger.exception("Job %s failed", self.name)
+
+    async def _run_scheduled(self):
+        async with self._lock:
+            if self.lease is not None and not await self.lease.claim(self.interval, scheduled=True):
+                # Another worker ran (or is running) this interval's run.
+                self.skipped += 1
+                return
+            await self._run()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self._run_scheduled()
+            except Exception:
+                logger.exception("Job %s failed", self.name)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self):
+        return {
+            "job": self.name,
+            "interval_seconds": self.interval,
+            "running": self._lock.locked(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped_other_worker": self.skipped,
+            "last_started": self.last_started,
+            "last_duration_seconds": self.last_duration,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
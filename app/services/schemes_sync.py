@@ -1,24 +1,65 @@
-import httpx
-from bs4 import BeautifulSoup
+import hashlib
+import os
 from datetime import datetime
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
 from app.db import db
-from app.services.crud import insert_document, find_documents
+from app.services.crud import bulk_write, iter_documents, find_one
+from app.services.delta_sync import stamps
+from app.services.http_client import get_http_client
+from app.services.scheduler import PeriodicJob
+from app.services.search import SearchIndex
+from app.services.text import normalize_text
 
 SCHEMES_COLLECTION = db["gov_schemes"]
+SYNC_STATE_COLLECTION = db["sync_state"]
+schemes_search = SearchIndex(SCHEMES_COLLECTION, ["title", "description", "eligibility"])
+
+PORTAL_URL = os.getenv("SCHEMES_PORTAL_URL", "https://www.myscheme.gov.in/schemes?sectors=agriculture")
+SYNC_INTERVAL = float(os.getenv("SCHEMES_SYNC_INTERVAL", str(24 * 3600)))
+SYNC_STATE_ID = "schemes_portal"
+
+
+def _html_parser():
+    # lxml is several times faster than the pure-Python parser when it is installed.
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return "html.parser"
+    return "lxml"
+
+
+HTML_PARSER = _html_parser()
+
+
+def scheme_key(title: str) -> str:
+    return normalize_text(title)
+
+
+def content_hash(scheme: dict) -> str:
+    raw = "\x1f".join(scheme.get(f) or "" for f in ("title", "description", "source_url"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-async def fetch_schemes_from_portal():
-    """
-    Fetch scheme data from government portal (example: Data.gov.in agriculture schemes).
-    NOTE: This is a scraper, you may need to adjust CSS selectors if site changes.
-    """
-    url = "https://www.myscheme.gov.in/schemes?sectors=agriculture"
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, timeout=30)
-    resp.raise_for_status()
-    html = resp.text
-    soup = BeautifulSoup(html, "html.parser")
 
+async def backfill_scheme_keys():
+    """Give schemes stored before keys existed a scheme_key so the sync recognises them."""
+    operations = [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"scheme_key": scheme_key(doc["title"])}})
+        async for doc in iter_documents(SCHEMES_COLLECTION, {"scheme_key": {"$exists": False}}, {"title": 1})
+        if doc.get("title")
+    ]
+    try:
+        await bulk_write(SCHEMES_COLLECTION, operations)
+    except BulkWriteError:
+        # Duplicated titles keep their first key; the rest stay unkeyed.
+        pass
 
+
+def parse_schemes(html: str, url: str = PORTAL_URL):
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    # Only build the tree for the scheme cards instead of the whole page.
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer("div", class_="MuiCard-root"))
     scheme_cards = soup.find_all("div", class_="MuiCard-root")
     schemes = []
 
@@ -34,24 +75,91 @@ async def fetch_schemes_from_portal():
             "title": title_tag.get_text(strip=True),
             "description": desc_tag.get_text(strip=True) if desc_tag else "",
             "source_url": link_tag["href"] if link_tag else url,
-            "last_synced": datetime.utcnow(),
             "active": True
         })
 
     return schemes
 
+
+async def fetch_schemes_from_portal(etag: str | None = None, last_modified: str | None = None):
+    """
+    Fetch scheme data from government portal (example: Data.gov.in agriculture schemes).
+    Returns (schemes, response headers), or (None, headers) when the page is unchanged since the given validators.
+    NOTE: This is a scraper, you may need to adjust CSS selectors if site changes.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    resp = await get_http_client("schemes").get(PORTAL_URL, headers=headers)
+    if resp.status_code == 304:
+        return None, resp.headers
+    resp.raise_for_status()
+    return parse_schemes(resp.text), resp.headers
+
+
 async def sync_schemes():
     """
-    Pull schemes from govt portal and insert into DB if new.
+    Pull schemes from govt portal and upsert new or changed ones in one unordered bulk write.
     """
-    new_schemes = await fetch_schemes_from_portal()
-    existing = await find_documents(SCHEMES_COLLECTION, {}, limit=1000)
-    existing_titles = {s.get("title") for s in existing}
+    state = await find_one(SYNC_STATE_COLLECTION, {"_id": SYNC_STATE_ID}) or {}
+    schemes, headers = await fetch_schemes_from_portal(state.get("etag"), state.get("last_modified"))
+    now = datetime.utcnow()
+    stats = {"not_modified": schemes is None, "fetched": 0, "new_schemes_added": 0, "updated": 0, "unchanged": 0, "ids": []}
+
+    if schemes is not None:
+        by_key = {}
+        for scheme in schemes:
+            scheme["scheme_key"] = scheme_key(scheme["title"])
+            scheme["content_hash"] = content_hash(scheme)
+            by_key[scheme["scheme_key"]] = scheme
+        stats["fetched"] = len(by_key)
+
+        existing = {
+            doc["scheme_key"]: doc
+            async for doc in iter_documents(
+                SCHEMES_COLLECTION, {"scheme_key": {"$in": list(by_key)}}, {"scheme_key": 1, "content_hash": 1}
+            )
+        }
+        operations, written, unchanged = [], [], []
+        for key, scheme in by_key.items():
+            if key in existing and existing[key].get("content_hash") == scheme["content_hash"]:
+                unchanged.append(key)
+            else:
+                written.append(scheme)
+        # Only new or changed schemes get a new version; unchanged ones are not re-sent to clients.
+        for scheme, version in zip(written, await stamps(SCHEMES_COLLECTION.name, len(written))):
+            operations.append(UpdateOne(
+                {"scheme_key": scheme["scheme_key"]},
+                {"$set": {**scheme, **version, "last_synced": now}, "$setOnInsert": {"created_at": now}},
+                upsert=True
+            ))
+        if unchanged:
+            operations.append(UpdateMany({"scheme_key": {"$in": unchanged}}, {"$set": {"last_synced": now}}))
+
+        result = await bulk_write(SCHEMES_COLLECTION, operations)
+        for index, scheme_id in result["upserted_ids"].items():
+            stats["ids"].append(str(scheme_id))
+        # Re-index new and changed schemes alike; index_document replaces a scheme's old text.
+        for index, scheme in enumerate(written):
+            scheme_id = result["upserted_ids"].get(index) or existing.get(scheme["scheme_key"], {}).get("_id")
+            if scheme_id is not None:
+                schemes_search.index_document({**scheme, "_id": scheme_id})
+        stats["new_schemes_added"] = result["upserted"]
+        stats["updated"] = len(written) - result["upserted"]
+        stats["unchanged"] = len(unchanged)
+
+    await SYNC_STATE_COLLECTION.update_one(
+        {"_id": SYNC_STATE_ID},
+        {"$set": {
+            "etag": headers.get("etag") or state.get("etag"),
+            "last_modified": headers.get("last-modified") or state.get("last_modified"),
+            "last_run": now,
+        }},
+        upsert=True
+    )
+    return stats
 
-    added = []
-    for scheme in new_schemes:
-        if scheme["title"] not in existing_titles:
-            scheme_id = await insert_document(SCHEMES_COLLECTION, scheme)
-            added.append(scheme_id)
 
-    return {"new_schemes_added": len(added), "ids": added}
+schemes_sync_job = PeriodicJob("schemes_sync", sync_schemes, SYNC_INTERVAL, leased=True)
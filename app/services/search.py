@@ -0,0 +1,271 @@
+import heapq
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.services.crud import iter_documents
+from app.services.delta_sync import SETTLE_SECONDS, current_version
+from app.services.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# "mongo" ranks with Mongo text indexes (registered in app.services.indexes); "memory"
+# keeps a BM25 inverted index in each worker, built at startup, updated on this worker's
+# inserts and, at most every REFRESH_SECONDS, with what other workers wrote, found by
+# the delta sync `version` stamps.
+BACKEND = os.getenv("SEARCH_BACKEND", "mongo")
+REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", "5"))
+
+# Devanagari vowel signs and viramas are combining marks, which \w does not match,
+# so the whole Devanagari block is included explicitly.
+_TOKEN = re.compile(r"[\w\u0900-\u097F]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "for", "how", "in", "is", "it", "my", "of", "on", "or", "the", "to", "what", "when", "with",
+    "और", "का", "की", "के", "को", "में", "से", "है", "हैं", "पर", "भी", "यह", "कि", "तो",
+}
+
+
+def tokenize(text: str):
+    return [t for t in _TOKEN.findall(normalize_text(text)) if len(t) > 1 and t not in STOPWORDS]
+
+
+class InvertedIndex:
+    """BM25-ranked in-process inverted index with incremental updates."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict] = {}
+        # The terms each document has postings under, so it can be replaced.
+        self.doc_terms: dict = {}
+        self.lengths: dict = {}
+        self.total_length = 0
+
+    def terms(self, doc_id) -> Counter:
+        return Counter({term: self.postings[term][doc_id] for term in self.doc_terms.get(doc_id, ())})
+
+    def remove(self, doc_id):
+        for term in self.doc_terms.pop(doc_id, ()):
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id, 0)
+
+    def set_terms(self, doc_id, terms: Counter):
+        """Replace everything indexed for doc_id with `terms`."""
+        self.remove(doc_id)
+        terms = +terms
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        self.doc_terms[doc_id] = tuple(terms)
+        length = sum(terms.values())
+        self.lengths[doc_id] = length
+        self.total_length += length
+
+    def add(self, doc_id, text: str):
+        """Index `text` for doc_id; calling again for the same id appends (e.g. a new reply)."""
+        self.set_terms(doc_id, self.terms(doc_id) + Counter(tokenize(text)))
+
+    def search(self, query: str, limit: int = 20, offset: int = 0):
+        """Return ([(doc_id, score), ...], total_matches) for one page of results."""
+        terms = set(tokenize(query))
+        if not terms or not self.lengths:
+            return [], 0
+        n_docs = len(self.lengths)
+        avg_length = self.total_length / n_docs
+        scores: dict = {}
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: item[1])
+        return top[offset:], len(scores)
+
+    def __len__(self):
+        return len(self.lengths)
+
+
+class MongoTextBackend:
+    def __init__(self, collection, fields, related=None):
+        """`related` is (collection, foreign_key, field) for child documents searched on behalf of the parent."""
+        self.collection = collection
+        self.fields = fields
+        self.related = related
+
+    async def build(self):
+        pass
+
+    def add(self, doc: dict):
+        pass
+
+    def add_related(self, parent_id, text: str):
+        pass
+
+    async def search(self, query: str, limit: int, offset: int):
+        text_query = {"$text": {"$search": query}}
+        score = {"score": {"$meta": "textScore"}}
+        window = offset + limit
+        cursor = self.collection.find(text_query, score).sort([("score", {"$meta": "textScore"})]).limit(window)
+        scores = {doc["_id"]: doc["score"] async for doc in cursor}
+        total = await self.collection.count_documents(text_query)
+        if self.related:
+            collection, foreign_key, _ = self.related
+            pipeline = [
+                {"$match": text_query},
+                {"$group": {"_id": f"${foreign_key}", "score": {"$max": {"$meta": "textScore"}}}},
+                {"$sort": {"score": -1}},
+                {"$limit": window},
+            ]
+            async for doc in collection.aggregate(pipeline):
+                if doc["_id"] not in scores:
+                    total += 1
+                scores[doc["_id"]] = max(scores.get(doc["_id"], 0.0), doc["score"])
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[offset:window], total
+
+
+class MemoryBackend:
+    def __init__(self, collection, fields, related=None):
+        self.collection = collection
+        self.fields = fields
+        self.related = related
+        self.index = InvertedIndex()
+        # Terms of each document's own fields, kept when there is related text so that
+        # re-indexing the document replaces only them.
+        self.own: dict = {}
+        # Highest settled version of the collection (and of the related one) already indexed.
+        self.seen = 0
+        self.seen_related = 0
+        self.refreshed = 0.0
+
+    def _text(self, doc: dict) -> str:
+        return " ".join(str(doc.get(f) or "") for f in self.fields)
+
+    def add(self, doc: dict):
+        """Index the document's fields, replacing what was indexed for them before."""
+        terms = Counter(tokenize(self._text(doc)))
+        if self.related:
+            doc_id = doc["_id"]
+            self.index.set_terms(doc_id, self.index.terms(doc_id) - self.own.get(doc_id, Counter()) + terms)
+            self.own[doc_id] = terms
+        else:
+            self.index.set_terms(doc["_id"], terms)
+
+    def add_related(self, parent_id, text: str):
+        self.index.add(parent_id, text)
+
+    async def build(self):
+        """Stream the collection (and related documents) into a fresh index."""
+        # Read before streaming: anything written meanwhile is picked up again by refresh().
+        seen = await current_version(self.collection.name)
+        seen_related = await current_version(self.related[0].name) if self.related else 0
+        self.index = InvertedIndex()
+        self.own = {}
+        async for doc in self.collection.find({}, {f: 1 for f in self.fields}):
+            self.add(doc)
+        if self.related:
+            collection, foreign_key, field = self.related
+            async for doc in collection.find({}, {foreign_key: 1, field: 1}):
+                self.add_related(doc[foreign_key], doc.get(field) or "")
+        self.seen, self.seen_related = seen, seen_related
+        self.refreshed = time.monotonic()
+
+    async def _changed(self, collection, seen: int, id_field: str, changed: set, horizon: datetime) -> int:
+        """Add the ids written to `collection` after `seen` to `changed`; return the new settled version."""
+        settled = seen
+        projection = {id_field: 1, "version": 1, "version_at": 1}
+        async for doc in iter_documents(collection, {"version": {"$gt": seen}}, projection):
+            changed.add(doc[id_field])
+            # A version is taken just before its write, so a lower one may still land
+            # until SETTLE_SECONDS later; unsettled documents are looked at again next time.
+            if doc["version_at"] <= horizon:
+                settled = max(settled, doc["version"])
+        return settled
+
+    async def _reindex(self, ids: set):
+        """Rebuild the entries of `ids` from the database, with all their related text."""
+        ids = list(ids)
+        own = {
+            doc["_id"]: Counter(tokenize(self._text(doc)))
+            async for doc in iter_documents(self.collection, {"_id": {"$in": ids}}, {f: 1 for f in self.fields})
+        }
+        terms = {doc_id: Counter(counts) for doc_id, counts in own.items()}
+        if self.related:
+            collection, foreign_key, field = self.related
+            async for doc in iter_documents(collection, {foreign_key: {"$in": ids}}, {foreign_key: 1, field: 1}):
+                if doc[foreign_key] in terms:
+                    terms[doc[foreign_key]].update(tokenize(doc.get(field) or ""))
+        for doc_id in ids:
+            if doc_id in terms:
+                self.index.set_terms(doc_id, terms[doc_id])
+            else:
+                self.index.remove(doc_id)
+            if self.related:
+                if doc_id in own:
+                    self.own[doc_id] = own[doc_id]
+                else:
+                    self.own.pop(doc_id, None)
+
+    async def refresh(self):
+        """Index what other workers wrote since the last refresh."""
+        horizon = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+        changed = set()
+        seen = await self._changed(self.collection, self.seen, "_id", changed, horizon)
+        seen_related = self.seen_related
+        if self.related:
+            collection, foreign_key, _ = self.related
+            seen_related = await self._changed(collection, seen_related, foreign_key, changed, horizon)
+        if changed:
+            await self._reindex(changed)
+        self.seen, self.seen_related = seen, seen_related
+
+    async def search(self, query: str, limit: int, offset: int):
+        if time.monotonic() - self.refreshed >= REFRESH_SECONDS:
+            # Set first so concurrent searches do not start refreshes of their own.
+            self.refreshed = time.monotonic()
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("Could not refresh the %s search index: %s", self.collection.name, e)
+        return self.index.search(query, limit, offset)
+
+
+class SearchIndex:
+    """Ranked, paginated search over one collection with a pluggable backend."""
+
+    def __init__(self, collection, fields, related=None, projection=None, backend: str = BACKEND):
+        backend_cls = MemoryBackend if backend == "memory" else MongoTextBackend
+        self.backend = backend_cls(collection, fields, related)
+        self.collection = collection
+        self.projection = projection
+
+    async def start(self):
+        await self.backend.build()
+
+    def index_document(self, doc: dict):
+        """Index a new document, or re-index a changed one in place of its old text."""
+        self.backend.add(doc)
+
+    def index_related(self, parent_id, text: str):
+        self.backend.add_related(parent_id, text)
+
+    async def search(self, query: str, limit: int = 20, offset: int = 0):
+        ranked, total = await self.backend.search(query, limit, offset)
+        ids = [doc_id if isinstance(doc_id, ObjectId) else ObjectId(doc_id) for doc_id, _ in ranked]
+        docs = {doc["_id"]: doc async for doc in self.collection.find({"_id": {"$in": ids}}, self.projection)}
+        results = []
+        for doc_id, score in zip(ids, (s for _, s in ranked)):
+            doc = docs.get(doc_id)
+            if doc is not None:
+                doc["_id"] = str(doc["_id"])
+                results.append({**doc, "score": round(score, 4)})
+        return {"results": results, "total": total, "limit": limit, "offset": offset}
@@ -0,0 +1,34 @@
+import logging
+import os
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Environment variable each optional feature needs. A missing key disables only that feature.
+FEATURE_KEYS = {
+    "database": "MONGO_URL",
+    "weather": "OPENWEATHER_API_KEY",
+    "market": "MARKET_API_KEY",
+    "assistant": "OPENAI_API_KEY",
+    # A trained leaf disease model (.npz); without one /disease/detect answers 503.
+    "disease": "DISEASE_MODEL_PATH",
+}
+
+
+def require_key(feature: str) -> str:
+    """Return the feature's key, or answer 503 for this request only when it is not configured."""
+    name = FEATURE_KEYS[feature]
+    value = os.getenv(name)
+    if not value:
+        raise HTTPException(status_code=503, detail=f"{feature} is not configured: set {name}")
+    return value
+
+
+def feature_status(skip=()):
+    return {feature: bool(os.getenv(name)) for feature, name in FEATURE_KEYS.items() if feature not in skip}
+
+
+def log_missing_features(skip=()):
+    for feature, configured in feature_status(skip).items():
+        if not configured:
+            logger.warning("%s is disabled: %s is not set", feature, FEATURE_KEYS[feature])
@@ -0,0 +1,78 @@
+import logging
+import os
+from datetime import datetime
+from app.db import db
+from app.services.cache import LRUCache, SingleFlight
+from app.services.settings import feature_status
+
+logger = logging.getLogger(__name__)
+
+# SoilGrids has a 250 m resolution; 0.0025 degrees is roughly one grid cell, so
+# every coordinate inside a cell maps to the same cache entry.
+CELL_DEGREES = float(os.getenv("SOIL_CELL_DEGREES", "0.0025"))
+MEMORY_ENTRIES = int(os.getenv("SOIL_CACHE_ENTRIES", "10000"))
+# Soil properties are static, so persisted cells live for months.
+CACHE_TTL_SECONDS = int(os.getenv("SOIL_CACHE_TTL_SECONDS", str(180 * 24 * 3600)))
+
+SOIL_CACHE_COLLECTION = db["soil_cache"]
+
+_memory = LRUCache(MEMORY_ENTRIES)
+_inflight = SingleFlight()
+
+
+def snap_to_cell(lat: float, lon: float):
+    """Return (cell_key, cell_lat, cell_lon) for the grid cell containing the coordinate."""
+    row = round(lat / CELL_DEGREES)
+    col = round(lon / CELL_DEGREES)
+    return f"{row}:{col}", round(row * CELL_DEGREES, 6), round(col * CELL_DEGREES, 6)
+
+
+async def get_soil_properties(lat: float, lon: float, fetch):
+    """
+    Return the parsed soil_properties for the cell containing (lat, lon).
+    Looks in memory, then Mongo, and only then calls `fetch(cell_lat, cell_lon)`;
+    concurrent misses for the same cell share a single upstream call. Without a database,
+    or while it fails, only the in-process cache is used.
+    """
+    key, cell_lat, cell_lon = snap_to_cell(lat, lon)
+    cached = _memory.get(key)
+    if cached is not None:
+        return cached
+
+    async def load():
+        persist = feature_status()["database"]
+        doc = await _read_cell(key) if persist else None
+        if doc:
+            properties = doc["soil_properties"]
+        else:
+            properties = await fetch(cell_lat, cell_lon)
+            if persist:
+                await _write_cell(key, cell_lat, cell_lon, properties)
+        _memory.set(key, properties)
+        return properties
+
+    return await _inflight.do(key, load)
+
+
+async def _read_cell(key: str):
+    try:
+        return await SOIL_CACHE_COLLECTION.find_one({"_id": key}, {"soil_properties": 1})
+    except Exception as e:
+        # The persisted cells only save SoilGrids calls; without them the cell is fetched live.
+        logger.warning("Could not read soil cache cell %s: %r", key, e)
+        return None
+
+
+async def _write_cell(key: str, cell_lat: float, cell_lon: float, properties: dict):
+    try:
+        await SOIL_CACHE_COLLECTION.replace_one(
+            {"_id": key},
+            {"lat": cell_lat, "lon": cell_lon, "soil_properties": properties, "cached_at": datetime.utcnow()},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.warning("Could not persist soil cache cell %s: %r", key, e)
+
+
+def soil_cache_stats():
+    return {**_memory.stats(), "inflight": len(_inflight)}
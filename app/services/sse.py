@@ -0,0 +1,17 @@
+import json
+from datetime import datetime
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    """Encode one server-sent event; ObjectIds and datetimes are stringified."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False, default=_default)}\n\n"
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
@@ -0,0 +1,14 @@
+import re
+import unicodedata
+
+_ZERO_WIDTH = dict.fromkeys(map(ord, "\u200b\u200c\u200d\ufeff"))
+_DEVANAGARI_VARIANTS = str.maketrans({"\u0901": "\u0902"})  # chandrabindu -> anusvara
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold, NFKC-normalize, unify Devanagari variants and strip punctuation and extra whitespace."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = text.translate(_ZERO_WIDTH).translate(_DEVANAGARI_VARIANTS)
+    text = "".join(" " if unicodedata.category(ch)[0] in "PS" else ch for ch in text)
+    return _SPACES.sub(" ", text).strip()
@@ -0,0 +1,348 @@
+"""
+Current weather precomputed for every location farmers are registered at.
+
+A PeriodicJob streams the farmers collection, reduces the profiles to distinct
+locations (a city, or coordinates rounded to WEATHER_COORD_PRECISION decimals) and
+refreshes the weather_snapshots collection:
+
+- locations whose OpenWeatherMap city id is known from an earlier run are refreshed
+  with group calls, up to GROUP_SIZE cities per call;
+- the rest are looked up one by one, busiest locations first, which also learns their
+  city id for the next run.
+
+When a group call fails, its locations are looked up one by one instead, within the
+same budget. If the API key's plan has no group endpoint (401/403/404), group calls
+are not tried again for GROUP_RETRY seconds.
+
+Calls run CONCURRENCY at a time and at most MAX_CALLS per run; they also pass through
+the weather client's quota, so the job never spends the whole provider limit. Locations
+over budget are left for the next run. The weather endpoint reads the snapshots before
+calling the API.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+import httpx
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from app.db import db
+from app.services.crud import bulk_write, find_one, iter_documents
+from app.services.http_client import get_http_client
+from app.services.resilience import UpstreamUnavailable
+from app.services.scheduler import PeriodicJob
+from app.services.settings import feature_status, require_key
+
+logger = logging.getLogger(__name__)
+
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "http://api.openweathermap.org/data/2.5/weather")
+WEATHER_GROUP_API_URL = os.getenv("WEATHER_GROUP_API_URL", WEATHER_API_URL.rsplit("/", 1)[0] + "/group")
+PRECOMPUTE_INTERVAL = float(os.getenv("WEATHER_PRECOMPUTE_INTERVAL", "900"))
+CONCURRENCY = int(os.getenv("WEATHER_PRECOMPUTE_CONCURRENCY", "5"))
+MAX_CALLS = int(os.getenv("WEATHER_PRECOMPUTE_MAX_CALLS", "40"))
+GROUP_SIZE = int(os.getenv("WEATHER_GROUP_SIZE", "20"))
+# After the group endpoint answers one of GROUP_UNSUPPORTED_STATUS, only single calls are made this long.
+GROUP_RETRY = float(os.getenv("WEATHER_GROUP_RETRY", str(24 * 3600)))
+GROUP_UNSUPPORTED_STATUS = {401, 403, 404}
+COORD_PRECISION = int(os.getenv("WEATHER_COORD_PRECISION", "1"))
+# Snapshots older than this are not served by the weather endpoint.
+SNAPSHOT_MAX_AGE = float(os.getenv("WEATHER_SNAPSHOT_MAX_AGE", "3600"))
+# A city OpenWeatherMap does not know is not looked up again for this long.
+NOT_FOUND_RETRY = float(os.getenv("WEATHER_NOT_FOUND_RETRY", str(24 * 3600)))
+
+SNAPSHOTS_COLLECTION = db["weather_snapshots"]
+FARMERS_COLLECTION = db["farmers"]
+
+# time.monotonic() until which group calls are skipped.
+_groups_unsupported_until = 0.0
+
+LOCATION_PROJECTION = {"city": 1, "location": 1, "district": 1, "lat": 1, "lon": 1}
+
+
+def normalize_city(city: str) -> str:
+    return " ".join(city.split()).casefold()
+
+
+def city_key(city: str) -> str:
+    return f"city:{normalize_city(city)}"
+
+
+def profile_location(profile: dict):
+    """(snapshot key, request params) for a farmer profile, or None when it has no usable location."""
+    for field in ("city", "location", "district"):
+        value = profile.get(field)
+        if isinstance(value, str) and value.strip():
+            return city_key(value), {"q": normalize_city(value)}
+    lat, lon = profile.get("lat"), profile.get("lon")
+    if isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
+        lat, lon = round(lat, COORD_PRECISION), round(lon, COORD_PRECISION)
+        return f"coord:{lat},{lon}", {"lat": lat, "lon": lon}
+    return None
+
+
+def to_conditions(data: dict):
+    return {
+        "temperature": data["main"]["temp"],
+        "description": data["weather"][0]["description"],
+        "humidity": data["main"]["humidity"],
+        "wind_speed": data["wind"]["speed"]
+    }
+
+
+async def fetch_current(params: dict):
+    """Raw current-weather JSON for a city (q) or coordinates (lat, lon)."""
+    api_key = require_key("weather")
+    response = await get_http_client("weather").get(
+        WEATHER_API_URL, params={**params, "appid": api_key, "units": "metric"}
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="City not found or API error")
+    return response.json()
+
+
+async def fetch_group(city_ids: list):
+    """Current weather for up to GROUP_SIZE OpenWeatherMap city ids in one call."""
+    api_key = require_key("weather")
+    response = await get_http_client("weather").get(
+        WEATHER_GROUP_API_URL,
+        params={"id": ",".join(str(i) for i in city_ids), "appid": api_key, "units": "metric"},
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail="Weather group API error")
+    return response.json().get("list") or []
+
+
+async def read_snapshot(key: str):
+    """(conditions, age in seconds) of a usable snapshot, or None."""
+    if not feature_status()["database"]:
+        return None
+    try:
+        doc = await find_one(SNAPSHOTS_COLLECTION, {"_id": key, "conditions": {"$exists": True}},
+                             {"conditions": 1, "fetched_at": 1})
+    except Exception as e:
+        # Snapshots only save API calls; without them the caller asks OpenWeatherMap.
+        logger.warning("Could not read weather snapshot %s: %r", key, e)
+        return None
+    if doc is None:
+        return None
+    age = (datetime.utcnow() - doc["fetched_at"]).total_seconds()
+    return (doc["conditions"], age) if age < SNAPSHOT_MAX_AGE else None
+
+
+class Location:
+    def __init__(self, key: str, params: dict):
+        self.key = key
+        self.params = params
+        self.farmers = 0
+        self.city_id = None
+
+
+async def collect_locations():
+    """Stream farmer profiles into distinct locations; returns (profiles scanned, locations by key)."""
+    profiles = 0
+    locations = {}
+    async for profile in iter_documents(FARMERS_COLLECTION, {}, LOCATION_PROJECTION):
+        profiles += 1
+        found = profile_location(profile)
+        if found is None:
+            continue
+        key, params = found
+        location = locations.get(key)
+        if location is None:
+            location = locations[key] = Location(key, params)
+        location.farmers += 1
+    return profiles, locations
+
+
+async def load_known(locations: dict):
+    """Fill in city ids learned by earlier runs; returns the keys not to look up again yet."""
+    skip = set()
+    retry_after = datetime.utcnow() - timedelta(seconds=NOT_FOUND_RETRY)
+    async for doc in iter_documents(SNAPSHOTS_COLLECTION, {}, {"city_id": 1, "not_found_at": 1}):
+        location = locations.get(doc["_id"])
+        if location is None:
+            continue
+        location.city_id = doc.get("city_id")
+        if location.city_id is None and doc.get("not_found_at") and doc["not_found_at"] > retry_after:
+            skip.add(location.key)
+    return skip
+
+
+def plan_calls(locations: dict, skip: set):
+    """Group calls for locations with a known city id, then single lookups, busiest first."""
+    by_city = {}
+    singles = []
+    for location in sorted(locations.values(), key=lambda loc: loc.farmers, reverse=True):
+        if location.key in skip:
+            continue
+        if location.city_id:
+            by_city.setdefault(location.city_id, []).append(location)
+        else:
+            singles.append(location)
+    city_ids = list(by_city)
+    groups = [
+        {city_id: by_city[city_id] for city_id in city_ids[i:i + GROUP_SIZE]}
+        for i in range(0, len(city_ids), GROUP_SIZE)
+    ]
+    return groups, singles
+
+
+def _snapshot_update(location: Location, data: dict, now: datetime):
+    return UpdateOne(
+        {"_id": location.key},
+        {"$set": {
+            "conditions": to_conditions(data),
+            "city_id": data.get("id") or location.city_id,
+            "name": data.get("name"),
+            "params": location.params,
+            "farmers": location.farmers,
+            "fetched_at": now,
+        }, "$unset": {"not_found_at": ""}},
+        upsert=True,
+    )
+
+
+def _location_count(item) -> int:
+    """Locations covered by a planned call: a group {city_id: [locations]} or one Location."""
+    return sum(len(locations) for locations in item.values()) if isinstance(item, dict) else 1
+
+
+class PrecomputeRun:
+    """One run's budget and counters."""
+
+    def __init__(self, max_calls: int):
+        self.remaining = max_calls
+        self.halted = False
+        self.use_groups = time.monotonic() >= _groups_unsupported_until
+        self.stats = {"group_calls": 0, "single_calls": 0, "refreshed": 0, "failed": 0, "deferred": 0}
+
+    def take_call(self) -> bool:
+        if self.halted or self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+    async def refresh_group(self, group: dict):
+        global _groups_unsupported_until
+        if not self.use_groups:
+            return await self.refresh_singly(group)
+        if not self.take_call():
+            self.stats["deferred"] += _location_count(group)
+            return []
+        self.stats["group_calls"] += 1
+        now = datetime.utcnow()
+        try:
+            entries = {entry.get("id"): entry for entry in await fetch_group(list(group))}
+        except UpstreamUnavailable:
+            raise
+        except (HTTPException, httpx.HTTPError) as e:
+            logger.warning("Weather group call failed, refreshing its cities one by one: %r", e)
+            self.use_groups = False
+            if isinstance(e, HTTPException) and e.status_code in GROUP_UNSUPPORTED_STATUS:
+                _groups_unsupported_until = time.monotonic() + GROUP_RETRY
+            return await self.refresh_singly(group)
+        operations = []
+        for city_id, locations in group.items():
+            entry = entries.get(city_id)
+            if entry is None:
+                self.stats["failed"] += len(locations)
+                continue
+            operations.extend(_snapshot_update(location, entry, now) for location in locations)
+        self.stats["refreshed"] += len(operations)
+        return operations
+
+    async def refresh_singly(self, group: dict):
+        """Refresh a group's locations with single calls, from the same budget."""
+        operations = []
+        for locations in group.values():
+            for location in locations:
+                try:
+                    operations.extend(await self.refresh_single(location))
+                except UpstreamUnavailable as e:
+                    # The remaining locations are deferred by take_call().
+                    logger.warning("Weather precompute stopped early: %s", e)
+                    self.halted = True
+                    self.stats["deferred"] += 1
+                except Exception as e:
+                    logger.warning("Weather precompute call failed: %r", e)
+                    self.stats["failed"] += 1
+        return operations
+
+    async def refresh_single(self, location: Location):
+        if not self.take_call():
+            self.stats["deferred"] += 1
+            return []
+        self.stats["single_calls"] += 1
+        now = datetime.utcnow()
+        try:
+            data = await fetch_current(location.params)
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+            self.stats["failed"] += 1
+            return [UpdateOne({"_id": location.key},
+                              {"$set": {"params": location.params, "farmers": location.farmers, "not_found_at": now}},
+                              upsert=True)]
+        self.stats["refreshed"] += 1
+        return [_snapshot_update(location, data, now)]
+
+    async def run(self, work: list):
+        """Run (refresh, argument) items CONCURRENCY at a time, writing each result as it arrives."""
+        queue = iter(work)
+
+        async def worker():
+            for refresh, item in queue:
+                try:
+                    operations = await refresh(item)
+                except UpstreamUnavailable as e:
+                    # Circuit open or quota used up: leave the rest for the next run.
+                    logger.warning("Weather precompute stopped early: %s", e)
+                    self.halted = True
+                    self.stats["deferred"] += _location_count(item)
+                    continue
+                except Exception as e:
+                    logger.warning("Weather precompute call failed: %r", e)
+                    self.stats["failed"] += _location_count(item)
+                    continue
+                if operations:
+                    await bulk_write(SNAPSHOTS_COLLECTION, operations)
+
+        await asyncio.gather(*(worker() for _ in range(max(1, CONCURRENCY))))
+
+
+async def precompute_weather():
+    require_key("weather")
+    started = time.perf_counter()
+    profiles, locations = await collect_locations()
+    skip = await load_known(locations)
+    groups, singles = plan_calls(locations, skip)
+
+    run = PrecomputeRun(MAX_CALLS)
+    await run.run([(run.refresh_group, group) for group in groups] +
+                  [(run.refresh_single, location) for location in singles])
+
+    located = sum(location.farmers for location in locations.values())
+    calls = run.stats["group_calls"] + run.stats["single_calls"]
+    return {
+        "profiles": profiles,
+        "profiles_with_location": located,
+        "locations": len(locations),
+        "skipped_not_found": len(skip),
+        **run.stats,
+        "upstream_calls": calls,
+        # Against one call per farmer: sharing a call per location, and several locations per group call.
+        "calls_saved_by_dedup": located - len(locations),
+        "calls_saved_by_grouping": max(0, run.stats["refreshed"] - calls),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+weather_precompute_job = PeriodicJob("weather_precompute", precompute_weather, PRECOMPUTE_INTERVAL, leased=True)
+
+
+def precompute_stats():
+    stats = dict(weather_precompute_job.last_result or {})
+    stats["runs"] = weather_precompute_job.runs
+    stats["failures"] = weather_precompute_job.failures
+    return stats
@@ -0,0 +1,84 @@
+"""
+Crop recommendation benchmark.
+
+Scores synthetic plots with the vectorized engine (app.services.crop_model) at increasing
+batch sizes, both as one array call and end to end from a JSON body, and reports plots per
+second. --per-plot also times scoring the same plots one call at a time.
+
+    python -m benchmarks.crop_bench --sizes 1 100 10000 100000 --per-plot
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.routers.crop import parse_plots, recommend_plots
+from app.services import crop_model
+
+
+def synthetic_plots(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ph = rng.uniform(4.5, 9.0, count).round(1)
+    clay = rng.uniform(5, 60, count).round(1)
+    missing = rng.random(count) < 0.3
+    return [
+        {
+            "id": i,
+            "soil_type": str(rng.choice(crop_model.SOIL_TYPES)),
+            "season": str(rng.choice(crop_model.SEASONS)),
+            "rainfall": float(rng.uniform(100, 2500)),
+            "ph": None if missing[i] else float(ph[i]),
+            "clay_percent": None if missing[i] else float(clay[i]),
+        }
+        for i in range(count)
+    ]
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run_size(count: int, repeat: int, per_plot: bool):
+    plots = synthetic_plots(count)
+    body = json.dumps(plots).encode()
+    columns = parse_plots(body, ndjson=False)
+
+    engine = timed(lambda: crop_model.recommend(
+        columns["soil_type"], columns["season"], columns["rainfall"], columns["ph"], columns["clay_percent"]
+    ), repeat)
+    end_to_end = timed(lambda: recommend_plots(parse_plots(body, ndjson=False), 3), repeat)
+    result = {
+        "plots": count,
+        "engine_ms": round(engine * 1000, 3),
+        "engine_plots_per_second": round(count / engine),
+        "end_to_end_ms": round(end_to_end * 1000, 3),
+        "end_to_end_plots_per_second": round(count / end_to_end),
+    }
+    if per_plot:
+        def one_at_a_time():
+            for plot in plots:
+                crop_model.recommend([plot["soil_type"]], [plot["season"]], [plot["rainfall"]])
+
+        single = timed(one_at_a_time, 1)
+        result["per_plot_ms"] = round(single * 1000, 3)
+        result["per_plot_plots_per_second"] = round(count / single)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--per-plot", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps([run_size(size, args.repeat, args.per_plot) for size in args.sizes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
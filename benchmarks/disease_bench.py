@@ -0,0 +1,84 @@
+"""
+Disease inference benchmark.
+
+Submits synthetic leaf images concurrently to the micro-batching pipeline
+(app.services.inference.MicroBatcher) for several batch settings and reports images per
+second and latency percentiles. CPU only.
+
+    python -m benchmarks.disease_bench --images 512 --concurrency 64 --batch-sizes 1 4 16 32
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+
+import numpy as np
+
+from app.services.inference import MicroBatcher
+from benchmarks.stats import percentile
+
+
+def synthetic_images(count: int, size: int = 640, seed: int = 0):
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+async def run_setting(images, concurrency, workers, batch_size, max_wait_ms):
+    batcher = MicroBatcher(workers=workers, max_batch_size=batch_size, max_wait_ms=max_wait_ms, queue_size=len(images))
+    batcher.start()
+    # Warm the pool so model loading is not counted.
+    await asyncio.gather(*[batcher.submit(images[0]) for _ in range(workers)])
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(data):
+        async with semaphore:
+            started = time.perf_counter()
+            await batcher.submit(data)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(data) for data in images])
+    elapsed = time.perf_counter() - started
+    stats = batcher.stats()
+    await batcher.stop()
+    return {
+        "max_batch_size": batch_size,
+        "max_wait_ms": max_wait_ms,
+        "workers": workers,
+        "images_per_second": round(len(images) / elapsed, 1),
+        "avg_batch_size": stats["avg_batch_size"],
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+    }
+
+
+async def run(args):
+    images = synthetic_images(args.images)
+    return [
+        await run_setting(images, args.concurrency, args.workers, batch_size, args.max_wait_ms)
+        for batch_size in args.batch_sizes
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
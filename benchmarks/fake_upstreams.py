@@ -0,0 +1,192 @@
+"""
+Local stand-ins for every external API the backend calls.
+
+One FastAPI app serves OpenWeatherMap, data.gov.in, SoilGrids, the myscheme.gov.in
+listing page and the OpenAI chat completions API under path prefixes. Responses have
+the same shape as the real services, and each upstream sleeps for a configurable
+latency with jitter, so benchmarks run without network access.
+
+    python -m benchmarks.fake_upstreams --port 8900 --latency weather=80 soil=1500
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
+
+# Milliseconds, roughly what the real services answer in from an Indian data centre.
+DEFAULT_LATENCY_MS = {"weather": 80, "market": 250, "soil": 1200, "schemes": 400, "openai": 700}
+JITTER = 0.3
+
+COMMODITIES = ["Wheat", "Rice", "Maize", "Cotton", "Onion", "Potato", "Tomato", "Soyabean", "Mustard", "Gram"]
+STATES = ["Uttar Pradesh", "Punjab", "Maharashtra", "Madhya Pradesh", "Bihar", "Rajasthan"]
+MARKET_RECORDS = 2000
+SOIL_PROPERTIES = ["bdod", "cec", "clay", "nitrogen", "phh2o", "sand", "silt", "soc"]
+SOIL_DEPTHS = ["0-5cm", "5-15cm", "15-30cm", "30-60cm", "60-100cm", "100-200cm"]
+
+
+def upstream_env(base_url: str) -> dict:
+    """Environment that points the backend at these fakes."""
+    return {
+        "WEATHER_API_URL": f"{base_url}/weather/data/2.5/weather",
+        "OPENWEATHER_API_KEY": "fake",
+        "MARKET_API_BASE_URL": f"{base_url}/market",
+        "MARKET_API_KEY": "fake",
+        "SOILGRIDS_BASE_URL": f"{base_url}/soil/properties/query",
+        "SCHEMES_PORTAL_URL": f"{base_url}/schemes",
+        "OPENAI_BASE_URL": f"{base_url}/openai/v1",
+        "OPENAI_API_KEY": "fake",
+    }
+
+
+def market_records():
+    rng = random.Random(0)
+    today = datetime.utcnow().date()
+    records = []
+    for i in range(MARKET_RECORDS):
+        modal = rng.randint(800, 6000)
+        records.append({
+            "state": STATES[i % len(STATES)],
+            "district": f"District {i % 40}",
+            "market": f"Mandi {i % 120}",
+            "commodity": COMMODITIES[i % len(COMMODITIES)],
+            "variety": "Other",
+            "grade": "FAQ",
+            "arrival_date": (today - timedelta(days=i % 5)).strftime("%d/%m/%Y"),
+            "min_price": str(modal - 200),
+            "max_price": str(modal + 200),
+            "modal_price": str(modal),
+        })
+    return records
+
+
+def schemes_page(count: int = 40) -> str:
+    cards = "".join(
+        f'<div class="MuiCard-root"><h2>Krishi Yojana {i}</h2>'
+        f'<p>Support scheme {i} for small and marginal farmers.</p>'
+        f'<a href="https://example.invalid/schemes/{i}">Details</a></div>'
+        for i in range(count)
+    )
+    return f"<html><body>{cards}</body></html>"
+
+
+def build_app(latency_ms: dict) -> FastAPI:
+    app = FastAPI(title="Fake upstreams")
+    records = market_records()
+    page = schemes_page()
+    calls = {name: 0 for name in DEFAULT_LATENCY_MS}
+
+    async def delay(upstream: str):
+        calls[upstream] += 1
+        base = latency_ms[upstream] / 1000
+        await asyncio.sleep(max(0.0, random.uniform(base * (1 - JITTER), base * (1 + JITTER))))
+
+    def current_weather(name: str, city_id: int):
+        seed = sum(map(ord, name))
+        return {
+            "id": city_id,
+            "name": name,
+            "main": {"temp": 18 + seed % 20, "humidity": 40 + seed % 50},
+            "weather": [{"description": ["clear sky", "few clouds", "light rain"][seed % 3]}],
+            "wind": {"speed": round(1 + (seed % 70) / 10, 1)},
+        }
+
+    def city_id(name: str):
+        return 1000000 + sum(ord(c) * 31 ** i for i, c in enumerate(name)) % 9000000
+
+    @app.get("/weather/data/2.5/weather")
+    async def weather(q: str | None = None, lat: float | None = None, lon: float | None = None):
+        await delay("weather")
+        name = q if q is not None else f"{lat:.1f},{lon:.1f}"
+        return current_weather(name, city_id(name))
+
+    @app.get("/weather/data/2.5/group")
+    async def weather_group(id: str):
+        await delay("weather")
+        ids = [int(i) for i in id.split(",") if i]
+        return {"cnt": len(ids), "list": [current_weather(f"city {i}", i) for i in ids]}
+
+    @app.get("/market/resource/{resource_id}")
+    async def market(request: Request, resource_id: str, offset: int = 0, limit: int = 10):
+        await delay("market")
+        commodity = request.query_params.get("filters[commodity]")
+        matching = [r for r in records if r["commodity"].lower() == commodity.lower()] if commodity else records
+        return {"total": len(matching), "count": len(matching[offset:offset + limit]),
+                "records": matching[offset:offset + limit]}
+
+    @app.get("/soil/properties/query")
+    async def soil(lat: float, lon: float):
+        await delay("soil")
+        rng = random.Random(f"{lat:.4f}:{lon:.4f}")
+        layers = [
+            {"name": name, "depths": [
+                {"range": {}, "label": depth, "depth_range": depth, "values": {"mean": rng.randint(10, 400)}}
+                for depth in SOIL_DEPTHS
+            ]}
+            for name in SOIL_PROPERTIES
+        ]
+        return {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "properties": {"layers": layers}}
+
+    @app.get("/schemes")
+    async def schemes():
+        await delay("schemes")
+        return HTMLResponse(page, headers={"ETag": '"fake-schemes-v1"'})
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        await delay("openai")
+        answer = "Use certified seed, irrigate at crown root initiation and apply nitrogen in two splits."
+        created = int(time.time())
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer}}],
+                "usage": {"prompt_tokens": 20, "completion_tokens": 20, "total_tokens": 40},
+            }
+
+        async def chunks():
+            for word in answer.split(" "):
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                         "model": body.get("model"), "choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(0.01)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.get("/calls")
+    async def call_counts():
+        return calls
+
+    return app
+
+
+def parse_latency(items) -> dict:
+    latency = dict(DEFAULT_LATENCY_MS)
+    for item in items or []:
+        name, _, value = item.partition("=")
+        if name not in latency:
+            raise SystemExit(f"Unknown upstream {name!r}; choose from {', '.join(latency)}")
+        latency[name] = float(value)
+    return latency
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", nargs="*", metavar="UPSTREAM=MS", help="Override per-upstream latency")
+    args = parser.parse_args()
+    uvicorn.run(build_app(parse_latency(args.latency)), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Bulk farmer profile import benchmark.
+
+Writes a synthetic CSV or NDJSON file, streams it through app.services.farmer_import in
+64 KiB chunks, as the /farmer/import endpoint receives it, and reports rows per second
+(and peak memory with --trace-memory). --mongo none times reading and validating only;
+mongomock (mongomock-motor) or url (MONGO_URL, a throwaway database) also run the
+bulk upserts.
+
+    python -m benchmarks.farmer_import_bench --sizes 10000 100000 1000000 --format csv --mongo url
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from app.services import farmer_import
+
+CHUNK_BYTES = 64 * 1024
+COLUMNS = ["user_id", "name", "phone", "village", "district", "state", "lat", "lon", "land_acres", "soil_type", "crops"]
+CROPS = ["wheat", "rice", "maize", "mustard", "gram", "cotton", "sugarcane"]
+SOILS = ["alluvial", "black", "red", "laterite", "sandy"]
+
+
+def synthetic_rows(count: int, invalid_rate: float, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(count):
+        row = {
+            "user_id": f"KM-{i:07d}",
+            "name": f"Farmer {i}",
+            "phone": f"9{rng.randrange(10 ** 9):09d}",
+            "village": f"Village {i % 500}",
+            "district": f"District {i % 40}",
+            "state": "Uttar Pradesh",
+            "lat": round(rng.uniform(24, 30), 4),
+            "lon": round(rng.uniform(77, 84), 4),
+            "land_acres": round(rng.uniform(0.5, 10), 2),
+            "soil_type": rng.choice(SOILS),
+            "crops": rng.sample(CROPS, 2),
+        }
+        if rng.random() < invalid_rate:
+            row["lat"] = 123.0
+        yield row
+
+
+def encode(row: dict, fmt: str) -> str:
+    if fmt == farmer_import.NDJSON:
+        return json.dumps(row) + "\n"
+    cells = [";".join(row[c]) if c == "crops" else str(row[c]) for c in COLUMNS]
+    return ",".join(f'"{cell}"' if "," in cell else cell for cell in cells) + "\n"
+
+
+def write_upload(path: str, count: int, fmt: str, invalid_rate: float):
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == farmer_import.CSV:
+            f.write(",".join(COLUMNS) + "\n")
+        for row in synthetic_rows(count, invalid_rate):
+            f.write(encode(row, fmt))
+
+
+async def upload(path: str):
+    """The file as the endpoint sees it: an async stream of byte chunks."""
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_BYTES):
+            yield chunk
+
+
+async def validate_only(path: str, fmt: str, batch_size: int):
+    header, batch, rows, failed = None, [], 0, 0
+    async for text in farmer_import.iter_records(upload(path), fmt):
+        if fmt == farmer_import.CSV and header is None:
+            header = text.split(",")
+            continue
+        rows += 1
+        batch.append((rows, text))
+        if len(batch) >= batch_size:
+            failed += len(farmer_import.prepare_batch(batch, fmt, header, "benchmark")[2])
+            batch = []
+    if batch:
+        failed += len(farmer_import.prepare_batch(batch, fmt, header, "benchmark")[2])
+    return {"rows": rows, "failed": failed}
+
+
+def collection_for(mode: str):
+    """The app's farmers collection, in a throwaway database (version counters live there too)."""
+    from app import db as app_db
+
+    app_db.DB_NAME = "krishimitra_import_bench"
+    if mode == "mongomock":
+        from mongomock_motor import AsyncMongoMockClient
+
+        app_db._client = AsyncMongoMockClient()
+    elif not os.getenv("MONGO_URL"):
+        raise SystemExit("--mongo url needs MONGO_URL")
+    return app_db.db["farmers"]
+
+
+async def run_size(count: int, args):
+    path = os.path.join(tempfile.mkdtemp(prefix="krishimitra-import-"), f"farmers.{args.format}")
+    write_upload(path, count, args.format, args.invalid_rate)
+    file_mb = round(os.path.getsize(path) / 2 ** 20, 1)
+    collection = None
+    if args.mongo != "none":
+        collection = collection_for(args.mongo)
+        await collection.drop()
+        await collection.create_index("user_id", unique=True)
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        if collection is None:
+            report = await validate_only(path, args.format, args.batch_size)
+        else:
+            report = await farmer_import.import_profiles(collection, upload(path), args.format, "benchmark",
+                                                         batch_size=args.batch_size)
+        seconds = time.perf_counter() - started
+    finally:
+        shutil.rmtree(os.path.dirname(path))
+    result = {
+        "rows": count,
+        "format": args.format,
+        "mongo": args.mongo,
+        "batch_size": args.batch_size,
+        "file_mb": file_mb,
+        "failed": report["failed"],
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(count / seconds),
+    }
+    if args.trace_memory:
+        result["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    return result
+
+
+async def run(args):
+    return [await run_size(size, args) for size in args.sizes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--format", choices=[farmer_import.CSV, farmer_import.NDJSON], default=farmer_import.CSV)
+    parser.add_argument("--mongo", choices=["none", "mongomock", "url"], default="none")
+    parser.add_argument("--batch-size", type=int, default=farmer_import.BATCH_SIZE)
+    parser.add_argument("--invalid-rate", type=float, default=0.01, help="share of rows that fail validation")
+    parser.add_argument("--trace-memory", action="store_true", help="report peak Python memory (several times slower)")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+Offline load test.
+
+Starts the fake upstreams (benchmarks.fake_upstreams) and a local MongoDB stand-in,
+runs the backend under uvicorn pointed at them, drives a scripted workload mix with
+concurrent virtual users, and reports throughput and p50/p95/p99 latency per endpoint.
+Reports are saved as JSON so runs on different commits can be compared. Nothing
+leaves the machine.
+
+    python -m benchmarks.loadtest run --workload morning_peak --users 50 --duration 60
+    python -m benchmarks.loadtest run --workload community_burst --latency soil=3000
+    python -m benchmarks.loadtest compare benchmarks/results/a.json benchmarks/results/b.json
+
+MongoDB stand-in (--mongo): "mongod" starts a throwaway mongod from PATH on a temporary
+data directory; "mongomock" uses mongomock-motor in memory (no text search or change
+streams); "url" uses MONGO_URL with a separate krishimitra_loadtest database that is
+emptied at the start of each run; "auto" picks mongod when installed, otherwise mongomock.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_upstreams import parse_latency, upstream_env
+from benchmarks.stats import percentile
+
+RESULTS_DIR = Path(__file__).parent / "results"
+LOADTEST_DB = "krishimitra_loadtest"
+
+CITIES = ["Lucknow", "Kanpur", "Varanasi", "Patna", "Nagpur", "Indore", "Bhopal", "Jaipur", "Ludhiana",
+          "Amritsar", "Nashik", "Pune", "Meerut", "Agra", "Gaya", "Kota", "Ujjain", "Bareilly", "Aligarh", "Jhansi"]
+CROPS = ["wheat", "rice", "maize", "cotton", "onion", "potato", "mustard", "gram"]
+SEARCH_TERMS = ["wheat rust", "irrigation", "urea dose", "\u0917\u0947\u0939\u0942\u0902", "pest control", "drip subsidy"]
+
+
+class Context:
+    """Shared state of the virtual users: seeded accounts and posts."""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.users = []
+        self.post_ids = []
+
+    def auth(self):
+        return {"Authorization": f"Bearer {self.rng.choice(self.users)['token']}"}
+
+
+# --- Endpoints the workloads are built from ---
+
+async def weather(client, ctx):
+    return await client.get(f"/weather/weather/{ctx.rng.choice(CITIES)}")
+
+
+async def market(client, ctx):
+    return await client.get(f"/market/market-price/{ctx.rng.choice(CROPS)}")
+
+
+async def login(client, ctx):
+    user = ctx.rng.choice(ctx.users)
+    return await client.post("/auth/login", json={"email": user["email"], "password": user["password"]})
+
+
+async def dashboard(client, ctx):
+    return await client.get("/dashboard", headers=ctx.auth())
+
+
+async def soil(client, ctx):
+    lat, lon = round(ctx.rng.uniform(21, 30), 3), round(ctx.rng.uniform(73, 86), 3)
+    return await client.get("/soil/soil", params={"lat": lat, "lon": lon})
+
+
+async def crop(client, ctx):
+    params = {"soil_type": ctx.rng.choice(["loamy", "clay", "sandy", "black"]),
+              "season": ctx.rng.choice(["kharif", "rabi", "zaid"]), "rainfall": ctx.rng.randint(200, 2000)}
+    return await client.post("/crop/recommend", params=params)
+
+
+async def schemes(client, ctx):
+    return await client.get("/schemes/all")
+
+
+async def assistant(client, ctx):
+    return await client.post("/assistant/ask", params={"query": f"When should I sow {ctx.rng.choice(CROPS)}?"})
+
+
+async def community_feed(client, ctx):
+    return await client.get("/community/all", params={"limit": 20})
+
+
+async def community_post(client, ctx):
+    response = await client.post("/community/post", headers=ctx.auth(), json={
+        "title": f"Question about {ctx.rng.choice(CROPS)}",
+        "content": f"My {ctx.rng.choice(CROPS)} leaves are turning yellow after {ctx.rng.randint(2, 9)} days of rain.",
+    })
+    if response.status_code < 400:
+        ctx.post_ids.append(response.json()["id"])
+    return response
+
+
+async def community_reply(client, ctx):
+    post_id = ctx.rng.choice(ctx.post_ids)
+    return await client.post(f"/community/reply/{post_id}", headers=ctx.auth(),
+                             json={"message": "Spray neem oil and check drainage."})
+
+
+async def community_search(client, ctx):
+    return await client.get("/community/search", params={"q": ctx.rng.choice(SEARCH_TERMS)})
+
+
+ENDPOINTS = {fn.__name__: fn for fn in (
+    weather, market, login, dashboard, soil, crop, schemes, assistant,
+    community_feed, community_post, community_reply, community_search,
+)}
+
+# Relative weights of each endpoint in a workload.
+WORKLOADS = {
+    "morning_peak": {"weather": 35, "market": 25, "login": 15, "dashboard": 15, "soil": 5, "crop": 5},
+    "community_burst": {"community_feed": 45, "community_post": 20, "community_reply": 20, "community_search": 15},
+    "mixed": {"weather": 15, "market": 15, "login": 5, "dashboard": 10, "soil": 5, "crop": 10, "schemes": 5,
+              "assistant": 5, "community_feed": 15, "community_post": 5, "community_reply": 5, "community_search": 5},
+}
+
+
+# --- Processes ---
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def choose_mongo(mode: str) -> str:
+    if mode != "auto":
+        return mode
+    if shutil.which("mongod"):
+        return "mongod"
+    try:
+        import mongomock_motor  # noqa: F401
+    except ImportError:
+        raise SystemExit("No MongoDB stand-in: install mongod or mongomock-motor, or pass --mongo url")
+    return "mongomock"
+
+
+def start_mongod(data_dir: str):
+    port = free_port()
+    process = subprocess.Popen(
+        ["mongod", "--dbpath", data_dir, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return process, f"mongodb://127.0.0.1:{port}"
+
+
+async def wait_until_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+def serve_app(port: int, mongomock: bool):
+    """Run the backend in this process; used as the app subprocess of `run`."""
+    import uvicorn
+    from app import db as app_db
+
+    if mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        app_db._client = AsyncMongoMockClient()
+    from app.main import create_app
+
+    uvicorn.run(create_app(), host="127.0.0.1", port=port, log_level="warning")
+
+
+# --- Load generation ---
+
+async def seed(client, ctx, users: int, posts: int):
+    run_id = int(time.time())
+
+    async def one_user(i):
+        email, password = f"loadtest{run_id}-{i}@example.com", "loadtest-password"
+        await client.post("/auth/signup", json={"name": f"Farmer {i}", "email": email, "password": password})
+        response = await client.post("/auth/login", json={"email": email, "password": password})
+        response.raise_for_status()
+        user = {"email": email, "password": password, "token": response.json()["access_token"]}
+        await client.post("/farmer/create", headers={"Authorization": f"Bearer {user['token']}"}, json={
+            "city": CITIES[i % len(CITIES)], "lat": 26.85 + i * 0.01, "lon": 80.95,
+            "crops": [CROPS[i % len(CROPS)], CROPS[(i + 3) % len(CROPS)]],
+        })
+        ctx.users.append(user)
+
+    await asyncio.gather(*[one_user(i) for i in range(users)])
+    for _ in range(posts):
+        await community_post(client, ctx)
+
+
+async def drive(client, ctx, mix: dict, users: int, seconds: float, samples=None):
+    """Closed loop: each virtual user sends its next request as soon as the previous one returns."""
+    names, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + seconds
+
+    async def virtual_user():
+        while time.perf_counter() < deadline:
+            name = ctx.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = (await ENDPOINTS[name](client, ctx)).status_code < 400
+            except (httpx.HTTPError, IndexError):
+                ok = False
+            if samples is not None:
+                samples.setdefault(name, []).append(((time.perf_counter() - started) * 1000, ok))
+
+    await asyncio.gather(*[virtual_user() for _ in range(users)])
+
+
+def summarize(samples: dict, seconds: float) -> dict:
+    def stats(entries):
+        latencies = [latency for latency, _ in entries]
+        errors = sum(1 for _, ok in entries if not ok)
+        return {
+            "requests": len(entries),
+            "errors": errors,
+            "error_rate": round(errors / len(entries), 4) if entries else 0.0,
+            "throughput_rps": round(len(entries) / seconds, 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(max(latencies, default=0.0), 2),
+        }
+
+    every = [entry for entries in samples.values() for entry in entries]
+    return {"total": stats(every), "endpoints": {name: stats(entries) for name, entries in sorted(samples.items())}}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    mix = WORKLOADS[args.workload]
+    mongo = choose_mongo(args.mongo)
+    latency = parse_latency(args.latency)
+    processes = []
+    data_dir = tempfile.mkdtemp(prefix="krishimitra-mongo-") if mongo == "mongod" else None
+    try:
+        upstream_port, app_port = free_port(), free_port()
+        upstream_url, app_url = f"http://127.0.0.1:{upstream_port}", f"http://127.0.0.1:{app_port}"
+        latency_args = [f"{name}={ms}" for name, ms in latency.items()]
+        processes.append(subprocess.Popen([sys.executable, "-m", "benchmarks.fake_upstreams",
+                                           "--port", str(upstream_port), "--latency", *latency_args]))
+
+        env = {**os.environ, **upstream_env(upstream_url), "MONGO_DB_NAME": LOADTEST_DB,
+               "JWT_SECRET": "loadtest-secret", "PYTHONPATH": os.getcwd()}
+        if not args.keep_limits:
+            # All virtual users share one IP and the fakes have no quota to protect.
+            env["RATE_LIMIT_ENABLED"] = "0"
+            env.update({f"{name.upper()}_QUOTA_PER_MINUTE": "0" for name in latency})
+        if mongo == "mongod":
+            mongod, env["MONGO_URL"] = start_mongod(data_dir)
+            processes.append(mongod)
+        elif mongo == "mongomock":
+            # The URL only marks the database as configured; the client is replaced in serve-app.
+            env.update(MONGO_URL="mongodb://mongomock", SEARCH_BACKEND="memory", COMMUNITY_EVENTS_BACKEND="memory")
+        elif not env.get("MONGO_URL"):
+            raise SystemExit("--mongo url needs MONGO_URL")
+        else:
+            from pymongo import MongoClient
+
+            # Start from an empty database so runs are comparable.
+            MongoClient(env["MONGO_URL"]).drop_database(LOADTEST_DB)
+
+        app_command = [sys.executable, "-m", "benchmarks.loadtest", "serve-app", "--port", str(app_port)]
+        processes.append(subprocess.Popen(app_command + (["--mongomock"] if mongo == "mongomock" else []), env=env))
+        await wait_until_ready(f"{upstream_url}/calls")
+        await wait_until_ready(f"{app_url}/health")
+
+        ctx = Context(args.seed)
+        limits = httpx.Limits(max_connections=args.users + 10)
+        async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+            await seed(client, ctx, args.seed_users, args.seed_posts)
+            await drive(client, ctx, mix, args.users, args.warmup)
+            samples = {}
+            started = time.perf_counter()
+            await drive(client, ctx, mix, args.users, args.duration, samples)
+            elapsed = time.perf_counter() - started
+            upstream_calls = (await client.get(f"{upstream_url}/calls")).json()
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "workload": args.workload,
+            "mix": mix,
+            "users": args.users,
+            "duration_seconds": round(elapsed, 2),
+            "warmup_seconds": args.warmup,
+            "mongo": mongo,
+            "upstream_latency_ms": latency,
+            "commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": sys.version.split()[0],
+        },
+        **summarize(samples, elapsed),
+        "upstream_calls": upstream_calls,
+    }
+
+
+def compare(old: dict, new: dict) -> dict:
+    """Per-endpoint latency and throughput of two reports, with the change in percent."""
+    def delta(a, b):
+        return round(100 * (b - a) / a, 1) if a else None
+
+    result = {"old": old["meta"].get("commit"), "new": new["meta"].get("commit"), "endpoints": {}}
+    old_endpoints = {"total": old["total"], **old["endpoints"]}
+    new_endpoints = {"total": new["total"], **new["endpoints"]}
+    for name in sorted(old_endpoints.keys() & new_endpoints.keys()):
+        a, b = old_endpoints[name], new_endpoints[name]
+        result["endpoints"][name] = {
+            key: {"old": a[key], "new": b[key], "change_pct": delta(a[key], b[key])}
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate")
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run a workload and save a JSON report")
+    run_parser.add_argument("--workload", choices=sorted(WORKLOADS), default="morning_peak")
+    run_parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users")
+    run_parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before measuring")
+    run_parser.add_argument("--latency", nargs="*", metavar="UPSTREAM=MS", help="Override fake upstream latency")
+    run_parser.add_argument("--mongo", choices=["auto", "mongod", "mongomock", "url"], default="auto")
+    run_parser.add_argument("--seed-users", type=int, default=20)
+    run_parser.add_argument("--seed-posts", type=int, default=50)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--timeout", type=float, default=60)
+    run_parser.add_argument("--keep-limits", action="store_true",
+                            help="Keep per-client rate limits and upstream quotas on during the run")
+    run_parser.add_argument("--output", help="Report path (default: benchmarks/results/<workload>-<commit>-<time>.json)")
+
+    compare_parser = commands.add_parser("compare", help="Compare two saved reports")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+
+    serve_parser = commands.add_parser("serve-app", help=argparse.SUPPRESS)
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("--mongomock", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "serve-app":
+        serve_app(args.port, args.mongomock)
+    elif args.command == "compare":
+        print(json.dumps(compare(json.loads(Path(args.old).read_text()), json.loads(Path(args.new).read_text())), indent=2))
+    else:
+        report = asyncio.run(run(args))
+        if args.output:
+            output = Path(args.output)
+        else:
+            stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+            output = RESULTS_DIR / f"{args.workload}-{report['meta']['commit'] or 'nocommit'}-{stamp}.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"Saved {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Login storm benchmark.
+
+Fires concurrent bcrypt logins at a small app while a probe keeps calling an unrelated
+endpoint, and reports login throughput and the probe's latency percentiles. Compare
+`--mode inline` (hashing on the event loop) with `--mode pool` (app.services.hashing).
+
+    python -m benchmarks.login_storm --logins 200 --concurrency 50 --mode pool
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.services.hashing import HashingPool, check_password, hash_password
+from benchmarks.stats import percentile
+
+
+def build_app(mode: str, pool: HashingPool, hashed: str):
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login():
+        if mode == "inline":
+            ok = check_password("s3cret-password", hashed)
+        else:
+            ok = await pool.run(check_password, "s3cret-password", hashed)
+        return {"ok": ok}
+
+    @app.get("/ping")
+    async def ping():
+        return {"pong": True}
+
+    return app
+
+
+async def run(args):
+    pool = HashingPool(kind=args.pool, workers=args.workers, max_pending=args.logins)
+    app = build_app(args.mode, pool, hash_password("s3cret-password"))
+    transport = httpx.ASGITransport(app=app)
+    probe_latencies = []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/ping")
+                probe_latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(args.probe_interval)
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one_login():
+            async with semaphore:
+                await client.post("/login")
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*[one_login() for _ in range(args.logins)])
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    pool.shutdown()
+    return {
+        "mode": args.mode,
+        "pool": args.pool,
+        "workers": args.workers,
+        "logins": args.logins,
+        "concurrency": args.concurrency,
+        "logins_per_second": round(args.logins / elapsed, 2),
+        "probe_requests": len(probe_latencies),
+        "probe_p50_ms": round(percentile(probe_latencies, 50), 2),
+        "probe_p99_ms": round(percentile(probe_latencies, 99), 2),
+        "probe_max_ms": round(max(probe_latencies, default=0.0), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["inline", "pool"], default="pool")
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--probe-interval", type=float, default=0.005)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Search benchmark.
+
+Builds the in-process inverted index (app.services.search.InvertedIndex) over growing
+synthetic Hindi/English corpora and reports build rate and query latency percentiles.
+
+    python -m benchmarks.search_bench --sizes 10000 100000 1000000 --queries 200
+"""
+import argparse
+import json
+import random
+import time
+
+from app.services.search import InvertedIndex
+from benchmarks.stats import percentile
+
+VOCABULARY = (
+    "wheat rice maize cotton sugarcane tomato potato onion mustard soybean whitefly aphid rust blight "
+    "fertilizer urea dap irrigation drip sowing harvest price mandi rain monsoon pesticide neem seed "
+    "गेहूं धान मक्का कपास गन्ना टमाटर आलू प्याज सरसों खाद सिंचाई बुवाई कटाई बारिश कीट बीज मंडी दाम"
+).split()
+
+
+def synthetic_post(rng: random.Random):
+    return " ".join(rng.choices(VOCABULARY, k=rng.randint(12, 60)))
+
+
+def run_size(size: int, queries: int, rng: random.Random):
+    index = InvertedIndex()
+    started = time.perf_counter()
+    for doc_id in range(size):
+        index.add(doc_id, synthetic_post(rng))
+    build_seconds = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(queries):
+        query = " ".join(rng.choices(VOCABULARY, k=rng.randint(1, 3)))
+        started = time.perf_counter()
+        index.search(query, limit=20)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "documents": size,
+        "build_docs_per_second": round(size / build_seconds, 1),
+        "query_p50_ms": round(percentile(latencies, 50), 3),
+        "query_p95_ms": round(percentile(latencies, 95), 3),
+        "query_p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    print(json.dumps([run_size(size, args.queries, rng) for size in args.sizes], indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
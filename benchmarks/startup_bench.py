@@ -0,0 +1,68 @@
+"""
+Startup benchmark.
+
+Measures, in fresh interpreters, how long `import app.main` takes, how long the app's
+lifespan startup takes, and the time until the first request to `/` is answered. No
+credentials or database are needed, because the app creates its clients lazily.
+
+    python -m benchmarks.startup_bench --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+import asyncio, httpx
+
+async def first_request():
+    # ASGITransport does not send lifespan events, so run the startup as uvicorn would.
+    application = app.main.create_app()
+    async with application.router.lifespan_context(application):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/")
+            assert response.status_code == 200
+        return ready, time.perf_counter()
+
+ready, done = asyncio.run(first_request())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "first_request_ms": (done - started) * 1000,
+}))
+"""
+
+
+def run_once(env):
+    output = subprocess.run([sys.executable, "-c", PROBE], env=env, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    # Strip credentials to show the app imports and serves without them.
+    env = {k: v for k, v in os.environ.items() if not k.endswith("_API_KEY") and k != "MONGO_URL"}
+    env["PYTHONPATH"] = os.getcwd()
+    samples = [run_once(env) for _ in range(args.runs)]
+    print(json.dumps({
+        "runs": args.runs,
+        "import_ms_median": round(statistics.median(s["import_ms"] for s in samples), 1),
+        "startup_ms_median": round(statistics.median(s["startup_ms"] for s in samples), 1),
+        "first_request_ms_median": round(statistics.median(s["first_request_ms"] for s in samples), 1),
+        "samples": samples,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()